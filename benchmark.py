@@ -0,0 +1,345 @@
+"""
+Benchmark harness for the masking pipeline.
+
+Runs the pipeline over a corpus (by default ``Aadhars_input``), reports
+throughput, per-card latency percentiles, peak RSS, the time split per stage
+and the Tesseract call count, and checks the masked regions against the
+reference outputs in ``Aadhars_output``. Results are written as JSON so two
+runs can be diffed, and ``--baseline`` turns the comparison into a
+regression gate.
+
+Usage:
+    python benchmark.py --repeat 3 --workers 4 --output bench.json
+    python benchmark.py --baseline bench.json --max-slowdown 0.10
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import cpu_count, freeze_support
+
+import numpy as np
+
+STAGES = ('read', 'decode', 'deskew', 'ocr', 'yolo', 'mask', 'encode')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unknown."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def _init_bench(overrides, worker_options=None, unprocessed_dir=None):
+    """Pool initializer applying the config under test.
+
+    The cards without a detected number are copied, unmasked, to
+    ``unprocessed_dir``, which the caller removes after the run.
+    """
+    import brut_new
+    import metrics
+    metrics.configure(True)
+    brut_new.config.update(overrides)
+    # Repeats must run the pipeline, not the result cache
+    brut_new.config['result_cache'] = False
+    options = {'ocr_threads': 1}
+    options.update(worker_options or {})
+    options['unprocessed_dir'] = unprocessed_dir
+    brut_new.init_worker(None, options)
+
+
+def _bench_task(input_path, output_path):
+    """Masks one card and reports its latency."""
+    from brut_new import redact_file
+
+    start = time.perf_counter()
+    try:
+        status, error = redact_file(input_path, output_path), None
+    except Exception as e:
+        status, error = 'failed', str(e)
+    return {
+        'input': input_path,
+        'output': output_path,
+        'status': status,
+        'error': error,
+        'latency': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def _bench_chunk(tasks, threads):
+    """Worker task, masks a chunk of cards concurrently in threads.
+
+    The metrics are totals of the process, the deltas of cards running in
+    parallel threads would mix, so they are taken once per chunk: a worker
+    runs one chunk at a time.
+
+    Returns:
+        tuple: (per card results, metrics snapshot of the chunk)
+    """
+    import metrics
+    from executor_plan import run_in_threads
+
+    metrics.reset()
+    results = run_in_threads(_bench_task, tasks, threads)
+    return results, metrics.snapshot(reset=True)
+
+
+def mask_region(original, masked, color=(0, 0, 0), tolerance=60):
+    """Pixels that were painted with the mask color.
+
+    Args:
+        original (numpy.ndarray): Input image.
+        masked (numpy.ndarray): Masked image of the same size.
+        color (tuple): Mask color in BGR.
+        tolerance (int): Allowed difference, JPEG outputs are noisy.
+
+    Returns:
+        numpy.ndarray: Boolean mask.
+    """
+    changed = np.abs(original.astype(np.int16) - masked.astype(np.int16)).max(axis=2) > tolerance
+    painted = np.abs(masked.astype(np.int16) - np.array(color, np.int16)).max(axis=2) <= tolerance
+    return changed & painted
+
+
+def compare_to_reference(input_path, output_path, reference_dir):
+    """Compare our masked regions with the reference output of a card.
+
+    Args:
+        input_path (str): Input image.
+        output_path (str): Our masked output.
+        reference_dir (str): Folder with ``<name>_masked<ext>`` references.
+
+    Returns:
+        dict | None: ``iou`` and ``recall`` of the masked pixels, or None
+        when there is no comparable reference.
+    """
+    from image_io import read_image
+
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    reference_path = os.path.join(reference_dir, f"{name}_masked{ext}")
+    if ext.lower() == '.pdf' or not os.path.isfile(reference_path):
+        return None
+    original = read_image(input_path)
+    reference = read_image(reference_path)
+    ours = read_image(output_path) if os.path.isfile(output_path) else original
+    if reference.shape != original.shape or ours.shape != original.shape:
+        return {'iou': None, 'recall': None, 'note': 'shape mismatch'}
+
+    expected = mask_region(original, reference)
+    found = mask_region(original, ours)
+    union = np.logical_or(expected, found).sum()
+    overlap = np.logical_and(expected, found).sum()
+    return {
+        'iou': float(overlap / union) if union else 1.0,
+        'recall': float(overlap / expected.sum()) if expected.sum() else 1.0
+    }
+
+
+def run_benchmark(corpus, reference_dir=None, repeat=1, workers=None,
+                  overrides=None, worker_options=None):
+    """Run the pipeline over a corpus and collect the measurements.
+
+    Args:
+        corpus (str): Folder with input images/PDFs.
+        reference_dir (str, optional): Folder with reference outputs.
+        repeat (int): Number of passes over the corpus.
+        workers (int, optional): Worker processes, defaults to the CPU count.
+        overrides (dict, optional): Config overrides under test.
+        worker_options (dict, optional): Thread settings of the workers,
+            see ``ExecutionPlan.worker_options``.
+
+    Returns:
+        dict: Benchmark report.
+    """
+    from redact import collect_inputs, output_path_for
+
+    overrides = overrides or {}
+    files = [path for path, _ in collect_inputs(corpus)]
+    workers = max(1, min(workers or cpu_count(), len(files) or 1))
+    out_dir = tempfile.mkdtemp(prefix='aadhaar_bench_')
+    unprocessed_dir = tempfile.mkdtemp(prefix='aadhaar_bench_unprocessed_')
+
+    results = []
+    snapshots = []
+    start = time.perf_counter()
+    try:
+        io_threads = (worker_options or {}).get('io_threads') or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_bench,
+                                 initargs=(overrides, worker_options,
+                                           unprocessed_dir)) as executor:
+            tasks = []
+            for run in range(repeat):
+                run_dir = os.path.join(out_dir, str(run))
+                os.makedirs(run_dir, exist_ok=True)
+                tasks.extend((path, output_path_for(path, '', run_dir)) for path in files)
+            # Thread mode, each process task is a chunk run in threads
+            futures = [executor.submit(_bench_chunk, tasks[i:i + io_threads], io_threads)
+                       for i in range(0, len(tasks), io_threads)]
+            for future in as_completed(futures):
+                chunk_results, snapshot = future.result()
+                results.extend(chunk_results)
+                snapshots.append(snapshot)
+        wall = time.perf_counter() - start
+
+        accuracy = []
+        if reference_dir:
+            for result in results:
+                if result['output'].startswith(os.path.join(out_dir, '0')):
+                    score = compare_to_reference(
+                        result['input'], result['output'], reference_dir)
+                    if score is not None:
+                        accuracy.append(dict(score, input=result['input']))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        shutil.rmtree(unprocessed_dir, ignore_errors=True)
+
+    return build_report(results, accuracy, wall, workers, repeat, overrides, snapshots)
+
+
+def build_report(results, accuracy, wall, workers, repeat, overrides, snapshots):
+    """Aggregate the per-card results and the per-chunk metrics into the
+    JSON report."""
+    latencies = np.array([r['latency'] for r in results]) if results else np.zeros(1)
+    stages = {}
+    calls = 0
+    for snapshot in snapshots:
+        for name, seconds in snapshot['timings'].items():
+            stages[name] = stages.get(name, 0.0) + seconds
+        calls += snapshot['counters'].get('tesseract_calls', 0)
+    stage_total = sum(stages.get(name, 0.0) for name in STAGES) or 1.0
+    scored = [a for a in accuracy if a.get('iou') is not None]
+    rss = [r['peak_rss_mb'] for r in results if r['peak_rss_mb'] is not None]
+
+    return {
+        'config': overrides,
+        'workers': workers,
+        'repeat': repeat,
+        'cards': len(results),
+        'failed': sum(r['status'] == 'failed' for r in results),
+        'wall_seconds': wall,
+        'files_per_sec': len(results) / wall if wall else 0.0,
+        'latency': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99))
+        },
+        'peak_rss_mb': max(rss) if rss else None,
+        'stages': {
+            name: {'seconds': stages.get(name, 0.0),
+                   'share': stages.get(name, 0.0) / stage_total}
+            for name in STAGES
+        },
+        'tesseract_calls': calls,
+        'tesseract_calls_per_card': calls / len(results) if results else 0.0,
+        'accuracy': {
+            'cards': len(scored),
+            'mean_iou': float(np.mean([a['iou'] for a in scored])) if scored else None,
+            'mean_recall': float(np.mean([a['recall'] for a in scored])) if scored else None,
+            'per_card': accuracy
+        },
+        'per_card': [{'input': r['input'], 'status': r['status'],
+                      'latency': r['latency'], 'error': r['error']}
+                     for r in results]
+    }
+
+
+def check_regression(report, baseline, max_slowdown=0.10, max_accuracy_drop=0.02):
+    """Compare a report against a baseline report.
+
+    Args:
+        report (dict): Current report.
+        baseline (dict): Previous report.
+        max_slowdown (float): Allowed relative loss of throughput and
+            relative growth of p95 latency.
+        max_accuracy_drop (float): Allowed absolute drop of mean IoU/recall.
+
+    Returns:
+        list: Human readable regressions, empty when the gate passes.
+    """
+    problems = []
+    if report['files_per_sec'] < baseline['files_per_sec'] * (1 - max_slowdown):
+        problems.append(f"throughput {report['files_per_sec']:.3f} files/sec < "
+                        f"baseline {baseline['files_per_sec']:.3f}")
+    if report['latency']['p95'] > baseline['latency']['p95'] * (1 + max_slowdown):
+        problems.append(f"p95 latency {report['latency']['p95']:.3f}s > "
+                        f"baseline {baseline['latency']['p95']:.3f}s")
+    for key in ('mean_iou', 'mean_recall'):
+        now, before = report['accuracy'][key], baseline['accuracy'][key]
+        if now is not None and before is not None and now < before - max_accuracy_drop:
+            problems.append(f"{key} {now:.3f} < baseline {before:.3f}")
+    if report['failed'] > baseline['failed']:
+        problems.append(f"{report['failed']} failed cards, baseline {baseline['failed']}")
+    return problems
+
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark the masking pipeline.")
+    parser.add_argument('--corpus', default=os.path.join(here, 'Aadhars_input'))
+    parser.add_argument('--reference', default=os.path.join(here, 'Aadhars_output'),
+                        help="Reference outputs for the accuracy check ('' to skip)")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--config-json', default=None,
+                        help="JSON file with config overrides to benchmark")
+    parser.add_argument('--output', default=None, help="Write the report to this file")
+    parser.add_argument('--baseline', default=None, help="Previous report to gate against")
+    parser.add_argument('--max-slowdown', type=float, default=0.10)
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.02)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+    overrides = {}
+    if args.config_json:
+        with open(args.config_json) as f:
+            overrides = json.load(f)
+
+    report = run_benchmark(args.corpus, args.reference or None, args.repeat,
+                           args.workers, overrides)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    print(f"{report['files_per_sec']:.2f} files/sec, p50 {report['latency']['p50']:.2f}s, "
+          f"p95 {report['latency']['p95']:.2f}s, "
+          f"{report['tesseract_calls_per_card']:.1f} Tesseract calls/card, "
+          f"mean IoU {report['accuracy']['mean_iou']}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = check_regression(report, baseline, args.max_slowdown,
+                                    args.max_accuracy_drop)
+        for problem in problems:
+            print(f"REGRESSION: {problem}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
@@ -2,192 +2,539 @@
 This script performs Aadhar masking using OpenCV and pytesseract-OCR.
 """
 
+import time
+
+_IMPORT_START = time.perf_counter()
+
 import datetime
 import sys
 import os
-import math
 import shutil
-import uuid
+import tempfile
+import threading
 import multiprocessing
-import tkinter as tk
-from tkinter import filedialog, messagebox
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from multiprocessing import cpu_count
-import cv2
-from scipy import ndimage
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from PIL import Image
-from pdf2image import convert_from_path
-from yolo_model import process_image
+from yolo_model import detect, number_detections, configure_detector
+from yolo_server import connect_worker, YoloServer
 from temp_aadhar import AadhaarCard
-from registry import update_processed_count, get_processed_count
-
-documents_path = os.path.join(os.environ["USERPROFILE"], "Documents")
+from ocr_backend import get_backend
+from geometry import Frame, fill_polygons
+from preprocess import normalization_scale
+from tiling import tiled_polygons
+from image_io import (read_bytes, decode_image, encode_image, write_image,
+                      pil_to_bgr, bgr_to_pil)
+from result_cache import ResultCache
+from executor_plan import limit_threads
+from profiles import apply_profile
+import metrics
+
+# Seconds spent on each startup step of this process, see startup_report()
+STARTUP_TIMES = {'imports': time.perf_counter() - _IMPORT_START}
+
+documents_path = os.path.join(
+    os.environ.get("USERPROFILE", os.path.expanduser("~")), "Documents")
 UNPROCESSED_FOLDER = os.path.join(documents_path, "unprocessed_files")
 
-os.makedirs(UNPROCESSED_FOLDER, exist_ok=True)
-
 MAX_AADHAARS = 600
 
 
 config = {
-    'orient': True,
-    'skew': False,
-    'crop': True,
+    'orient': True,  # Detect the upright orientation with Tesseract OSD
+    'early_exit': True,  # Stop rotating once a valid Aadhaar is masked
+    'skew': False,  # Not implemented, ignored
+    'crop': True,  # Not implemented, ignored
     'contrast': True,
+    'require_checksum': True,  # Only mask Verhoeff-valid 12 digit numbers
     'psm': [3, 4, 6],
+    'contrast_modes': [0, 1],  # 0 truncated, 1 Otsu binarized
+    'rotations': 4,  # Quarter turns searched, most likely upright first
+    'yolo_fallback': True,  # Also mask the YOLO boxes after the page search
     'mask_color': (0, 0, 0),  # Mask color in BGR
-    'brut_psm': [6]
+    'brut_psm': [6],
+    'ocr_backend': 'auto',  # 'auto', 'tesserocr' or 'pytesseract'
+    'ocr_lang': 'eng',
+    'tesseract_cmd': None,  # Falls back to TESSERACT_PATH, then the PATH
+    'tessdata': None,
+    'yolo_server': True,  # Share one batching YOLO model between workers
+    'yolo_batch': 16,
+    'yolo_max_wait': 0.02,  # Seconds a request waits for a batch to fill
+    'yolo_timeout': 60.0,  # Seconds a worker waits for a reply of the loaded server
+    'yolo_local_fallback': False,  # On a timeout load a model per worker, else fail the file
+    'detector_backend': 'auto',  # 'auto', 'torch', 'onnx' or 'openvino'
+    'detector_int8': False,  # Use the INT8 export (python detector.py export --int8)
+    'normalize': True,  # Resize pages so characters are text_height pixels
+    'text_height': 24,
+    'min_scale': 0.25,
+    'max_scale': 2.0,
+    'tiling': True,  # Search very large images as overlapping tiles
+    'tile_threshold_mp': 16,  # Megapixels above which an image is tiled
+    'tile_size': 2048,
+    'tile_overlap': 512,  # Wider than an Aadhaar number on such scans
+    'tile_workers': 2,  # Tiles searched in parallel
+    'tile_memory_mb': 512,  # Budget for the tile working sets of a worker
+    'cascade': True,  # OCR the detected number regions before the page
+    'cascade_min_conf': 0.5,  # Lower detector confidence falls back to the page
+    'roi_pad': 0.25,  # Crop padding, fraction of the box height
+    'roi_height': 96,  # Crops are upscaled to this height before OCR
+    'roi_psm': [7, 6],
+    'pdf_text_layer': True,  # Redact born-digital PDFs through PyMuPDF
+    'pdf_dpi': 120,
+    'pdf_window': 4,  # Pages rasterized at a time
+    'pdf_page_workers': 4,  # Threads masking the pages of one PDF
+    'result_cache': True,  # Skip the pipeline for inputs seen before
+    'cache_dir': None,  # Defaults to ~/.cache/aadhaar_redaction
+    'cache_max_mb': 512
 }
 
-# Initialize the AadhaarCard processor
-aadhaar_processor = AadhaarCard(config)
+# Settings that change how a result is produced (threads, batching, cache),
+# not the result, left out of the result cache key
+RUNTIME_KEYS = ('yolo_server', 'yolo_batch', 'yolo_max_wait', 'yolo_timeout',
+                'tile_workers', 'pdf_window', 'pdf_page_workers', 'result_cache',
+                'cache_dir', 'cache_max_mb')
+
+# AadhaarCard processors keep per-image state, so each thread gets its own
+_local = threading.local()
+
+
+def get_processor():
+    """Returns the AadhaarCard processor of the current thread."""
+    processor = getattr(_local, 'processor', None)
+    if processor is None:
+        processor = _local.processor = AadhaarCard(config)
+    return processor
 
 
-def rotate_only(path, degrees):
+def rotate_only(img, degrees):
     """rotates the images with 90 degrees on to the anticlockwise location"""
-    img = cv2.imread(str(path))
-    angle_in_degrees = degrees
-    rotated = ndimage.rotate(img, angle_in_degrees)
-    cv2.imwrite(path, rotated)
-    return rotated
+    return Frame(img).rotate(degrees).img
 
 
 def rotate_img(img, degrees):
     """rotates the images for the calculated median angle"""
-    angle_in_degrees = degrees
-    rotated = ndimage.rotate(img, angle_in_degrees)
-    return rotated
+    return Frame(img).rotate(degrees).img
 
 
-def rotate(path):
+def rotate(img):
     """rotates the images based on the median angle calculated"""
-    # GrayScale Conversion for the Canny Algorithm
-    img = cv2.imread(str(path))
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    # self.display(img_gray)
-    # Canny Algorithm for edge detection was developed by John F. Canny not
-    # Kennedy!! :)
-    img_edges = cv2.Canny(img_gray, 100, 100, apertureSize=3)
-    # self.display(img_edges)
-    # Using Houghlines to detect lines
-    lines = cv2.HoughLinesP(
-        img_edges,
-        1,
-        math.pi / 180.0,
-        100,
-        minLineLength=100,
-        maxLineGap=5)
-    img_copy = img.copy()
-    for x in range(0, len(lines)):
-        for x1, y1, x2, y2 in lines[x]:
-            cv2.line(img_copy, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-    angles = []
-    for x1, y1, x2, y2 in lines[0]:
-        angle = math.degrees(math.atan2(y2 - y1, x2 - x1))
-        angles.append(angle)
-
-    # Getting the median angle
-    median_angle = np.median(angles)
-    if (median_angle >= 45 or median_angle <= -45):
-        return img
-    print(f"Correcting angle by {median_angle} degrees")
-    return rotate_img(img, median_angle)
-
-
-def multi_page_pdf(arg, masked_filename):
-    """handles the pdfs with multiple images"""
-    os.makedirs('temp_images', exist_ok=True)
-    list1 = []
-    list2 = []
-    for i, img in enumerate(arg):
-        temp_file_path = f"temp_images/page_{uuid.uuid4().hex}_{i + 1}.png"
-        img.save(temp_file_path, "PNG")
-        masked_name_path = f"temp_images/masked_page_{
-            uuid.uuid4().hex}_{
-            i + 1}.jpg"
-        list1.append((temp_file_path, masked_name_path))
-
-    # def process_page(page_args):
-    #     temp_path, masked_path = page_args
-    #     print(temp_path)
-    #     print(masked_path)
-    #     result = process_aadhaar(temp_path, masked_path)
-    #     list2.append(result)
-
-    # threads = []
-    # for page_args in list1:
-    #     thread = Thread(target=process_page, args=(page_args,))
-    #     threads.append(thread)
-    #     thread.start()
-
-    # for thread in threads:
-    #     thread.join()
-
-    for i in range(len(arg)):
-        result = process_aadhaar(*list1[i])
-        list2.append(result)
-
-    first_image = Image.open(list2[0])
-    image_objects = [Image.open(img) for img in list2[1:]]
-    first_image.save(
-        masked_filename,
-        format="PDF",
-        save_all=True,
-        append_images=image_objects)
+    return Frame(img).deskew().img
+
+
+def multi_page_pdf(filepath, masked_filename, page_count, boxes=None):
+    """handles the pdfs with multiple images
+
+    Pages are rasterized in windows of ``config['pdf_window']`` pages while
+    the previous window is being masked by ``config['pdf_page_workers']``
+    threads. Masked pages are appended to the output PDF in page order, so
+    at most two windows are held in memory.
+
+    Args:
+        boxes (list, optional): Receives a ``{'page', 'polygons'}`` dict per
+            page with mask polygons, in pixels at ``config['pdf_dpi']``.
+
+    Returns:
+        bool: True if an Aadhaar number was detected on any page.
+    """
+    from pdf2image import convert_from_path
+
+    def rasterize(first):
+        last = min(first + config['pdf_window'] - 1, page_count)
+        with metrics.span('decode'):
+            return convert_from_path(
+                filepath, dpi=config['pdf_dpi'], first_page=first, last_page=last)
+
+    def mask_page(page):
+        with metrics.span('decode'):
+            img = pil_to_bgr(page)
+        polygons, detected = find_mask_polygons(img)
+        with metrics.span('mask'):
+            masked = fill_polygons(img, polygons, config['mask_color'], copy=False)
+        return bgr_to_pil(masked), polygons, detected
+
+    starts = list(range(1, page_count + 1, config['pdf_window']))
+    written = False
+    aadhaar_detected = False
+    with ThreadPoolExecutor(max_workers=1) as raster, \
+            ThreadPoolExecutor(max_workers=config['pdf_page_workers']) as pages_pool:
+        pending = raster.submit(rasterize, starts[0])
+        for i in range(len(starts)):
+            pages = pending.result()
+            if i + 1 < len(starts):
+                pending = raster.submit(rasterize, starts[i + 1])
+            for j, (masked_page, polygons, detected) in enumerate(
+                    pages_pool.map(mask_page, pages)):
+                with metrics.span('encode'):
+                    masked_page.save(masked_filename, format="PDF", append=written)
+                written = True
+                if boxes is not None and polygons:
+                    boxes.append({'page': starts[i] + j, 'polygons': polygons})
+                aadhaar_detected = aadhaar_detected or detected
+            del pages
+    return aadhaar_detected
+
+
+def orientation_order(img):
+    """Returns the anticlockwise quarter turns to try, most likely upright first."""
+    turns = [0, 1, 2, 3]
+    if config['orient']:
+        upright = get_processor().detect_orientation(img)
+        if upright:
+            turns.remove(upright)
+            turns.insert(0, upright)
+            metrics.incr('orientation_detected')
+    return turns
+
+
+def cascade_polygons(img, detections):
+    """Confirms the detected number regions with OCR on small crops.
+
+    Every AADHAR_NUMBER detection is cropped with padding, turned upright
+    and read by ``AadhaarCard.read_region``. The page OCR can be skipped
+    only when every detection is confident and holds a checksum valid
+    number.
+
+    Args:
+        img (numpy.ndarray): Decoded BGR image.
+        detections (list): Output of ``number_detections``.
+
+    Returns:
+        list | None: Polygons of the detected boxes, None to fall back to
+        the full page search.
+    """
+    if not detections or any(conf < config['cascade_min_conf']
+                             for _, conf in detections):
+        return None
+    aadhaar_processor = get_processor()
+    height, width = img.shape[:2]
+    boxes = []
+    for (x1, y1, x2, y2), _ in detections:
+        pad = int(config['roi_pad'] * min(x2 - x1, y2 - y1))
+        crop = Frame(img[max(0, y1 - pad):min(height, y2 + pad),
+                         max(0, x1 - pad):min(width, x2 + pad)])
+        if crop.img.size == 0:
+            return None
+        # A number strip is wider than tall when the card is upright
+        turns = (0, 2) if x2 - x1 >= y2 - y1 else (1, 3)
+        if not any(aadhaar_processor.read_region(crop.quarter_turn(turn).img)
+                   for turn in turns):
+            return None
+        boxes.append((x1, y1, x2 - x1, y2 - y1))
+    return Frame(img).to_source(boxes)
+
+
+def find_mask_polygons(img):
+    """Finds the regions to mask in a decoded image.
+
+    Images above ``config['tile_threshold_mp']`` megapixels are searched as
+    overlapping tiles within ``config['tile_memory_mb']``, smaller ones in
+    one piece by ``find_region_polygons``.
+
+    Args:
+        img (numpy.ndarray): Decoded BGR image.
+
+    Returns:
+        tuple: (list of polygons in source coordinates, True if an Aadhaar
+        number was detected)
+    """
+    if config['tiling'] and img.shape[0] * img.shape[1] > config['tile_threshold_mp'] * 1e6:
+        with metrics.span('tiling'):
+            return tiled_polygons(img, find_region_polygons, config['tile_size'],
+                                  config['tile_overlap'], config['tile_workers'],
+                                  config['tile_memory_mb'])
+    return find_region_polygons(img)
+
+
+def find_region_polygons(img):
+    """Finds the regions to mask in a decoded image or tile.
+
+    The likely upright orientation is tried first and, with
+    ``config['early_exit']``, the search stops as soon as a checksum valid
+    Aadhaar number has been found. Every orientation is a quarter turn and a
+    deskew of the source image, the mask boxes found on it are mapped back
+    onto the source. With ``config['normalize']`` the page is first resized
+    so its characters are ``config['text_height']`` pixels high. At most
+    ``config['rotations']`` turns are searched, each with the
+    ``config['contrast_modes']``, and with ``config['yolo_fallback']`` the
+    YOLO detections are added last.
+
+    With ``config['cascade']`` the detector runs first and the page search
+    only runs when OCR on the detected regions could not confirm them.
+
+    Args:
+        img (numpy.ndarray): Decoded BGR image.
+
+    Returns:
+        tuple: (list of polygons in source coordinates, True if an Aadhaar
+        number was detected)
+    """
+    detections = None
+    if config['cascade']:
+        with metrics.span('yolo'):
+            detections = number_detections(detect(img))
+        polygons = cascade_polygons(img, detections)
+        if polygons is not None:
+            metrics.incr('cascade_hits')
+            return polygons, True
+        metrics.incr('cascade_fallbacks')
+
+    aadhaar_processor = get_processor()
+    aadhaar_detected = False
+    polygons = []
+
+    source = Frame(img)
+    if config['normalize']:
+        # The frame matrix keeps the factor, boxes map back to full size
+        with metrics.span('preprocess'):
+            source = source.scale(normalization_scale(
+                img, config['text_height'], config['min_scale'], config['max_scale']))
+
+    for turn in orientation_order(source.img)[:config['rotations']]:
+        metrics.incr('rotations_tried')
+        with metrics.span('deskew'):
+            frame = source.quarter_turn(turn).deskew()
+
+        valid_found = False
+        for contrast_mode in config['contrast_modes']:
+            extracted_aadhaars = aadhaar_processor.extract(
+                frame.img, contrast_mode)
+            if extracted_aadhaars:
+                aadhaar_detected = True  # Aadhaar found
+                boxes = aadhaar_processor.mask_boxes(
+                    frame.img, extracted_aadhaars, aadhaar_processor.cv_img)
+                polygons.extend(frame.to_source(boxes))
+                validated = sum(
+                    aadhaar_processor.validate(uid) for uid in extracted_aadhaars)
+                metrics.incr('uids_found', len(extracted_aadhaars))
+                metrics.incr('uids_validated', validated)
+                valid_found = valid_found or validated > 0
+
+        if valid_found and config['early_exit']:
+            metrics.incr('early_exits')
+            break
+
+    if not config['yolo_fallback']:
+        return polygons, aadhaar_detected
+    if detections is None:
+        with metrics.span('yolo'):
+            detections = number_detections(detect(img))
+    yolo_boxes = [box for box, _ in detections]
+    polygons.extend(Frame(img).to_source(
+        [(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in yolo_boxes]))
+    return polygons, aadhaar_detected or bool(yolo_boxes)
+
+
+def process_aadhaar_image(img):
+    """Masks the Aadhaar numbers in a decoded image.
+
+    Args:
+        img (numpy.ndarray): Decoded BGR image.
+
+    Returns:
+        tuple: (masked image, True if an Aadhaar number was detected)
+    """
+    polygons, aadhaar_detected = find_mask_polygons(img)
+    with metrics.span('mask'):
+        masked = fill_polygons(img, polygons, config['mask_color'])
+    return masked, aadhaar_detected
+
+
+def get_result_cache():
+    """Returns the result cache of this process, or None when disabled."""
+    if not config['result_cache']:
+        return None
+    cache = getattr(_local, 'result_cache', None)
+    if cache is None:
+        root = config['cache_dir'] or os.path.join(
+            os.path.expanduser("~"), ".cache", "aadhaar_redaction")
+        cache = _local.result_cache = ResultCache(
+            root, config['cache_max_mb'] * 1024 * 1024)
+    return cache
+
+
+def copy_to_unprocessed(filepath):
+    """Copies a file without an Aadhaar number to ``UNPROCESSED_FOLDER``."""
+    os.makedirs(UNPROCESSED_FOLDER, exist_ok=True)
+    # Copied under a temporary name, a shared folder never shows a partial file
+    fd, tmp = tempfile.mkstemp(dir=UNPROCESSED_FOLDER, prefix='.', suffix='.tmp')
+    os.close(fd)
+    shutil.copy2(filepath, tmp)
+    os.replace(tmp, os.path.join(UNPROCESSED_FOLDER, os.path.basename(filepath)))
+    print(f"No Aadhaar detected. Copied {filepath} to {UNPROCESSED_FOLDER}.")
+
+
+def apply_cached(entry, data, savename):
+    """Reproduces a cached result without running the pipeline.
+
+    Args:
+        entry (dict): Entry from ``ResultCache.get``.
+        data (bytes): Raw input file.
+        savename (str): Output path.
+
+    Returns:
+        bool: False when the entry cannot be applied.
+    """
+    if entry['status'] != 'masked':
+        return True
+    if entry['artifact']:
+        try:
+            shutil.copyfile(entry['artifact'], savename)
+        except FileNotFoundError:  # Evicted by another process meanwhile
+            return False
+        return True
+    if entry['polygons'] and not savename.lower().endswith('.pdf'):
+        polygons = [np.array(p, dtype=np.int32) for p in entry['polygons']]
+        write_image(fill_polygons(decode_image(data), polygons,
+                                  config['mask_color']), savename)
+        return True
+    return False
+
+
+def use_pdf_text(savename):
+    """True when a PDF can take the text-layer route, which writes PDF only.
+
+    PyMuPDF is imported here, on the first PDF, rather than at startup.
+    """
+    if not (config['pdf_text_layer'] and savename.lower().endswith('.pdf')):
+        return False
+    import pdf_text
+    return pdf_text.available()
+
+
+def redact_file(filepath, savename):
+    """Masks one image or PDF file.
+
+    The input is read and decoded once and the result is encoded and
+    written once, everything in between stays in memory. Files without an
+    Aadhaar number are copied to ``UNPROCESSED_FOLDER``.
+
+    Args:
+        filepath (str): Input image or PDF.
+        savename (str): Output path, the extension selects the format.
+
+    Returns:
+        str: 'masked' or 'unprocessed'.
+    """
+    with metrics.span('read'):
+        data = read_bytes(filepath)
+    cache = get_result_cache()
+    if cache is not None:
+        key = cache.key(data, config, os.path.splitext(savename)[1], RUNTIME_KEYS)
+        entry = cache.get(key)
+        if entry is not None and apply_cached(entry, data, savename):
+            metrics.incr('cache_hits')
+            if entry['status'] != 'masked':
+                copy_to_unprocessed(filepath)
+            return entry['status']
+        metrics.incr('cache_misses')
+
+    polygons = []
+    if filepath.lower().endswith('.pdf') and use_pdf_text(savename):
+        import pdf_text
+        aadhaar_detected, _, _ = pdf_text.redact_pdf(
+            find_mask_polygons, data=data, savename=savename,
+            dpi=config['pdf_dpi'], color=config['mask_color'],
+            workers=config['pdf_page_workers'], window=config['pdf_window'])
+        masked = None
+    elif filepath.lower().endswith('.pdf'):
+        from pdf2image import convert_from_path, pdfinfo_from_path
+        page_count = pdfinfo_from_path(filepath)['Pages']
+        if page_count > 1:
+            aadhaar_detected = multi_page_pdf(filepath, savename, page_count)
+            masked = None
+        else:
+            with metrics.span('decode'):
+                pdf_to_image = convert_from_path(
+                    filepath, dpi=config['pdf_dpi'], first_page=1, last_page=1)
+                img = pil_to_bgr(pdf_to_image[0])
+            masked, aadhaar_detected = process_aadhaar_image(img)
+    else:
+        with metrics.span('decode'):
+            img = decode_image(data)
+        polygons, aadhaar_detected = find_mask_polygons(img)
+        with metrics.span('mask'):
+            masked = fill_polygons(img, polygons, config['mask_color'], copy=False)
+
+    status = 'masked' if aadhaar_detected else 'unprocessed'
+    if not aadhaar_detected:
+        # Copy file to unprocessed folder if Aadhaar is not found
+        copy_to_unprocessed(filepath)
+    elif masked is not None:
+        with metrics.span('encode'):
+            write_image(masked, savename)
+
+    if cache is not None:
+        # Images are rebuilt from their polygons, PDFs keep the artifact
+        keep_artifact = not polygons or savename.lower().endswith('.pdf')
+        artifact = savename if status == 'masked' and keep_artifact else None
+        cache.put(key, status, polygons, artifact)
+    return status
+
+
+def redact_bytes(data, ext):
+    """Masks one image or PDF held in memory.
+
+    Used by the HTTP service. Images never touch the disk. PDFs are
+    redacted in memory through their text layer when PyMuPDF is installed
+    (boxes in PDF points), otherwise they go through a temporary file
+    because poppler rasterizes from a path.
+
+    Args:
+        data (bytes): Raw input file.
+        ext (str): Extension of the input, e.g. '.png' or '.pdf'. The
+            output has the same format.
+
+    Returns:
+        dict: ``status`` ('masked' or 'unprocessed'), ``uid_found``,
+        ``output`` (masked file bytes, None when nothing was found) and
+        ``boxes``, a ``{'page', 'polygons'}`` dict per page with mask
+        polygons as lists of [x, y] points.
+    """
+    ext = ext.lower()
+    boxes = []
+    output = None
+    if ext == '.pdf' and use_pdf_text(ext):
+        import pdf_text
+        aadhaar_detected, boxes, output = pdf_text.redact_pdf(
+            find_mask_polygons, data=data,
+            dpi=config['pdf_dpi'], color=config['mask_color'],
+            workers=config['pdf_page_workers'], window=config['pdf_window'])
+    elif ext == '.pdf':
+        from pdf2image import pdfinfo_from_path
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, 'input.pdf')
+            savename = os.path.join(tmp, 'output.pdf')
+            with open(filepath, 'wb') as f:
+                f.write(data)
+            page_count = pdfinfo_from_path(filepath)['Pages']
+            aadhaar_detected = multi_page_pdf(filepath, savename, page_count, boxes)
+            if aadhaar_detected:
+                output = read_bytes(savename)
+    else:
+        with metrics.span('decode'):
+            img = decode_image(data)
+        polygons, aadhaar_detected = find_mask_polygons(img)
+        if polygons:
+            boxes.append({'page': 1, 'polygons': polygons})
+        if aadhaar_detected:
+            with metrics.span('mask'):
+                masked = fill_polygons(img, polygons, config['mask_color'], copy=False)
+            with metrics.span('encode'):
+                output = encode_image(masked, ext)
+
+    for page in boxes:
+        page['polygons'] = [np.asarray(p).tolist() for p in page['polygons']]
+    return {
+        'status': 'masked' if aadhaar_detected else 'unprocessed',
+        'uid_found': aadhaar_detected,
+        'output': output,
+        'boxes': boxes
+    }
 
 
 def process_aadhaar(filepath, savename):
     """Processes the image for Aadhar masking."""
     try:
-        temp_file = f"temp_{uuid.uuid4().hex}.jpg"
-        output_path = None
-        aadhaar_detected = False
-
-        if os.path.isfile(filepath) and filepath.lower().endswith('.pdf'):
-            pdf_to_image = convert_from_path(filepath, dpi=120)
-            if len(pdf_to_image) > 1:
-                multi_page_pdf(pdf_to_image, savename)
-                return True
-            output_path = os.path.splitext(filepath)[0] + ".png"
-            pdf_to_image[0].save(output_path, "PNG")
-            filepath = output_path
-
-        for i in range(4):
-            cv_img = rotate(filepath if i == 0 else temp_file)
-            cv2.imwrite(temp_file, cv_img)
-
-            # Process with both contrast methods
-            for contrast_mode in [0, 1]:
-                extracted_aadhaars = aadhaar_processor.extract(
-                    temp_file, contrast_mode)
-                if extracted_aadhaars:
-                    aadhaar_detected = True  # Aadhaar found
-                    aadhaar_processor.mask_image(
-                        temp_file, temp_file, extracted_aadhaars)
-                
-
-            rotate_only(temp_file, 90)
-
-        processFlag=process_image(temp_file)
-        
-
-        if not processFlag:
-            aadhaar_detected=True
-
-        if not aadhaar_detected:
-            # Copy file to unprocessed folder if Aadhaar is not found
-            shutil.copy2(filepath, os.path.join(UNPROCESSED_FOLDER, os.path.basename(filepath)))
-            print(f"No Aadhaar detected. Copied {filepath} to {UNPROCESSED_FOLDER}.")
-        else:
-            aadhaar_processor.mask_image(temp_file, savename, extracted_aadhaars)
-
-        # Cleanup
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
-        if output_path and os.path.exists(output_path):
-            os.remove(output_path)
+        redact_file(filepath, savename)
         return savename
 
     except Exception as e:
@@ -195,47 +542,79 @@ def process_aadhaar(filepath, savename):
         return None
 
 
+def startup_report():
+    """Formats the startup times recorded in this process."""
+    total = sum(STARTUP_TIMES.values())
+    steps = ", ".join(f"{name} {secs:.2f}s" for name, secs in STARTUP_TIMES.items())
+    return f"ready in {total:.2f}s ({steps})"
+
+
+def init_worker(server_args=None, options=None):
+    """Pool initializer, loads the OCR engine and the detector once per worker.
+
+    Args:
+        server_args (tuple, optional): ``YoloServer.client_args()`` to route
+            detections to a shared model server instead of a local model.
+        options (dict, optional): Worker settings, ``ocr_threads`` and
+            ``torch_threads`` limit the OpenMP/OpenCV and torch threads of
+            the worker (see ``executor_plan``), ``page_threads`` and
+            ``tile_threads`` cap ``config['pdf_page_workers']`` and
+            ``config['tile_workers']``, ``unprocessed_dir``
+            overrides ``UNPROCESSED_FOLDER``, ``metrics`` switches the
+            instrumentation on, ``trace_path`` names its trace file and
+            ``profile`` applies a speed/recall profile (see ``profiles``).
+    """
+    global UNPROCESSED_FOLDER
+    options = options or {}
+    if options.get('profile'):
+        apply_profile(options['profile'], config)
+    if options.get('metrics'):
+        metrics.configure(True, options.get('trace_path'))
+    # Read by Tesseract's OpenMP runtime and torch when they are loaded
+    limit_threads(options.get('ocr_threads'), options.get('torch_threads'))
+    # The page and tile pools are capped by the cores the plan gives a file
+    if options.get('page_threads'):
+        config['pdf_page_workers'] = min(config['pdf_page_workers'], options['page_threads'])
+    if options.get('tile_threads'):
+        config['tile_workers'] = min(config['tile_workers'], options['tile_threads'])
+    if options.get('unprocessed_dir'):
+        UNPROCESSED_FOLDER = options['unprocessed_dir']
+
+    start = time.perf_counter()
+    get_backend(config)
+    STARTUP_TIMES['ocr_engine'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if server_args:
+        connect_worker(*server_args)
+    else:
+        configure_detector(config['detector_backend'], config['detector_int8'])
+    STARTUP_TIMES['detector'] = time.perf_counter() - start
+    print(f"Worker {os.getpid()} {startup_report()}")
+
+
+def start_yolo_server(threads=None):
+    """Start the shared YOLO model server with the detector settings of ``config``.
+
+    Args:
+        threads (int, optional): Threads of the server process, e.g.
+            ``ExecutionPlan.server_threads``.
+
+    Returns:
+        YoloServer: The started server.
+    """
+    return YoloServer(config['yolo_batch'], config['yolo_max_wait'], threads,
+                      config['detector_backend'], config['detector_int8'],
+                      config['yolo_timeout'], config['yolo_local_fallback']).start()
+
+
 def process_images_in_parallel(input_folder, output_folder):
     """Processes the images in parallel for lesser processing time."""
-    processed_count = get_processed_count()
-    
+    from redact import redact_batch
 
-    if processed_count >= MAX_AADHAARS:
-        messagebox.showerror("Limit Reached", "Processing limit of Aadhar cards reached.")
-        return
     if not os.path.exists(input_folder):
         raise Exception("Input folder does not exist")
-
-    tasks = []
-    count = 0
-    
-
-    for filename in os.listdir(input_folder):
-        if count + processed_count >= MAX_AADHAARS:
-            break
-        if filename.lower().endswith(
-                ('.png', '.jpg', '.jpeg', '.pdf', '.bmp', '.gif', '.tiff')):
-            input_path = os.path.join(input_folder, filename)
-            name, ext = os.path.splitext(filename)
-            output_path = os.path.join(output_folder, f"{name}_masked{ext}")
-            tasks.append((input_path, output_path))
-            count += 1
-
-    with ProcessPoolExecutor(max_workers=cpu_count()) as executor:
-        futures = []
-        for input_path, output_path in tasks:
-            future = executor.submit(process_aadhaar, input_path, output_path)
-            futures.append(future)
-
-        for future in as_completed(futures):
-            try:
-                result = future.result()
-                if result:
-                    print(f"Successfully processed: {result}")
-            except Exception as e:
-                print(f"Task failed: {str(e)}")
-
-    update_processed_count(processed_count + count)
+    return redact_batch(input_folder, output_folder)
 
 
 def browse_input_folder():
@@ -262,14 +641,15 @@ def validate_and_process():
             "Error", "Both input and output folders must be selected")
         return
 
+    from redact import format_summary
+
     try:
-        process_images_in_parallel(input_folder, output_folder)
+        summary = process_images_in_parallel(input_folder, output_folder)
+        messagebox.showinfo("Done", format_summary(summary))
 
     except Exception as e:
         messagebox.showerror("Error", f"Processing failed: {str(e)}")
     finally:
-        if os.path.exists('temp_images'):
-            shutil.rmtree('temp_images')
         root.destroy()
 
 
@@ -278,6 +658,10 @@ if __name__ == "__main__":
     # Check expiry
     multiprocessing.freeze_support()
 
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+    print(f"Main process {startup_report()}")
+
     if datetime.datetime.now() > datetime.datetime(2025, 3, 4):
         messagebox.showerror(
             "Error", "This application has expired. Please contact support.")
@@ -0,0 +1,632 @@
+"""
+Work sharing between several nodes draining one shared input folder.
+
+Every node (a machine, or just a process when testing locally) runs its own
+warm worker pool and coordinates with the others only through files in a
+shared coordination folder, so any file system with atomic exclusive create
+and rename (local disks, NFSv3+, SMB) is enough:
+
+    leases/<key>    claim of a file, created with O_EXCL by exactly one
+                    node and touched by its heartbeat. A lease older than
+                    the TTL belongs to a dead node and is taken over, which
+                    puts its file back in the queue.
+    done/<key>      completion marker, the file is skipped by every node.
+    quota/<n>       quota slots, each claimed with O_EXCL, so
+                    ``MAX_AADHAARS`` holds over all the nodes together.
+                    ``ledger-<host>-<i>`` slots carry the files each host
+                    counted in its local ledger (``registry``, including the
+                    legacy ``aadhaar_config.json`` count) outside of the
+                    coordination, refreshed at every scan.
+
+The files a node processes are recorded in its local ledger as well, under
+``coord:<key>``, so local runs on that host see them against the quota.
+
+The key of a file is a hash of its path relative to the input folder, its
+size and its mtime, so a replaced input is processed again. Files are only
+claimed once their size and mtime have settled, a file still being copied
+onto the share is left alone. Outputs are
+written under a hidden temporary name and renamed into place, partial
+files never appear in the output folder. Lease expiry compares file mtimes
+with the local clock, the nodes' clocks must agree to well within the TTL.
+
+Usage (run the same command on every node, or several times on one box):
+    python coordination.py --input /mnt/share/in --output /mnt/share/out
+    python coordination.py --output /mnt/share/out --status
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import freeze_support
+
+from redact import DEFAULT_EXTENSIONS, output_path_for
+from daemon import FolderWatcher
+from executor_plan import make_plan
+from profiles import load_profile
+
+LEASE_TTL = 300.0  # Seconds without a heartbeat before a lease is requeued
+
+# Input path prefix of the local ledger rows of coordinated files
+LEDGER_PREFIX = 'coord:'
+
+
+def default_node_id():
+    """Name of this node, unique per host and process."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def file_key(input_path, input_root):
+    """Key of an input file, shared by every node seeing the same file.
+
+    Args:
+        input_path (str): Input file.
+        input_root (str): Input folder the path is taken relative to, the
+            nodes may mount the share at different places.
+
+    Returns:
+        str: Hex key.
+    """
+    stat = os.stat(input_path)
+    rel_path = os.path.relpath(input_path, input_root).replace(os.sep, '/')
+    text = f"{rel_path}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def _create_exclusive(path, payload):
+    """Create a file only if it does not exist yet.
+
+    Returns:
+        bool: True when this call created it.
+    """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+class Coordinator:
+    """Claims, completes and releases files through a shared folder."""
+
+    def __init__(self, root, node=None, ttl=LEASE_TTL, limit=None):
+        """Initialize the coordinator.
+
+        Args:
+            root (str): Shared coordination folder.
+            node (str, optional): Name of this node, defaults to host and pid.
+            ttl (float): Seconds without a heartbeat before a lease expires.
+            limit (int, optional): Global quota, defaults to
+                ``brut_new.MAX_AADHAARS``.
+        """
+        if limit is None:
+            from brut_new import MAX_AADHAARS
+            limit = MAX_AADHAARS
+        self.root = root
+        self.node = node or default_node_id()
+        self.ttl = ttl
+        self.limit = limit
+        self.leases = os.path.join(root, 'leases')
+        self.done = os.path.join(root, 'done')
+        self.quota = os.path.join(root, 'quota')
+        for folder in (self.leases, self.done, self.quota):
+            os.makedirs(folder, exist_ok=True)
+        self.held = {}  # key -> quota slot of the leases of this node
+        self.requeued = 0
+        self._seeded = {}  # host -> ledger slots created by this coordinator
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _lease_path(self, key):
+        return os.path.join(self.leases, key)
+
+    def _write_lease(self, key, input_path, slot):
+        """Rewrite a held lease atomically, renewing it at the same time."""
+        tmp = os.path.join(self.leases, f".{key}.{self.node}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump({'node': self.node, 'input': input_path, 'slot': slot,
+                       'claimed_at': time.time()}, f)
+        os.replace(tmp, self._lease_path(key))
+
+    def _owns(self, key):
+        """True when the lease of a key exists and names this node."""
+        return _read_json(self._lease_path(key)).get('node') == self.node
+
+    def _drop(self, key):
+        """Forget a lease another node took over, the other node's result wins."""
+        with self._lock:
+            self.held.pop(key, None)
+        print(f"Lost the lease of {key}")
+
+    def seed_from_ledger(self, count, host=None):
+        """Count the files of a host's local ledger against the global quota.
+
+        Idempotent, every host owns the slots ``ledger-<host>-0..count-1``,
+        so it is called again whenever the ledger may have grown. Slots
+        taken meanwhile by running nodes may let the total exceed the limit
+        by the files seeded in that instant.
+
+        Args:
+            count (int): Files counted in the ledger outside of the
+                coordination, ``registry.get_processed_count(
+                exclude_prefix=LEDGER_PREFIX)``.
+            host (str, optional): Host name, defaults to this host.
+        """
+        host = host or socket.gethostname()
+        for i in range(self._seeded.get(host, 0), count):
+            _create_exclusive(os.path.join(self.quota, f"ledger-{host}-{i}"),
+                              {'host': host})
+        self._seeded[host] = max(self._seeded.get(host, 0), count)
+
+    def is_done(self, key):
+        """True when some node completed the file."""
+        return os.path.exists(os.path.join(self.done, key))
+
+    def _take_expired(self, key, input_path):
+        """Take over the lease of a dead node.
+
+        The stale lease is renamed away first: rename is atomic, so exactly
+        one of the nodes racing for it wins.
+
+        Returns:
+            dict | None: Payload of the expired lease, None when the lease
+            is alive or another node took it.
+        """
+        path = self._lease_path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime < self.ttl:
+                return None
+        except FileNotFoundError:
+            return None
+        stale = f"{path}.{self.node}.stale"
+        try:
+            os.rename(path, stale)
+        except FileNotFoundError:
+            return None
+        try:
+            # The owner may have renewed it between the stat and the rename
+            if time.time() - os.stat(stale).st_mtime < self.ttl:
+                try:
+                    os.link(stale, path)
+                except FileExistsError:
+                    pass
+                return None
+            payload = _read_json(stale)
+        finally:
+            os.remove(stale)
+        if not _create_exclusive(path, {'node': self.node, 'input': input_path}):
+            return None
+        self.requeued += 1
+        print(f"Requeued {input_path}, lease of {payload.get('node')} expired")
+        return payload
+
+    def _take_slot(self, key):
+        """Claim a free quota slot.
+
+        Returns:
+            int | None: Slot number, None when the quota is used up.
+        """
+        names = os.listdir(self.quota)
+        seeded = sum(name.startswith('ledger-') for name in names)
+        # Numbered slots cover what the ledgers left of the quota
+        limit = self.limit - seeded
+        used = len(names) - seeded
+        for n in list(range(used, limit)) + list(range(max(0, min(used, limit)))):
+            if _create_exclusive(os.path.join(self.quota, f"{n:06d}"),
+                                 {'key': key, 'node': self.node}):
+                return n
+        return None
+
+    def claim(self, key, input_path):
+        """Claim a file for this node.
+
+        Args:
+            key (str): ``file_key`` of the file.
+            input_path (str): Input file, recorded in the lease.
+
+        Returns:
+            str: 'claimed', 'done' when a node completed it, 'leased' when
+            a live node holds it, or 'quota' when the global quota is used up.
+        """
+        if self.is_done(key):
+            return 'done'
+        slot = None
+        if not _create_exclusive(self._lease_path(key),
+                                 {'node': self.node, 'input': input_path}):
+            payload = self._take_expired(key, input_path)
+            if payload is None:
+                return 'leased'
+            slot = payload.get('slot')  # The dead node's slot is reused
+        if self.is_done(key):  # Completed between the check and the claim
+            os.remove(self._lease_path(key))
+            return 'done'
+        if slot is None:
+            slot = self._take_slot(key)
+            if slot is None:
+                os.remove(self._lease_path(key))
+                return 'quota'
+        self._write_lease(key, input_path, slot)
+        with self._lock:
+            self.held[key] = slot
+        return 'claimed'
+
+    def finish(self, key, status, output_path=None):
+        """Record the outcome of a claimed file and drop its lease.
+
+        Completed files ('masked', 'unprocessed') keep their quota slot and
+        get a done marker, failed files give the slot back so the file can
+        be claimed again.
+
+        Args:
+            key (str): Key of the file.
+            status (str): 'masked', 'unprocessed' or 'failed'.
+            output_path (str, optional): Output written for the file.
+        """
+        with self._lock:
+            slot = self.held.pop(key, None)
+        if status != 'failed':
+            _create_exclusive(os.path.join(self.done, key),
+                              {'node': self.node, 'status': status,
+                               'output': output_path, 'finished_at': time.time()})
+        if not self._owns(key):
+            # Taken over after an expiry, the lease and the slot are the new owner's
+            print(f"Lost the lease of {key}")
+            return
+        if status == 'failed' and slot is not None:
+            try:
+                os.remove(os.path.join(self.quota, f"{slot:06d}"))
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(self._lease_path(key))
+        except FileNotFoundError:
+            pass
+
+    def renew(self):
+        """Touch the leases held by this node."""
+        with self._lock:
+            keys = list(self.held)
+        for key in keys:
+            # Never keep alive a lease another node took over
+            if not self._owns(key):
+                self._drop(key)
+                continue
+            try:
+                os.utime(self._lease_path(key))
+            except FileNotFoundError:
+                self._drop(key)
+
+    def start_heartbeat(self):
+        """Renew the held leases in a background thread every third of the TTL."""
+        def beat():
+            while not self._stop.wait(self.ttl / 3):
+                self.renew()
+
+        self._heartbeat = threading.Thread(target=beat, daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def stop_heartbeat(self):
+        """Stop the heartbeat thread."""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def status(self):
+        """Counts of the shared state.
+
+        Returns:
+            dict: ``done``, ``leased`` (live leases), ``expired`` leases,
+            ``quota_used``, ``quota_from_ledgers`` and ``quota_limit``.
+        """
+        now = time.time()
+        leased = expired = 0
+        with os.scandir(self.leases) as it:
+            for entry in it:
+                if '.' in entry.name:  # Temporary and stale files
+                    continue
+                try:
+                    age = now - entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if age < self.ttl:
+                    leased += 1
+                else:
+                    expired += 1
+        quota = os.listdir(self.quota)
+        return {'done': len(os.listdir(self.done)), 'leased': leased,
+                'expired': expired, 'quota_used': len(quota),
+                'quota_from_ledgers': sum(name.startswith('ledger-') for name in quota),
+                'quota_limit': self.limit}
+
+
+def _node_task(input_path, output_path, key):
+    """Worker task, records one claimed file in the local ledger, masks it
+    and moves the output into place."""
+    import metrics
+    import registry
+    from brut_new import redact_file, MAX_AADHAARS
+    from redact import SKIPPED
+
+    start = time.perf_counter()
+    error = None
+    claim = None
+    entry = LEDGER_PREFIX + key
+    folder, name = os.path.split(output_path)
+    # Same extension, it selects the output format
+    tmp = os.path.join(folder, f".{socket.gethostname()}.{os.getpid()}.{name}")
+    try:
+        claim = registry.claim(entry, output_path, key, MAX_AADHAARS)
+        if claim == 'claimed':
+            with metrics.span('file', file=input_path):
+                status = redact_file(input_path, tmp)
+            if status == 'masked':
+                os.replace(tmp, output_path)
+        else:
+            status = SKIPPED[claim]
+    except Exception as e:
+        status, error = 'failed', str(e)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    if claim == 'claimed':
+        try:
+            registry.finish(entry, output_path, status,
+                            time.perf_counter() - start, error)
+        except Exception as e:
+            print(f"Could not record {input_path} in the ledger: {e}")
+    return {
+        'input': input_path,
+        'output': output_path if status == 'masked' else None,
+        'status': status,
+        'error': error,
+        'seconds': time.perf_counter() - start
+    }
+
+
+def run_node(input_dir, output_dir, coord_dir=None, node=None, workers=None,
+             ocr_threads=None, extensions=DEFAULT_EXTENSIONS, recursive=False,
+             output_format=None, unprocessed_dir=None, yolo_server=None,
+             profile=None, ttl=LEASE_TTL, poll_interval=5.0, watch=False,
+             limit=None, settle=2.0):
+    """Process a shared input folder together with the other nodes.
+
+    The node scans the folder, claims the settled files no other node holds
+    and masks them with its worker pool. It returns once every file is done (or failed on
+    this node), waiting for the files leased by other nodes so that the
+    files of a node dying meanwhile are picked up after the lease TTL.
+
+    Args:
+        input_dir (str): Shared input folder.
+        output_dir (str): Shared output folder.
+        coord_dir (str, optional): Shared coordination folder, defaults to
+            ``.coordination`` in the output folder.
+        node (str, optional): Name of this node.
+        workers (int, optional): Worker processes of this node.
+        ocr_threads (int, optional): OpenMP/OpenCV threads per worker.
+        extensions (tuple): Accepted file extensions.
+        recursive (bool): Descend into subfolders.
+        output_format (str, optional): Output extension, defaults to the
+            input's extension.
+        unprocessed_dir (str, optional): Folder receiving the files without
+            an Aadhaar number.
+        yolo_server (bool, optional): Share one batching YOLO model between
+            the workers of this node, defaults to ``config['yolo_server']``.
+        profile (str, optional): Speed/recall profile of the workers.
+        ttl (float): Lease TTL in seconds.
+        poll_interval (float): Seconds between scans while other nodes hold
+            files.
+        watch (bool): Keep polling for new files instead of returning.
+        limit (int, optional): Global quota, defaults to ``MAX_AADHAARS``.
+        settle (float): Seconds a file's size and mtime must stay unchanged
+            before it is claimed.
+
+    Returns:
+        dict: Summary of this node.
+    """
+    import brut_new
+    import registry
+
+    coordinator = Coordinator(coord_dir or os.path.join(output_dir, '.coordination'),
+                              node, ttl, limit)
+    if yolo_server is None:
+        yolo_server = brut_new.config['yolo_server']
+    plan = make_plan(None, workers, ocr_threads, 1, yolo_server,
+                     brut_new.config['pdf_page_workers'], brut_new.config['tile_workers'])
+    print(f"Node {coordinator.node}: {plan.describe()}")
+    server = brut_new.start_yolo_server(plan.server_threads) if plan.server_threads else None
+    options = dict(plan.worker_options(), unprocessed_dir=unprocessed_dir,
+                   profile=profile and load_profile(profile))
+
+    counts = dict.fromkeys(('masked', 'unprocessed', 'failed', 'skipped_done',
+                            'skipped_leased', 'skipped_quota'), 0)
+    failures = []
+    failed_keys = set()  # Not retried by this node
+    in_flight = {}
+    start = time.perf_counter()
+
+    def collect(block_until_empty=False):
+        nonlocal quota_reached
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, rel_dir = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'input': key, 'output': None, 'status': 'failed',
+                              'error': str(e), 'seconds': 0.0}
+                status = result['status']
+                # Refused by the local ledger: give the lease and the slot back
+                coordinator.finish(key, 'failed' if status in ('skipped_leased',
+                                                               'skipped_quota') else status,
+                                   result['output'])
+                counts[status] += 1
+                if status == 'skipped_quota':
+                    quota_reached = True
+                elif status == 'skipped_leased':
+                    elsewhere[result['input']] = rel_dir
+                elif status == 'skipped_done':
+                    print(f"Skipped {result['input']}, done in the local ledger")
+                elif status == 'failed':
+                    failed_keys.add(key)
+                    failures.append({'input': result['input'], 'error': result['error']})
+                    print(f"Task failed: {result['input']}: {result['error']}")
+                elif status == 'masked':
+                    print(f"Successfully processed: {result['output']} "
+                          f"in {result['seconds']:.2f}s")
+                else:
+                    print(f"No Aadhaar number found: {result['input']}")
+            if not block_until_empty:
+                return
+
+    quota_reached = False
+    coordinator.start_heartbeat()
+    try:
+        with ProcessPoolExecutor(
+                max_workers=plan.processes,
+                initializer=brut_new.init_worker,
+                initargs=(server.client_args() if server else None, options)) as executor:
+            max_in_flight = 2 * plan.processes
+            # Writes of other hosts raise no inotify events, every check rescans
+            watcher = FolderWatcher(input_dir, extensions, recursive, settle,
+                                    poll_interval, rescan_interval=0, use_inotify=False)
+            elsewhere = {}  # Settled files leased by other nodes, checked again
+            while True:
+                # Local runs of this host may have counted files meanwhile
+                coordinator.seed_from_ledger(
+                    registry.get_processed_count(exclude_prefix=LEDGER_PREFIX))
+                candidates = watcher.ready() + list(elsewhere.items())
+                elsewhere = {}
+                for input_path, rel_dir in candidates:
+                    try:
+                        key = file_key(input_path, input_dir)
+                    except FileNotFoundError:
+                        continue
+                    if key in failed_keys or key in coordinator.held:
+                        continue
+                    claim = coordinator.claim(key, input_path)
+                    if claim == 'leased':
+                        elsewhere[input_path] = rel_dir
+                        continue
+                    if claim == 'quota':
+                        print("Processing limit reached, stopping")
+                        quota_reached = True
+                        break
+                    if claim != 'claimed':
+                        continue
+                    output_path = output_path_for(input_path, rel_dir, output_dir,
+                                                  output_format)
+                    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                    in_flight[executor.submit(_node_task, input_path, output_path,
+                                              key)] = key, rel_dir
+                    if len(in_flight) >= max_in_flight:
+                        collect()
+                collect(block_until_empty=True)
+                if quota_reached or not (elsewhere or watcher.pending or watch):
+                    break
+                watcher.wait()
+    finally:
+        coordinator.stop_heartbeat()
+        if server is not None:
+            server.stop()
+
+    return {
+        'node': coordinator.node,
+        'counts': counts,
+        'requeued': coordinator.requeued,
+        'quota_reached': quota_reached,
+        'failures': failures,
+        'wall_seconds': time.perf_counter() - start,
+        'shared': coordinator.status()
+    }
+
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    parser = argparse.ArgumentParser(
+        description="Drain a shared input folder together with other nodes.")
+    parser.add_argument('--input', '-i', default=None, help="Shared input folder")
+    parser.add_argument('--output', '-o', required=True, help="Shared output folder")
+    parser.add_argument('--coord', default=None,
+                        help="Shared coordination folder (default: OUTPUT/.coordination)")
+    parser.add_argument('--node', default=None, help="Node name (default: host-pid)")
+    parser.add_argument('--workers', '-w', type=int, default=None)
+    parser.add_argument('--ocr-threads', type=int, default=None)
+    parser.add_argument('--ext', default=','.join(DEFAULT_EXTENSIONS),
+                        help="Comma separated file extensions to process")
+    parser.add_argument('--recursive', '-r', action='store_true')
+    parser.add_argument('--format', dest='output_format', default=None)
+    parser.add_argument('--unprocessed', default=None,
+                        help="Folder for files without an Aadhaar number")
+    parser.add_argument('--no-yolo-server', action='store_true')
+    parser.add_argument('--profile', default=None,
+                        help="fast, balanced, thorough or a JSON file of config overrides")
+    parser.add_argument('--lease-ttl', type=float, default=LEASE_TTL,
+                        help="Seconds before the lease of a silent node is requeued")
+    parser.add_argument('--poll', type=float, default=5.0,
+                        help="Seconds between scans while other nodes hold files")
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help="Seconds a file must stay unchanged before it is claimed")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep polling for new files")
+    parser.add_argument('--limit', type=int, default=None,
+                        help="Global quota (default: MAX_AADHAARS)")
+    parser.add_argument('--status', action='store_true',
+                        help="Print the shared state and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+    coord_dir = args.coord or os.path.join(args.output, '.coordination')
+    if args.status:
+        print(json.dumps(Coordinator(coord_dir, args.node, args.lease_ttl,
+                                     args.limit).status(), indent=2))
+        return 0
+    if not args.input:
+        print("--input is required")
+        return 2
+    extensions = tuple('.' + ext.strip().lower().lstrip('.')
+                       for ext in args.ext.split(',') if ext.strip())
+    summary = run_node(args.input, args.output, coord_dir, args.node,
+                       workers=args.workers,
+                       ocr_threads=args.ocr_threads,
+                       extensions=extensions,
+                       recursive=args.recursive,
+                       output_format=args.output_format,
+                       unprocessed_dir=args.unprocessed,
+                       yolo_server=False if args.no_yolo_server else None,
+                       profile=args.profile,
+                       ttl=args.lease_ttl,
+                       poll_interval=args.poll,
+                       watch=args.watch,
+                       limit=args.limit,
+                       settle=args.settle)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['failures'] else 0
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Watch-folder daemon for Aadhaar masking.
+
+Watches an input folder (inotify when ``inotify_simple`` is installed,
+polling otherwise), waits until every new file has stopped growing, and
+feeds it to a pool of workers that stay warm for the life of the daemon:
+the OCR engine and the YOLO model (or the shared model server) are loaded
+once at startup, so a dropped file only pays for its own processing.
+Files already completed are skipped through the job ledger, so a restart
+does not redo the folder.
+
+Usage:
+    python daemon.py --input scans/ --output masked/ --unprocessed unprocessed/
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import freeze_support
+
+from redact import DEFAULT_EXTENSIONS, output_path_for, _redact_task
+from scheduler import scan_inputs
+from executor_plan import make_plan
+from profiles import load_profile
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # Not on Linux or not installed, poll instead
+    INotify = None
+
+
+class FolderWatcher:
+    """Reports the files of a folder once they are completely written."""
+
+    def __init__(self, folder, extensions=DEFAULT_EXTENSIONS, recursive=False,
+                 settle=2.0, poll_interval=2.0, rescan_interval=60.0,
+                 use_inotify=True):
+        """Initialize the watcher.
+
+        Args:
+            folder (str): Folder to watch.
+            extensions (tuple): Accepted file extensions (lower case).
+            recursive (bool): Include the files of subfolders. With inotify
+                only the folder itself raises events, the subfolders are
+                picked up by the periodic rescans.
+            settle (float): Seconds a file's size and mtime must stay
+                unchanged before it is reported.
+            poll_interval (float): Seconds between checks.
+            rescan_interval (float): Seconds between full scans when inotify
+                is used, catching events it cannot see (e.g. network shares).
+            use_inotify (bool): Use inotify when available. Folders written
+                by other hosts need polling, their writes raise no events.
+        """
+        self.folder = folder
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.recursive = recursive
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.pending = {}  # path -> (rel_dir, signature, unchanged since)
+        self.reported = {}  # path -> signature when reported
+        self.inotify = None
+        if INotify is not None and use_inotify:
+            self.inotify = INotify()
+            self.inotify.add_watch(folder, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+        self._last_scan = 0.0
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _candidates(self):
+        """Paths that may have changed since the last call."""
+        now = time.monotonic()
+        if self.inotify is None or now - self._last_scan >= self.rescan_interval:
+            self._last_scan = now
+            if self.inotify is not None:
+                self.inotify.read(timeout=0)  # The scan covers these
+            found = list(scan_inputs(self.folder, self.extensions, self.recursive))
+            # Forget the files that are gone, the maps stay as large as the folder
+            present = {path for path, _ in found}
+            self.reported = {path: signature for path, signature in self.reported.items()
+                             if path in present}
+            return found
+        timeout = self.poll_interval if not self.pending else min(
+            self.poll_interval, self.settle)
+        return [(os.path.join(self.folder, event.name), '')
+                for event in self.inotify.read(timeout=int(timeout * 1000))
+                if event.name.lower().endswith(self.extensions)]
+
+    def ready(self):
+        """Check the folder once.
+
+        Returns:
+            list: (path, folder relative to the watched folder) of the files
+            that are new or changed and have settled.
+        """
+        now = time.monotonic()
+        for path, rel_dir in self._candidates():
+            signature = self._signature(path)
+            if signature is None or self.reported.get(path) == signature:
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[1] != signature:
+                self.pending[path] = (rel_dir, signature, now)
+
+        ready = []
+        for path, (rel_dir, signature, since) in list(self.pending.items()):
+            if now - since < self.settle:
+                continue
+            current = self._signature(path)
+            if current is None:
+                del self.pending[path]
+            elif current != signature:
+                self.pending[path] = (rel_dir, current, now)
+            else:
+                del self.pending[path]
+                self.reported[path] = signature
+                if signature[0] > 0:
+                    ready.append((path, rel_dir))
+                else:  # Picked up again if it is written later
+                    print(f"Skipping empty file: {path}")
+        return ready
+
+    def wait(self):
+        """Sleep until the next check when polling."""
+        if self.inotify is None:
+            time.sleep(self.poll_interval)
+
+
+def run_daemon(input_dir, output_dir, unprocessed_dir=None, workers=None,
+               ocr_threads=None, extensions=DEFAULT_EXTENSIONS, recursive=False,
+               output_format=None, settle=2.0, poll_interval=2.0,
+               yolo_server=None, profile=None, max_in_flight=None):
+    """Process the files dropped into a folder until interrupted.
+
+    Args:
+        input_dir (str): Folder to watch.
+        output_dir (str): Folder receiving the masked files.
+        unprocessed_dir (str, optional): Folder receiving the files without
+            an Aadhaar number.
+        workers (int, optional): Worker processes, defaults to the cores
+            left by the execution plan.
+        ocr_threads (int, optional): OpenMP/OpenCV threads per worker.
+        extensions (tuple): Accepted file extensions.
+        recursive (bool): Watch the subfolders too.
+        output_format (str, optional): Output extension, defaults to the
+            input's extension.
+        settle (float): Seconds a file must stay unchanged before it is
+            processed.
+        poll_interval (float): Seconds between checks of the folder.
+        yolo_server (bool, optional): Share one batching YOLO model between
+            the workers, defaults to ``config['yolo_server']``.
+        profile (str, optional): Speed/recall profile of the workers, a name
+            or a JSON file (see ``profiles``).
+        max_in_flight (int, optional): Submitted, unfinished files at any
+            time, defaults to four per worker. The watcher waits for a free
+            slot, so a large drop does not queue the whole folder.
+    """
+    import brut_new
+    import registry
+
+    if yolo_server is None:
+        yolo_server = brut_new.config['yolo_server']
+    plan = make_plan(None, workers, ocr_threads, 1, yolo_server,
+                     brut_new.config['pdf_page_workers'], brut_new.config['tile_workers'])
+    server = None
+    if plan.server_threads:
+        server = brut_new.start_yolo_server(plan.server_threads)
+    options = dict(plan.worker_options(), unprocessed_dir=unprocessed_dir,
+                   profile=profile and load_profile(profile))
+    watcher = FolderWatcher(input_dir, extensions, recursive, settle, poll_interval)
+    print(f"Watching {input_dir} ({'inotify' if watcher.inotify else 'polling'}), "
+          f"{plan.describe()}")
+
+    slots = threading.BoundedSemaphore(max_in_flight or 4 * plan.processes)
+
+    def start_pool():
+        return ProcessPoolExecutor(
+            max_workers=plan.processes,
+            initializer=brut_new.init_worker,
+            initargs=(server.client_args() if server else None, options))
+
+    def report(input_path, future):
+        slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            # E.g. BrokenProcessPool for every file in flight when a worker died
+            print(f"Task failed: {input_path}: {e!r}")
+            return
+        if result['status'] == 'masked':
+            print(f"Successfully processed: {result['output']} "
+                  f"in {result['seconds']:.2f}s")
+        elif result['status'] == 'failed':
+            print(f"Task failed: {result['input']}: {result['error']}")
+        elif result['status'] == 'skipped_leased':
+            print(f"Being processed elsewhere, skipped: {result['input']}")
+        elif result['status'] == 'skipped_quota':
+            print(f"Processing limit reached, skipped: {result['input']}")
+        elif result['status'] == 'unprocessed':
+            print(f"No Aadhaar number found: {result['input']}")
+
+    executor = start_pool()
+    try:
+        while True:
+            for input_path, rel_dir in watcher.ready():
+                output_path = output_path_for(input_path, rel_dir, output_dir,
+                                              output_format)
+                # Completed before a restart, no need for a worker round trip
+                try:
+                    if registry.is_done(input_path, output_path,
+                                        registry.stat_key(input_path)):
+                        continue
+                except FileNotFoundError:
+                    continue
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                slots.acquire()
+                try:
+                    future = executor.submit(_redact_task, input_path, output_path)
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed on memory), its files were
+                    # reported failed; one bad file must not stop the daemon
+                    print("Worker pool broken, restarting it")
+                    executor.shutdown(wait=False)
+                    executor = start_pool()
+                    future = executor.submit(_redact_task, input_path, output_path)
+                future.add_done_callback(functools.partial(report, input_path))
+            watcher.wait()
+    except KeyboardInterrupt:
+        print("Stopping, waiting for the files in progress")
+    finally:
+        executor.shutdown()
+        if server is not None:
+            server.stop()
+
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    parser = argparse.ArgumentParser(
+        description="Watch a folder and mask the Aadhaar numbers of new files.")
+    parser.add_argument('--input', '-i', required=True, help="Folder to watch")
+    parser.add_argument('--output', '-o', required=True, help="Output folder")
+    parser.add_argument('--unprocessed', default=None,
+                        help="Folder for files without an Aadhaar number")
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help="Worker processes (default: from the execution plan)")
+    parser.add_argument('--ocr-threads', type=int, default=None,
+                        help="OCR/OpenCV threads per worker (default: from the execution plan)")
+    parser.add_argument('--ext', default=','.join(DEFAULT_EXTENSIONS),
+                        help="Comma separated file extensions to process")
+    parser.add_argument('--recursive', '-r', action='store_true',
+                        help="Watch subfolders too")
+    parser.add_argument('--format', dest='output_format', default=None,
+                        help="Output format, e.g. png or pdf (default: same as input)")
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help="Seconds a file must stay unchanged (default: 2)")
+    parser.add_argument('--poll', type=float, default=2.0,
+                        help="Seconds between folder checks (default: 2)")
+    parser.add_argument('--no-yolo-server', action='store_true',
+                        help="Load the YOLO model in every worker")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Files submitted at any time (default: 4 per worker)")
+    parser.add_argument('--profile', default=None,
+                        help="fast, balanced, thorough or a JSON file of config overrides")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+    extensions = tuple('.' + ext.strip().lower().lstrip('.')
+                       for ext in args.ext.split(',') if ext.strip())
+    run_daemon(args.input, args.output, args.unprocessed,
+               workers=args.workers,
+               ocr_threads=args.ocr_threads,
+               extensions=extensions,
+               recursive=args.recursive,
+               output_format=args.output_format,
+               settle=args.settle,
+               poll_interval=args.poll,
+               yolo_server=False if args.no_yolo_server else None,
+               profile=args.profile,
+               max_in_flight=args.max_in_flight)
+    return 0
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
@@ -0,0 +1,496 @@
+"""
+Detector backends for the Aadhaar YOLO model.
+
+The reference backend runs the ultralytics PyTorch model. The exported
+backends run the same network through ONNX Runtime or OpenVINO without
+importing torch, with letterbox preprocessing and NMS done in NumPy, which
+makes workers start faster, use less memory and infer faster on CPU. Every
+backend answers ``predict(images)`` with one ``supervision.Detections`` per
+image, so the rest of the pipeline does not know which one it runs.
+
+Exported models live in the ``models`` folder next to ``model.pt``:
+``model.onnx``, ``model_int8.onnx``, ``model_openvino_model/`` and
+``model_int8_openvino_model/``. INT8 models use static quantization
+calibrated on sample cards (``Aadhars_input`` by default).
+
+Usage:
+    python detector.py export --format onnx --int8
+    python detector.py parity --backend onnx --images Aadhars_input
+"""
+
+import os
+import sys
+import ast
+import glob
+import shutil
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+from yolo_model import get_model
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+IMAGE_PATTERNS = ('*.png', '*.jpg', '*.jpeg', '*.bmp')
+
+
+def models_dir():
+    """Folder receiving the exported models, next to the bundled ``model.pt``."""
+    base_dir = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "models")
+
+
+def exported_path(backend, int8=False):
+    """Path of an exported model.
+
+    Args:
+        backend (str): 'onnx' or 'openvino'.
+        int8 (bool): The quantized variant.
+
+    Returns:
+        str: ``.onnx`` file or OpenVINO folder, which may not exist yet.
+    """
+    name = 'model_int8' if int8 else 'model'
+    if backend == 'onnx':
+        return os.path.join(models_dir(), f"{name}.onnx")
+    return os.path.join(models_dir(), f"{name}_openvino_model")
+
+
+def letterbox(img, size=640, color=(114, 114, 114)):
+    """Resize keeping the aspect ratio and pad to a square, like ultralytics.
+
+    Args:
+        img (numpy.ndarray): BGR image.
+        size (int): Side of the network input.
+        color (tuple): Padding color.
+
+    Returns:
+        tuple: (padded BGR image, scale, (pad x, pad y))
+    """
+    height, width = img.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    if (new_w, new_h) != (width, height):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right,
+                             cv2.BORDER_CONSTANT, value=color)
+    return img, scale, (left, top)
+
+
+def to_tensor(images, size=640):
+    """Letterbox a batch of BGR images into an NCHW float32 RGB tensor.
+
+    Returns:
+        tuple: (tensor, list of (scale, pad) per image)
+    """
+    batch = []
+    transforms = []
+    for img in images:
+        padded, scale, pad = letterbox(img, size)
+        batch.append(padded[:, :, ::-1].transpose(2, 0, 1))
+        transforms.append((scale, pad))
+    tensor = np.ascontiguousarray(np.stack(batch), dtype=np.float32) / 255.0
+    return tensor, transforms
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression.
+
+    Args:
+        boxes (numpy.ndarray): (N, 4) xyxy boxes.
+        scores (numpy.ndarray): (N,) scores.
+        iou_threshold (float): Overlap above which the weaker box is dropped.
+
+    Returns:
+        numpy.ndarray: Indices of the kept boxes, best first.
+    """
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+def postprocess(output, transforms, shapes, names, conf=0.25, iou=0.7, max_det=300):
+    """Decode raw YOLOv8 outputs into Detections.
+
+    Args:
+        output (numpy.ndarray): (N, 4 + classes, anchors) network output.
+        transforms (list): (scale, pad) of each image.
+        shapes (list): Original image shapes.
+        names (dict): Class id -> name.
+        conf (float): Confidence threshold.
+        iou (float): NMS IoU threshold.
+        max_det (int): Maximum detections per image.
+
+    Returns:
+        list: ``supervision.Detections`` per image.
+    """
+    from supervision import Detections
+
+    results = []
+    for pred, (scale, (pad_x, pad_y)), shape in zip(output, transforms, shapes):
+        pred = pred.T  # (anchors, 4 + classes)
+        class_scores = pred[:, 4:]
+        class_id = class_scores.argmax(axis=1)
+        score = class_scores[np.arange(len(pred)), class_id]
+        mask = score > conf
+        pred, class_id, score = pred[mask], class_id[mask], score[mask]
+
+        cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        # Per class NMS in one pass by moving the classes apart
+        keep = nms(boxes + class_id[:, None] * 4096.0, score, iou)[:max_det]
+        boxes, class_id, score = boxes[keep], class_id[keep], score[keep]
+
+        boxes = (boxes - [pad_x, pad_y, pad_x, pad_y]) / scale
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+        results.append(Detections(
+            xyxy=boxes.astype(np.float32).reshape(-1, 4),
+            confidence=score.astype(np.float32),
+            class_id=class_id.astype(int),
+            data={'class_name': np.array([names[int(c)] for c in class_id], dtype=str)}))
+    return results
+
+
+def _num_threads():
+    """Threads for the runtime, pinned by ``executor_plan.limit_threads``."""
+    return int(os.getenv('OMP_NUM_THREADS', '0') or 0)
+
+
+class TorchDetector:
+    """Reference backend, the ultralytics PyTorch model."""
+
+    name = 'torch'
+
+    def __init__(self):
+        self.model = get_model()
+
+    def predict(self, images):
+        """Detect on a batch of BGR images.
+
+        Args:
+            images (list): BGR images.
+
+        Returns:
+            list: Detections per image.
+        """
+        from supervision import Detections
+        # ultralytics treats ndarrays as BGR
+        return [Detections.from_ultralytics(r)
+                for r in self.model.predict(images, verbose=False)]
+
+
+class OnnxDetector:
+    """ONNX Runtime backend."""
+
+    name = 'onnx'
+
+    def __init__(self, path, imgsz=640):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = _num_threads()
+        self.session = ort.InferenceSession(
+            path, options, providers=['CPUExecutionProvider'])
+        self.input = self.session.get_inputs()[0]
+        self.imgsz = imgsz
+        self.names = ast.literal_eval(
+            self.session.get_modelmeta().custom_metadata_map['names'])
+        # Models exported without dynamic axes take one image at a time
+        self.fixed_batch = isinstance(self.input.shape[0], int)
+
+    def _run(self, tensor):
+        if self.fixed_batch:
+            return np.concatenate([self.session.run(None, {self.input.name: t[None]})[0]
+                                   for t in tensor])
+        return self.session.run(None, {self.input.name: tensor})[0]
+
+    def predict(self, images):
+        """Detect on a batch of BGR images, see ``TorchDetector.predict``."""
+        tensor, transforms = to_tensor(images, self.imgsz)
+        return postprocess(self._run(tensor), transforms,
+                           [img.shape for img in images], self.names)
+
+
+class OpenVinoDetector:
+    """OpenVINO backend."""
+
+    name = 'openvino'
+
+    def __init__(self, folder, imgsz=640):
+        import yaml
+        import openvino as ov
+
+        xml = glob.glob(os.path.join(folder, '*.xml'))[0]
+        core = ov.Core()
+        threads = _num_threads()
+        properties = {'INFERENCE_NUM_THREADS': threads} if threads else {}
+        self.model = core.compile_model(core.read_model(xml), 'CPU', properties)
+        self.imgsz = imgsz
+        with open(os.path.join(folder, 'metadata.yaml')) as f:
+            self.names = {int(k): v for k, v in yaml.safe_load(f)['names'].items()}
+        self.fixed_batch = self.model.input(0).get_partial_shape()[0].is_static
+
+    def _run(self, tensor):
+        if self.fixed_batch:
+            return np.concatenate([self.model(t[None])[self.model.output(0)]
+                                   for t in tensor])
+        return self.model(tensor)[self.model.output(0)]
+
+    def predict(self, images):
+        """Detect on a batch of BGR images, see ``TorchDetector.predict``."""
+        tensor, transforms = to_tensor(images, self.imgsz)
+        return postprocess(self._run(tensor), transforms,
+                           [img.shape for img in images], self.names)
+
+
+def create_detector(backend='auto', int8=False):
+    """Create a detector backend.
+
+    Args:
+        backend (str): 'torch', 'onnx', 'openvino', or 'auto' for the first
+            exported model whose runtime is installed (OpenVINO, then ONNX),
+            falling back to torch.
+        int8 (bool): Use the quantized export.
+
+    Returns:
+        Detector backend.
+    """
+    if backend == 'auto':
+        for candidate, module in (('openvino', 'openvino'), ('onnx', 'onnxruntime')):
+            if os.path.exists(exported_path(candidate, int8)):
+                try:
+                    __import__(module)
+                except ImportError:
+                    continue
+                return create_detector(candidate, int8)
+        backend = 'torch'
+    if backend == 'torch':
+        return TorchDetector()
+    path = exported_path(backend, int8)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No exported {backend} model at {path}, run: "
+            f"python detector.py export --format {backend}{' --int8' if int8 else ''}")
+    if backend == 'onnx':
+        return OnnxDetector(path)
+    if backend == 'openvino':
+        return OpenVinoDetector(path)
+    raise ValueError(f"Unknown detector backend: {backend}")
+
+
+def calibration_images(folder, limit=300):
+    """Image paths used to calibrate INT8 models."""
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(folder, pattern)))
+    return sorted(paths)[:limit]
+
+
+class _CalibrationReader:
+    """Feeds letterboxed sample cards to ONNX Runtime static quantization."""
+
+    def __init__(self, input_name, paths, imgsz):
+        self.input_name = input_name
+        self.paths = iter(paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.paths:
+            img = cv2.imread(path)
+            if img is not None:
+                return {self.input_name: to_tensor([img], self.imgsz)[0]}
+        return None
+
+
+def quantize_onnx(src, dst, calibration, imgsz=640):
+    """Static INT8 quantization of an ONNX model.
+
+    Args:
+        src (str): FP32 model.
+        dst (str): Quantized model.
+        calibration (str): Folder with sample cards.
+        imgsz (int): Network input side.
+    """
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+
+    input_name = ort.InferenceSession(
+        src, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    reader = _CalibrationReader(input_name, calibration_images(calibration), imgsz)
+    quantize_static(src, dst, reader, quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    # Keep the class names of the source model
+    model = onnx.load(dst)
+    names = {p.key: p.value for p in onnx.load(src).metadata_props}
+    del model.metadata_props[:]
+    for key, value in names.items():
+        model.metadata_props.add(key=key, value=value)
+    onnx.save(model, dst)
+
+
+def _calibration_yaml(folder, names):
+    """Dataset file pointing ultralytics' INT8 calibration at a folder of cards."""
+    import yaml
+
+    fd, path = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as f:
+        yaml.safe_dump({'path': os.path.abspath(folder), 'train': '.', 'val': '.',
+                        'names': dict(names)}, f)
+    return path
+
+
+def export(backend='onnx', int8=False, calibration='Aadhars_input', imgsz=640):
+    """Export the PyTorch model once for a runtime.
+
+    Args:
+        backend (str): 'onnx' or 'openvino'.
+        int8 (bool): Also produce the statically quantized model.
+        calibration (str): Folder with sample cards for the INT8 calibration.
+        imgsz (int): Network input side.
+
+    Returns:
+        str: Path of the exported model.
+    """
+    model = get_model()
+    os.makedirs(models_dir(), exist_ok=True)
+    if backend == 'onnx':
+        target = exported_path('onnx')
+        produced = model.export(format='onnx', imgsz=imgsz, dynamic=True)
+        if os.path.abspath(produced) != os.path.abspath(target):
+            shutil.move(produced, target)
+        if int8:
+            quantize_onnx(target, exported_path('onnx', True), calibration, imgsz)
+            target = exported_path('onnx', True)
+        return target
+    if backend == 'openvino':
+        kwargs = {}
+        if int8:
+            kwargs = {'int8': True, 'data': _calibration_yaml(calibration, model.names)}
+        produced = model.export(format='openvino', imgsz=imgsz, dynamic=True, **kwargs)
+        target = exported_path('openvino', int8)
+        if os.path.abspath(produced) != os.path.abspath(target):
+            shutil.rmtree(target, ignore_errors=True)
+            shutil.move(produced, target)
+        return target
+    raise ValueError(f"Cannot export to {backend}")
+
+
+def box_iou(a, b):
+    """IoU matrix of two sets of xyxy boxes."""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare(reference, candidate, min_iou=0.85, min_conf=0.4):
+    """Match the confident detections of two backends on one image.
+
+    Args:
+        reference (Detections): Reference detections.
+        candidate (Detections): Detections of the backend under test.
+        min_iou (float): Overlap a matching box must reach.
+        min_conf (float): Detections below this confidence in both
+            backends are ignored, borderline boxes may legitimately flip.
+
+    Returns:
+        list: Human readable mismatches, empty when the image passes.
+    """
+    problems = []
+    for first, second, label in ((reference, candidate, 'missing'),
+                                 (candidate, reference, 'extra')):
+        names_first = first.data.get('class_name', [])
+        names_second = np.asarray(second.data.get('class_name', []))
+        iou = box_iou(first.xyxy, second.xyxy)
+        for i, (box, conf) in enumerate(zip(first.xyxy, first.confidence)):
+            if conf < min_conf:
+                continue
+            same_class = names_second == names_first[i]
+            if not same_class.any() or iou[i][same_class].max() < min_iou:
+                problems.append(f"{label} {names_first[i]} {box.round().tolist()} "
+                                f"conf {conf:.2f}")
+    return problems
+
+
+def parity(backend, images='Aadhars_input', int8=False, min_iou=0.85):
+    """Check an exported backend against the PyTorch reference.
+
+    Args:
+        backend (str): 'onnx' or 'openvino'.
+        images (str): Folder with sample cards.
+        int8 (bool): Check the quantized export.
+        min_iou (float): Overlap matching boxes must reach.
+
+    Returns:
+        int: Number of images with mismatching boxes.
+    """
+    reference = TorchDetector()
+    candidate = create_detector(backend, int8)
+    failures = 0
+    for path in calibration_images(images, limit=None):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        problems = compare(reference.predict([img])[0], candidate.predict([img])[0],
+                           min_iou)
+        status = 'ok' if not problems else 'MISMATCH'
+        print(f"{status:8} {os.path.basename(path)}")
+        for problem in problems:
+            print(f"         {problem}")
+        failures += bool(problems)
+    return failures
+
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    parser = argparse.ArgumentParser(description="Export and check detector backends.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help="Export the PyTorch model")
+    exp.add_argument('--format', choices=BACKENDS[1:], default='onnx')
+    exp.add_argument('--int8', action='store_true', help="Static INT8 quantization")
+    exp.add_argument('--calibration', default='Aadhars_input')
+    exp.add_argument('--imgsz', type=int, default=640)
+    par = sub.add_parser('parity', help="Compare a backend with the PyTorch model")
+    par.add_argument('--backend', choices=BACKENDS[1:], default='onnx')
+    par.add_argument('--int8', action='store_true')
+    par.add_argument('--images', default='Aadhars_input')
+    par.add_argument('--min-iou', type=float, default=0.85)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+    if args.command == 'export':
+        print(f"Exported {export(args.format, args.int8, args.calibration, args.imgsz)}")
+        return 0
+    failures = parity(args.backend, args.images, args.int8, args.min_iou)
+    print(f"{failures} image(s) with mismatching boxes")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+Execution planner: splits the cores of the machine between worker
+processes and the threads inside each of them.
+
+Left alone, every worker process runs Tesseract with its default OpenMP
+threads and torch with one intra-op thread per core, so ``N`` workers on
+``N`` cores end up with ``N * N`` busy threads. A plan fixes:
+
+    processes       worker processes
+    ocr_threads     OpenMP threads of Tesseract and OpenCV threads per worker
+    torch_threads   torch intra-op threads per worker (local model)
+    io_threads      files a worker processes concurrently in threads, for
+                    subprocess-bound OCR (pytesseract) and I/O
+    server_threads  torch threads of the shared YOLO server process
+    page_threads    threads masking the pages of one PDF per file
+    tile_threads    threads searching the tiles of one large image per file
+
+so that ``processes * io_threads * page_threads * ocr_threads`` plus the
+server threads match the cores. ``auto_tune`` benchmarks a few splits on a sample folder
+and returns the fastest.
+
+Usage:
+    python executor_plan.py
+    python executor_plan.py --auto-tune Aadhars_input
+"""
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count, freeze_support
+
+THREAD_ENV = ('OMP_THREAD_LIMIT', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+              'OPENBLAS_NUM_THREADS')
+
+_thread_pool = None
+
+
+def available_cores():
+    """Cores this process may run on (affinity aware where supported)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return cpu_count()
+
+
+class ExecutionPlan:
+    """Split of the cores between processes and threads."""
+
+    def __init__(self, cores, processes, ocr_threads=1, torch_threads=1,
+                 io_threads=1, server_threads=0, page_threads=1, tile_threads=1):
+        """Initialize the plan.
+
+        Args:
+            cores (int): Cores the plan was made for.
+            processes (int): Worker processes.
+            ocr_threads (int): Tesseract/OpenCV threads per worker.
+            torch_threads (int): torch threads per worker.
+            io_threads (int): Files processed concurrently per worker.
+            server_threads (int): torch threads of the YOLO server, 0 when
+                there is no server.
+            page_threads (int): PDF pages masked concurrently per file.
+            tile_threads (int): Image tiles searched concurrently per file.
+        """
+        self.cores = cores
+        self.processes = processes
+        self.ocr_threads = ocr_threads
+        self.torch_threads = torch_threads
+        self.io_threads = io_threads
+        self.server_threads = server_threads
+        self.page_threads = page_threads
+        self.tile_threads = tile_threads
+
+    def worker_options(self):
+        """Thread settings handed to ``brut_new.init_worker``."""
+        return {'ocr_threads': self.ocr_threads,
+                'torch_threads': self.torch_threads,
+                'io_threads': self.io_threads,
+                'page_threads': self.page_threads,
+                'tile_threads': self.tile_threads}
+
+    def as_dict(self):
+        """Plan as a JSON serializable dictionary."""
+        return dict(vars(self))
+
+    def describe(self):
+        """One line summary of the plan."""
+        threads = (self.processes * self.io_threads * self.page_threads
+                   * self.ocr_threads + self.server_threads)
+        text = (f"{self.processes} processes x {self.io_threads} files x "
+                f"{self.page_threads} pages x {self.ocr_threads} OCR threads")
+        if self.server_threads:
+            text += f" + YOLO server with {self.server_threads} threads"
+        return f"{text} ({threads} threads on {self.cores} cores)"
+
+    def __repr__(self):
+        return f"ExecutionPlan({self.as_dict()})"
+
+
+def _server_threads(cores, yolo_server):
+    """Threads left to the YOLO server, a quarter of the cores (at most 4)."""
+    return min(4, max(1, cores // 4)) if yolo_server and cores > 2 else 0
+
+
+def make_plan(cores=None, processes=None, ocr_threads=None, io_threads=None,
+              yolo_server=True, page_workers=None, tile_workers=None):
+    """Build a plan that does not oversubscribe the cores.
+
+    Unset values are derived from the others: one worker per core and one
+    file per worker by default, since process level parallelism scales best
+    for independent files, and with a model server a quarter of the cores
+    (at most 4) is left to it. A single worker loads its own model. The
+    cores a file gets go to its PDF page threads first, then to its OCR
+    threads, so fewer workers than cores do not leave cores idle.
+
+    Args:
+        cores (int, optional): Cores to use, defaults to all available.
+        processes (int, optional): Worker processes.
+        ocr_threads (int, optional): Tesseract/OpenCV threads per worker.
+        io_threads (int, optional): Files processed concurrently per worker.
+        yolo_server (bool): Whether the workers share a YOLO server.
+        page_workers (int, optional): Most PDF page threads per file, e.g.
+            ``config['pdf_page_workers']``.
+        tile_workers (int, optional): Most image tile threads per file, e.g.
+            ``config['tile_workers']``.
+
+    Returns:
+        ExecutionPlan: The plan.
+    """
+    cores = max(1, cores or available_cores())
+    io_threads = max(1, io_threads or 1)
+    if processes is None:
+        worker_cores = max(1, cores - _server_threads(cores, yolo_server))
+        processes = max(1, worker_cores // ((ocr_threads or 1) * io_threads))
+    server_threads = _server_threads(cores, yolo_server) if processes > 1 else 0
+    # Cores of one file, known once the server is settled
+    share = max(1, (cores - server_threads) // (processes * io_threads))
+    if ocr_threads:
+        page_threads = min(page_workers or share, max(1, share // ocr_threads))
+    else:
+        page_threads = min(page_workers or share, share)
+        ocr_threads = max(1, share // page_threads)
+    tile_threads = min(tile_workers or share, max(1, share // ocr_threads))
+    # A local model per worker gets the OCR share of the cores
+    torch_threads = 1 if server_threads else ocr_threads
+    return ExecutionPlan(cores, processes, ocr_threads, torch_threads,
+                         io_threads, server_threads, page_threads, tile_threads)
+
+
+def limit_threads(ocr_threads=None, torch_threads=None):
+    """Pin the thread pools of the native libraries of this process.
+
+    The environment variables are read by OpenMP and BLAS when they are
+    loaded, so this must run before Tesseract or torch start; torch is only
+    reconfigured directly when it is already imported.
+
+    Args:
+        ocr_threads (int, optional): Tesseract OpenMP and OpenCV threads.
+        torch_threads (int, optional): torch intra-op threads.
+    """
+    if ocr_threads:
+        import cv2
+        os.environ['OMP_THREAD_LIMIT'] = str(ocr_threads)
+        cv2.setNumThreads(ocr_threads)
+    if torch_threads:
+        for name in THREAD_ENV[1:]:
+            os.environ[name] = str(torch_threads)
+        torch = sys.modules.get('torch')
+        if torch is not None:
+            torch.set_num_threads(torch_threads)
+
+
+def run_in_threads(fn, tasks, threads):
+    """Worker side of the thread mode: run a chunk of tasks concurrently.
+
+    The pool threads live as long as the worker process. The pipeline keeps
+    its OCR engine and processor per thread, and Tesseract releases the GIL
+    (or runs as a subprocess), so the threads overlap.
+
+    Args:
+        fn (callable): Task function.
+        tasks (list): Argument tuples.
+        threads (int): Pool size.
+
+    Returns:
+        list: Results in task order.
+    """
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=threads)
+    return list(_thread_pool.map(lambda args: fn(*args), tasks))
+
+
+def candidate_plans(cores=None, yolo_server=False):
+    """A few distinct core splits worth probing.
+
+    Args:
+        cores (int, optional): Cores to use.
+        yolo_server (bool): Whether the workers share a YOLO server.
+
+    Returns:
+        list: ExecutionPlan objects.
+    """
+    cores = max(1, cores or available_cores())
+    plans = []
+    seen = set()
+    for ocr_threads, io_threads in ((1, 1), (2, 1), (4, 1), (1, 2)):
+        if ocr_threads * io_threads > cores:
+            continue
+        plan = make_plan(cores, None, ocr_threads, io_threads, yolo_server)
+        key = (plan.processes, plan.ocr_threads, plan.io_threads, plan.page_threads)
+        if key not in seen:
+            seen.add(key)
+            plans.append(plan)
+    return plans
+
+
+def auto_tune(sample, cores=None, overrides=None):
+    """Benchmark the candidate plans on a sample folder.
+
+    The benchmark workers load their own model, so the plans are probed
+    without a YOLO server.
+
+    Args:
+        sample (str): Folder with a few representative inputs.
+        cores (int, optional): Cores to use.
+        overrides (dict, optional): Config overrides of the runs.
+
+    Returns:
+        tuple: (fastest ExecutionPlan, list of (plan, files/sec))
+    """
+    from benchmark import run_benchmark
+
+    results = []
+    for plan in candidate_plans(cores):
+        print(f"Probing {plan.describe()}")
+        report = run_benchmark(sample, None, 1, plan.processes, overrides,
+                               worker_options=plan.worker_options())
+        print(f"  {report['files_per_sec']:.2f} files/sec")
+        results.append((plan, report['files_per_sec']))
+    best = max(results, key=lambda r: r[1])[0]
+    return best, results
+
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    parser = argparse.ArgumentParser(description="Plan processes and threads.")
+    parser.add_argument('--cores', type=int, default=None)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--ocr-threads', type=int, default=None)
+    parser.add_argument('--io-threads', type=int, default=None)
+    parser.add_argument('--no-yolo-server', action='store_true')
+    parser.add_argument('--auto-tune', metavar='SAMPLE', default=None,
+                        help="Benchmark candidate splits on this folder")
+    parser.add_argument('--output', default=None, help="Write the plan as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+    if args.auto_tune:
+        plan, results = auto_tune(args.auto_tune, args.cores)
+        for candidate, rate in results:
+            print(f"{rate:8.2f} files/sec  {candidate.describe()}")
+    else:
+        plan = make_plan(args.cores, args.processes, args.ocr_threads,
+                         args.io_threads, not args.no_yolo_server)
+    print(f"Plan: {plan.describe()}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(plan.as_dict(), f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""This module contains the image geometry of the pipeline: exact quarter
+turns, deskewing, resizing and mapping mask boxes back onto the source image."""
+
+import math
+import cv2
+import numpy as np
+
+import metrics
+
+
+def estimate_skew(img, max_side=1000):
+    """Estimate the skew angle of the text lines of an image.
+
+    Canny and HoughLinesP run on a copy downscaled to ``max_side`` pixels,
+    the angle does not need full resolution.
+
+    Args:
+        img (numpy.ndarray): BGR or grayscale image.
+        max_side (int): Longest side of the analysed copy.
+
+    Returns:
+        float: Median angle in degrees of the near horizontal lines, 0 when
+        no line was found.
+    """
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    scale = min(1.0, max_side / max(gray.shape[:2]))
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale,
+                          interpolation=cv2.INTER_AREA)
+    # Canny Algorithm for edge detection was developed by John F. Canny not
+    # Kennedy!! :)
+    edges = cv2.Canny(gray, 100, 100, apertureSize=3)
+    min_length = max(20, int(100 * scale))
+    lines = cv2.HoughLinesP(edges, 1, math.pi / 180.0, min_length,
+                            minLineLength=min_length, maxLineGap=5)
+    if lines is None:
+        return 0.0
+
+    angles = []
+    for x1, y1, x2, y2 in lines.reshape(-1, 4):
+        angle = math.degrees(math.atan2(y2 - y1, x2 - x1))
+        if -45 < angle < 45:
+            angles.append(angle)
+    if not angles:
+        return 0.0
+    return float(np.median(angles))
+
+
+class Frame:
+    """An image together with the affine transform mapping source pixels onto it."""
+
+    def __init__(self, img, matrix=None):
+        """Initialize the frame.
+
+        Args:
+            img (numpy.ndarray): Image of the frame.
+            matrix (numpy.ndarray, optional): 3x3 transform from source to
+                frame coordinates, identity for the source itself.
+        """
+        self.img = img
+        self.matrix = np.eye(3) if matrix is None else matrix
+
+    def quarter_turn(self, k):
+        """Rotate anticlockwise by ``k`` quarter turns without resampling.
+
+        Args:
+            k (int): Number of quarter turns.
+
+        Returns:
+            Frame: The rotated frame.
+        """
+        k %= 4
+        if k == 0:
+            return self
+        img, matrix = self.img, self.matrix
+        for _ in range(k):
+            width = img.shape[1]
+            # (x, y) -> (y, width - x)
+            turn = np.array([[0, 1, 0], [-1, 0, width], [0, 0, 1]], dtype=float)
+            matrix = turn @ matrix
+            img = np.rot90(img)
+        # OpenCV and Tesseract need a contiguous buffer, this is a plain copy
+        return Frame(np.ascontiguousarray(img), matrix)
+
+    def scale(self, factor):
+        """Resize by a factor, area averaging when shrinking.
+
+        Args:
+            factor (float): Scale factor.
+
+        Returns:
+            Frame: The resized frame.
+        """
+        if abs(factor - 1) < 1e-3:
+            return self
+        height, width = self.img.shape[:2]
+        img = cv2.resize(self.img, None, fx=factor, fy=factor,
+                         interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC)
+        resize = np.diag([img.shape[1] / width, img.shape[0] / height, 1.0])
+        return Frame(img, resize @ self.matrix)
+
+    def rotate(self, angle, border=(255, 255, 255)):
+        """Rotate anticlockwise by an arbitrary angle with ``cv2.warpAffine``.
+
+        The canvas grows to keep the whole image.
+
+        Args:
+            angle (float): Angle in degrees.
+            border (tuple): Fill color of the uncovered corners.
+
+        Returns:
+            Frame: The rotated frame.
+        """
+        if abs(angle) < 1e-3:
+            return self
+        if angle % 90 == 0:
+            return self.quarter_turn(int(angle // 90))
+        height, width = self.img.shape[:2]
+        rot = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        cos, sin = abs(rot[0, 0]), abs(rot[0, 1])
+        new_width = int(math.ceil(height * sin + width * cos))
+        new_height = int(math.ceil(height * cos + width * sin))
+        rot[0, 2] += new_width / 2 - width / 2
+        rot[1, 2] += new_height / 2 - height / 2
+        img = cv2.warpAffine(self.img, rot, (new_width, new_height),
+                             flags=cv2.INTER_LINEAR,
+                             borderMode=cv2.BORDER_CONSTANT,
+                             borderValue=border)
+        return Frame(img, np.vstack([rot, [0, 0, 1]]) @ self.matrix)
+
+    def deskew(self, max_side=1000):
+        """Straighten the text lines using an angle estimated on a small copy.
+
+        Args:
+            max_side (int): Longest side used for the angle estimate.
+
+        Returns:
+            Frame: The deskewed frame.
+        """
+        angle = estimate_skew(self.img, max_side)
+        if angle:
+            metrics.incr('deskewed')
+        return self.rotate(angle)
+
+    def to_source(self, boxes):
+        """Map boxes of this frame onto the source image.
+
+        Args:
+            boxes (list): (x, y, w, h) boxes in frame coordinates.
+
+        Returns:
+            list: Four point polygons (int32 arrays) in source coordinates.
+        """
+        inverse = np.linalg.inv(self.matrix)
+        polygons = []
+        for x, y, w, h in boxes:
+            corners = np.array([[x, y, 1], [x + w, y, 1],
+                                [x + w, y + h, 1], [x, y + h, 1]], dtype=float)
+            mapped = (inverse @ corners.T).T[:, :2]
+            polygons.append(np.round(mapped).astype(np.int32))
+        return polygons
+
+
+def fill_polygons(img, polygons, color, copy=True):
+    """Paint filled polygons on a copy of an image.
+
+    Args:
+        img (numpy.ndarray): Source image.
+        polygons (list): int32 point arrays.
+        color (tuple): Fill color in BGR.
+        copy (bool): Paint a copy, False paints the image itself, which
+            saves a full size copy when the source is not needed any more.
+
+    Returns:
+        numpy.ndarray: Painted image.
+    """
+    if copy:
+        img = img.copy()
+    if polygons:
+        cv2.fillPoly(img, polygons, color)
+    return img
@@ -0,0 +1,108 @@
+"""This module contains helpers to decode and encode images in memory."""
+
+import os
+import io
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def decode_image(data):
+    """Decode an encoded image buffer into a BGR array.
+
+    Args:
+        data (bytes): Encoded image bytes (PNG, JPEG, BMP, TIFF, GIF ...).
+
+    Returns:
+        numpy.ndarray: Decoded BGR image.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        # OpenCV has no GIF decoder, let PIL handle the odd formats
+        img = pil_to_bgr(Image.open(io.BytesIO(data)))
+    return img
+
+
+def read_bytes(path):
+    """Read the raw bytes of a file.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        bytes: File contents.
+    """
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def read_image(path):
+    """Read an image from disk into a BGR array with a single file read.
+
+    Args:
+        path (str): Path to the image file.
+
+    Returns:
+        numpy.ndarray: Decoded BGR image.
+    """
+    return decode_image(read_bytes(path))
+
+
+def encode_image(img, ext):
+    """Encode a BGR array into the given file format.
+
+    Args:
+        img (numpy.ndarray): BGR image.
+        ext (str): Target extension, e.g. '.png' or '.pdf'.
+
+    Returns:
+        bytes: Encoded image.
+    """
+    ext = ext.lower()
+    if ext != '.pdf':
+        ok, buf = cv2.imencode(ext, img)
+        if ok:
+            return buf.tobytes()
+    out = io.BytesIO()
+    fmt = 'PDF' if ext == '.pdf' else Image.registered_extensions().get(ext, 'PNG')
+    bgr_to_pil(img).save(out, fmt)
+    return out.getvalue()
+
+
+def write_image(img, path):
+    """Encode a BGR array and write it to disk with a single file write.
+
+    Args:
+        img (numpy.ndarray): BGR image.
+        path (str): Output path, the extension selects the format.
+    """
+    data = encode_image(img, os.path.splitext(path)[1])
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def pil_to_bgr(img):
+    """Convert a PIL image to a BGR array.
+
+    Args:
+        img (PIL.Image): Input image.
+
+    Returns:
+        numpy.ndarray: BGR image.
+    """
+    return cv2.cvtColor(np.array(img.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+def bgr_to_pil(img):
+    """Convert a BGR (or grayscale) array to a PIL image.
+
+    Args:
+        img (numpy.ndarray): Input image.
+
+    Returns:
+        PIL.Image: RGB image.
+    """
+    if img.ndim == 2:
+        return Image.fromarray(img)
+    return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
@@ -0,0 +1,239 @@
+"""This module contains the instrumentation of the pipeline: timing spans,
+counters, a JSON-lines trace and a Prometheus text export.
+
+Stages wrap their work in ``span(name)`` (or decorate a function with
+``timed(name)``) and count events with ``incr(name)``. Totals are kept per
+process; pool workers hand their ``snapshot(reset=True)`` back with every
+task result and the parent process ``merge``s them, so the exported totals
+cover the whole batch.
+
+Instrumentation is off unless ``configure(enabled=True)`` is called or the
+``AADHAAR_METRICS`` environment variable is set to 1. When it is off a span
+is a shared no-op context manager and a counter is a single flag check.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+from contextlib import nullcontext
+from collections import defaultdict
+
+ENABLED = os.getenv("AADHAAR_METRICS") == "1"
+TRACE_PATH = None
+
+_lock = threading.Lock()
+_NULL_SPAN = nullcontext()
+_trace_buffer = []
+TRACE_FLUSH_EVERY = 256
+
+TIMINGS = defaultdict(float)  # span name -> total seconds
+CALLS = defaultdict(int)  # span name -> number of spans
+COUNTERS = defaultdict(int)  # counter name -> value
+
+
+def configure(enabled=True, trace_path=None):
+    """Switch instrumentation on or off for this process.
+
+    Args:
+        enabled (bool): Record spans and counters.
+        trace_path (str, optional): JSON-lines file every finished span is
+            appended to, shared by all processes of a batch.
+    """
+    global ENABLED, TRACE_PATH
+    flush_trace()
+    ENABLED = enabled
+    TRACE_PATH = trace_path if enabled else None
+
+
+class _Span:
+    """Context manager timing one span."""
+
+    __slots__ = ('name', 'attrs', 'start', 'wall')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            TIMINGS[self.name] += elapsed
+            CALLS[self.name] += 1
+            if TRACE_PATH:
+                event = {'ts': self.wall, 'pid': os.getpid(),
+                         'thread': threading.get_ident(),
+                         'span': self.name, 'dur': elapsed}
+                if self.attrs:
+                    event.update(self.attrs)
+                _trace_buffer.append(json.dumps(event, default=str))
+                if len(_trace_buffer) >= TRACE_FLUSH_EVERY:
+                    _flush_locked()
+        return False
+
+
+def span(name, **attrs):
+    """Time a block of code under the given stage name.
+
+    Args:
+        name (str): Stage name.
+        **attrs: Extra fields of the trace event, e.g. ``file=...``.
+
+    Returns:
+        Context manager.
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name, attrs)
+
+
+def timed(name):
+    """Decorator timing every call of a function as a span.
+
+    Args:
+        name (str): Stage name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Span(name, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def incr(name, value=1):
+    """Increase a counter.
+
+    Args:
+        name (str): Counter name.
+        value (int): Amount to add.
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        COUNTERS[name] += value
+
+
+def snapshot(reset=False):
+    """Return a copy of the current totals.
+
+    Args:
+        reset (bool): Clear the totals after copying them, so consecutive
+            snapshots are deltas that can be merged without double counting.
+
+    Returns:
+        dict: ``timings``, ``calls`` and ``counters`` dictionaries.
+    """
+    with _lock:
+        snap = {
+            'timings': dict(TIMINGS),
+            'calls': dict(CALLS),
+            'counters': dict(COUNTERS)
+        }
+        if reset:
+            TIMINGS.clear()
+            CALLS.clear()
+            COUNTERS.clear()
+        if TRACE_PATH:
+            _flush_locked()
+    return snap
+
+
+def merge(snap):
+    """Add a snapshot of another process to the totals of this one.
+
+    Args:
+        snap (dict): Result of ``snapshot``.
+    """
+    if not snap:
+        return
+    with _lock:
+        for name, seconds in snap['timings'].items():
+            TIMINGS[name] += seconds
+        for name, count in snap['calls'].items():
+            CALLS[name] += count
+        for name, value in snap['counters'].items():
+            COUNTERS[name] += value
+
+
+def reset():
+    """Clear all totals of this process."""
+    with _lock:
+        TIMINGS.clear()
+        CALLS.clear()
+        COUNTERS.clear()
+
+
+def _flush_locked():
+    if not _trace_buffer or not TRACE_PATH:
+        _trace_buffer.clear()
+        return
+    # One append per flush, lines from concurrent processes do not interleave
+    with open(TRACE_PATH, 'a') as f:
+        f.write('\n'.join(_trace_buffer) + '\n')
+    _trace_buffer.clear()
+
+
+def flush_trace():
+    """Write the buffered trace events of this process."""
+    with _lock:
+        _flush_locked()
+
+
+atexit.register(flush_trace)
+
+
+def _metric_name(name):
+    return ''.join(c if c.isalnum() else '_' for c in name).lower()
+
+
+def prometheus_text(prefix='aadhaar'):
+    """Format the totals in the Prometheus text exposition format.
+
+    Args:
+        prefix (str): Metric name prefix.
+
+    Returns:
+        str: Exposition text.
+    """
+    snap = snapshot()
+    lines = [
+        f"# HELP {prefix}_stage_seconds_total Time spent per pipeline stage.",
+        f"# TYPE {prefix}_stage_seconds_total counter"
+    ]
+    for name, seconds in sorted(snap['timings'].items()):
+        lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {seconds:.6f}')
+    lines += [
+        f"# HELP {prefix}_stage_calls_total Number of spans per pipeline stage.",
+        f"# TYPE {prefix}_stage_calls_total counter"
+    ]
+    for name, count in sorted(snap['calls'].items()):
+        lines.append(f'{prefix}_stage_calls_total{{stage="{name}"}} {count}')
+    for name, value in sorted(snap['counters'].items()):
+        metric = f"{prefix}_{_metric_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, prefix='aadhaar'):
+    """Write the totals to a Prometheus text file (node exporter textfile style).
+
+    Args:
+        path (str): Output file, replaced atomically.
+        prefix (str): Metric name prefix.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(prometheus_text(prefix))
+    os.replace(tmp, path)
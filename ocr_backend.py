@@ -0,0 +1,279 @@
+"""This module contains the OCR engines used by AadhaarCard.
+
+Two backends are available:
+
+* ``tesserocr`` talks to the Tesseract C-API in-process. The language model
+  is loaded once per engine and numpy buffers are handed over directly.
+* ``pytesseract`` spawns the tesseract binary for every call and is kept as
+  the fallback when tesserocr is not installed.
+
+Engines are long lived and cached per worker thread, since a Tesseract API
+handle must not be shared between threads.
+"""
+
+import os
+import shutil
+import threading
+import cv2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WINDOWS_TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+_local = threading.local()
+
+
+def resolve_tesseract_cmd(config=None):
+    """Find the tesseract binary used by the pytesseract backend.
+
+    The lookup order is ``config['tesseract_cmd']``, the ``TESSERACT_PATH``
+    environment variable (or ``.env`` entry), the ``PATH`` and finally the
+    default Windows install location.
+
+    Args:
+        config (dict, optional): Processing configuration.
+
+    Returns:
+        str: Path or name of the tesseract executable.
+    """
+    if config and config.get('tesseract_cmd'):
+        return config['tesseract_cmd']
+    env_path = os.getenv("TESSERACT_PATH")
+    if env_path and os.path.isfile(env_path):
+        return env_path
+    found = shutil.which("tesseract")
+    if found:
+        return found
+    if os.path.isfile(WINDOWS_TESSERACT_PATH):
+        return WINDOWS_TESSERACT_PATH
+    return "tesseract"
+
+
+class PytesseractBackend:
+    """OCR backend running the tesseract binary through pytesseract."""
+
+    name = 'pytesseract'
+
+    def __init__(self, lang='eng', oem=3, tesseract_cmd=None):
+        """Initialize the backend.
+
+        Args:
+            lang (str): Tesseract language.
+            oem (int): Tesseract OCR engine mode.
+            tesseract_cmd (str, optional): Path to the tesseract binary.
+        """
+        import pytesseract
+        self._pytesseract = pytesseract
+        self.lang = lang
+        self.oem = oem
+        if tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    def _config(self, psm):
+        return f'-l {self.lang} --oem {self.oem} --psm {psm}'
+
+    def image_to_string(self, img, psm):
+        """Extract text from an image.
+
+        Args:
+            img (numpy.ndarray): Input image.
+            psm (int): Tesseract PSM mode.
+
+        Returns:
+            str: Extracted text.
+        """
+        return self._pytesseract.image_to_string(
+            img, lang=self.lang, config=self._config(psm))
+
+    def image_to_data(self, img, psm):
+        """Extract the word table of an image.
+
+        Args:
+            img (numpy.ndarray): Input image.
+            psm (int): Tesseract PSM mode.
+
+        Returns:
+            dict: Dictionary containing text bounding box data.
+        """
+        return self._pytesseract.image_to_data(
+            img, lang=self.lang, output_type=self._pytesseract.Output.DICT,
+            config=self._config(psm))
+
+    def detect_orientation(self, img):
+        """Run Tesseract orientation and script detection.
+
+        Args:
+            img (numpy.ndarray): Input image.
+
+        Returns:
+            tuple | None: (clockwise rotation in degrees that makes the text
+            upright, confidence), or None when OSD could not decide.
+        """
+        try:
+            osd = self._pytesseract.image_to_osd(
+                img, config='--psm 0',
+                output_type=self._pytesseract.Output.DICT)
+        except self._pytesseract.TesseractError:
+            return None
+        return int(osd['rotate']) % 360, float(osd['orientation_conf'])
+
+
+class TesserocrBackend:
+    """OCR backend keeping one Tesseract API handle loaded in-process."""
+
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng', oem=3, tessdata=None):
+        """Initialize the backend and load the language model.
+
+        Args:
+            lang (str): Tesseract language.
+            oem (int): Tesseract OCR engine mode.
+            tessdata (str, optional): Path to the tessdata folder.
+        """
+        import tesserocr
+        self._tesserocr = tesserocr
+        kwargs = {'lang': lang, 'oem': oem}
+        if tessdata:
+            kwargs['path'] = tessdata
+        self.api = tesserocr.PyTessBaseAPI(**kwargs)
+        self._osd_kwargs = dict(kwargs, lang='osd', psm=tesserocr.PSM.OSD_ONLY)
+        self._osd_api = None
+
+    def _set_image(self, img, psm):
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        img = img if img.flags['C_CONTIGUOUS'] else img.copy()
+        height, width = img.shape[:2]
+        bpp = 1 if img.ndim == 2 else img.shape[2]
+        self.api.SetPageSegMode(psm)
+        self.api.SetImageBytes(img.tobytes(), width, height, bpp, width * bpp)
+
+    def image_to_string(self, img, psm):
+        """Extract text from an image.
+
+        Args:
+            img (numpy.ndarray): Input image.
+            psm (int): Tesseract PSM mode.
+
+        Returns:
+            str: Extracted text.
+        """
+        self._set_image(img, psm)
+        return self.api.GetUTF8Text()
+
+    def image_to_data(self, img, psm):
+        """Extract the word table of an image in pytesseract's DICT layout.
+
+        Args:
+            img (numpy.ndarray): Input image.
+            psm (int): Tesseract PSM mode.
+
+        Returns:
+            dict: Dictionary containing text bounding box data.
+        """
+        ril = self._tesserocr.RIL
+        keys = ('level', 'page_num', 'block_num', 'par_num', 'line_num',
+                'word_num', 'left', 'top', 'width', 'height', 'conf', 'text')
+        d = {key: [] for key in keys}
+
+        self._set_image(img, psm)
+        self.api.Recognize()
+        iterator = self.api.GetIterator()
+        if iterator is None:
+            return d
+
+        block = par = line = word = 0
+        for r in self._tesserocr.iterate_level(iterator, ril.WORD):
+            if r.IsAtBeginningOf(ril.BLOCK):
+                block, par, line, word = block + 1, 0, 0, 0
+            if r.IsAtBeginningOf(ril.PARA):
+                par, line, word = par + 1, 0, 0
+            if r.IsAtBeginningOf(ril.TEXTLINE):
+                line, word = line + 1, 0
+            word += 1
+            box = r.BoundingBox(ril.WORD)
+            if box is None:
+                continue
+            x1, y1, x2, y2 = box
+            values = (5, 1, block, par, line, word, x1, y1, x2 - x1,
+                      y2 - y1, r.Confidence(ril.WORD),
+                      r.GetUTF8Text(ril.WORD) or '')
+            for key, value in zip(keys, values):
+                d[key].append(value)
+        return d
+
+    def detect_orientation(self, img):
+        """Run Tesseract orientation and script detection.
+
+        Args:
+            img (numpy.ndarray): Input image.
+
+        Returns:
+            tuple | None: (clockwise rotation in degrees that makes the text
+            upright, confidence), or None when OSD could not decide.
+        """
+        if self._osd_api is None:
+            try:
+                self._osd_api = self._tesserocr.PyTessBaseAPI(**self._osd_kwargs)
+            except RuntimeError:
+                # osd.traineddata is not installed
+                self._osd_api = False
+        if not self._osd_api:
+            return None
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        img = img if img.flags['C_CONTIGUOUS'] else img.copy()
+        height, width = img.shape[:2]
+        self._osd_api.SetImageBytes(img.tobytes(), width, height, 1, width)
+        osd = self._osd_api.DetectOrientationScript()
+        if not osd:
+            return None
+        return (360 - osd['orient_deg']) % 360, float(osd['orient_conf'])
+
+
+def create_backend(config):
+    """Create a new OCR engine for the configured backend.
+
+    ``config['ocr_backend']`` is one of ``'auto'`` (tesserocr when it is
+    installed, pytesseract otherwise), ``'tesserocr'`` or ``'pytesseract'``.
+
+    Args:
+        config (dict): Processing configuration.
+
+    Returns:
+        TesserocrBackend | PytesseractBackend: OCR engine.
+    """
+    name = config.get('ocr_backend', 'auto')
+    lang = config.get('ocr_lang', 'eng')
+    oem = config.get('ocr_oem', 3)
+    if name in ('auto', 'tesserocr'):
+        try:
+            return TesserocrBackend(lang, oem, config.get('tessdata'))
+        except (ImportError, RuntimeError):
+            if name == 'tesserocr':
+                raise
+    elif name != 'pytesseract':
+        raise ValueError(f"Unknown OCR backend: {name}")
+    return PytesseractBackend(lang, oem, resolve_tesseract_cmd(config))
+
+
+def get_backend(config):
+    """Return the long-lived OCR engine of the current worker thread.
+
+    Args:
+        config (dict): Processing configuration.
+
+    Returns:
+        TesserocrBackend | PytesseractBackend: OCR engine.
+    """
+    engines = getattr(_local, 'engines', None)
+    if engines is None:
+        engines = _local.engines = {}
+    key = (config.get('ocr_backend', 'auto'), config.get('ocr_lang', 'eng'),
+           config.get('ocr_oem', 3), config.get('tessdata'),
+           config.get('tesseract_cmd'))
+    if key not in engines:
+        engines[key] = create_backend(config)
+    return engines[key]
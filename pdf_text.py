@@ -0,0 +1,211 @@
+"""This module contains the text-layer route for PDFs, using the optional
+PyMuPDF package (``fitz``).
+
+Born-digital PDFs such as e-Aadhaar downloads carry their text with
+coordinates, so the Aadhaar numbers are found from the embedded words and
+checked with Verhoeff without rasterizing or running OCR. The numbers are
+removed with real PDF redactions: the text under them is deleted and a
+filled box is painted, and the rest of the document stays vector and
+searchable. Pages without a usable text layer (scans) are rendered and
+searched with the raster pipeline, a window of pages at a time on a thread
+pool like ``brut_new.multi_page_pdf``, and their image pixels under the
+mask boxes are blanked the same way.
+
+Without PyMuPDF ``available()`` is False and callers keep using pdf2image.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import verhoeff
+import metrics
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz  # PyMuPDF before 1.24
+    except ImportError:  # Optional, the raster route is used instead
+        fitz = None
+
+# Words needed on a page before its text layer is trusted
+MIN_WORDS = 5
+
+
+def available():
+    """True when PyMuPDF can be imported."""
+    return fitz is not None
+
+
+def open_document(path=None, data=None):
+    """Open a PDF from a path or from bytes.
+
+    Args:
+        path (str, optional): PDF file.
+        data (bytes, optional): PDF content.
+
+    Returns:
+        fitz.Document: The document.
+    """
+    if data is not None:
+        return fitz.open(stream=data, filetype='pdf')
+    return fitz.open(path)
+
+
+def text_uid_rects(page):
+    """Find the checksum valid Aadhaar numbers in a page's text layer.
+
+    Args:
+        page (fitz.Page): Page.
+
+    Returns:
+        list | None: fitz.Rect per number occurrence, None when the page has
+        no usable text layer.
+    """
+    words = page.get_text('words')
+    if len(words) < MIN_WORDS:
+        return None
+    tokens = [w[4].strip() for w in words]
+    lines = [(w[5], w[6]) for w in words]
+    rects = []
+    for window in verhoeff.candidate_uids(tokens, lines):
+        rect = fitz.Rect(words[window.start][:4])
+        for w in words[window.start + 1:window.end]:
+            rect |= fitz.Rect(w[:4])
+        rects.append(rect)
+    return rects
+
+
+def page_image(page, dpi):
+    """Render a page to a BGR array.
+
+    Args:
+        page (fitz.Page): Page.
+        dpi (int): Resolution.
+
+    Returns:
+        tuple: (BGR image, matrix mapping page points onto its pixels)
+    """
+    matrix = fitz.Matrix(dpi / 72, dpi / 72)
+    pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csRGB, alpha=False)
+    rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+    return np.ascontiguousarray(rgb[:, :, ::-1]), matrix
+
+
+def polygon_rects(page, polygons, matrix):
+    """Map the mask polygons of a rendered page onto the page.
+
+    Args:
+        page (fitz.Page): Page.
+        polygons (list): Polygons in pixels of the rendered page.
+        matrix (fitz.Matrix): Matrix returned by ``page_image``.
+
+    Returns:
+        list: fitz.Rect per polygon, in page coordinates.
+    """
+    # Pixels -> rotated page -> unrotated page, the space of the annotations
+    inverse = ~matrix * page.derotation_matrix
+    rects = []
+    for polygon in polygons:
+        xs, ys = polygon[:, 0], polygon[:, 1]
+        rects.append(fitz.Rect(float(xs.min()), float(ys.min()),
+                               float(xs.max()), float(ys.max())) * inverse)
+    return rects
+
+
+def redact_document(doc, find, dpi=120, color=(0, 0, 0), workers=1, window=4):
+    """Redact the Aadhaar numbers of every page of a document in place.
+
+    Text pages are searched through their text layer. Pages without text,
+    and text pages without a number that carry images (a scan pasted into
+    a document), go through the raster pipeline: PyMuPDF is not thread
+    safe, so they are rendered here ``window`` pages at a time and only
+    the search runs on ``workers`` threads.
+
+    Args:
+        doc (fitz.Document): Open document, modified in place.
+        find (callable): Search of a BGR image returning (polygons,
+            detected flag), e.g. ``brut_new.find_mask_polygons``.
+        dpi (int): Render resolution of the raster route.
+        color (tuple): Mask color in BGR.
+        workers (int): Raster pages searched in parallel.
+        window (int): Raster pages rendered at a time.
+
+    Returns:
+        tuple: (True if an Aadhaar number was found, list of
+        ``{'page', 'polygons', 'route'}`` dicts in PDF points)
+    """
+    fill = tuple(c / 255 for c in color[::-1])
+    detected = False
+    found = {}
+    raster = []
+    for number, page in enumerate(doc, start=1):
+        with metrics.span('pdf_text'):
+            rects = text_uid_rects(page)
+        if rects is None or (not rects and page.get_images()):
+            raster.append(number)
+        else:
+            found[number] = ('text', rects)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for start in range(0, len(raster), window):
+            numbers = raster[start:start + window]
+            rendered = []
+            for number in numbers:
+                with metrics.span('decode'):
+                    rendered.append(page_image(doc[number - 1], dpi))
+            results = pool.map(find, [img for img, _ in rendered])
+            for number, (_, matrix), (polygons, page_detected) in zip(
+                    numbers, rendered, results):
+                detected = detected or page_detected
+                found[number] = ('raster', polygon_rects(doc[number - 1], polygons, matrix))
+            del rendered
+
+    boxes = []
+    for number in sorted(found):
+        route, rects = found[number]
+        metrics.incr(f'pdf_pages_{route}')
+        if not rects:
+            continue
+        page = doc[number - 1]
+        detected = True
+        for rect in rects:
+            page.add_redact_annot(rect, fill=fill)
+        with metrics.span('mask'):
+            # Delete the covered text and blank the covered image pixels
+            page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_PIXELS)
+        boxes.append({'page': number, 'route': route,
+                      'polygons': [[[r.x0, r.y0], [r.x1, r.y0], [r.x1, r.y1], [r.x0, r.y1]]
+                                   for r in rects]})
+    return detected, boxes
+
+
+def redact_pdf(find, path=None, data=None, savename=None, dpi=120, color=(0, 0, 0),
+               workers=1, window=4):
+    """Redact a PDF file or PDF bytes.
+
+    Args:
+        find (callable): Raster search for pages without a text layer.
+        path (str, optional): Input PDF.
+        data (bytes, optional): Input PDF content, instead of ``path``.
+        savename (str, optional): Output PDF, the bytes are returned when
+            not given.
+        dpi (int): Render resolution of the raster route.
+        color (tuple): Mask color in BGR.
+        workers (int): Raster pages searched in parallel.
+        window (int): Raster pages rendered at a time.
+
+    Returns:
+        tuple: (detected flag, boxes, output bytes or None)
+    """
+    with open_document(path, data) as doc:
+        detected, boxes = redact_document(doc, find, dpi, color, workers, window)
+        output = None
+        if detected:
+            with metrics.span('encode'):
+                if savename:
+                    doc.save(savename, garbage=3, deflate=True)
+                else:
+                    output = doc.tobytes(garbage=3, deflate=True)
+    return detected, boxes, output
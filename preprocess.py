@@ -0,0 +1,93 @@
+"""This module contains the shared OCR preprocessing: grayscale and Otsu
+threshold computed once per image, the two contrast variants derived from
+them, and the resolution normalization applied before OCR."""
+
+import cv2
+import numpy as np
+
+
+class Preprocessed:
+    """Grayscale image and Otsu threshold of one image, with its contrast variants."""
+
+    def __init__(self, img):
+        """Convert the image and compute its Otsu threshold.
+
+        Args:
+            img (numpy.ndarray): BGR or grayscale image.
+        """
+        self.source = img
+        self.gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        self.threshold = cv2.threshold(
+            self.gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[0]
+        self._trunc = None
+        self._binary = None
+
+    @property
+    def trunc(self):
+        """Truncated contrast variant, same as ``THRESH_TRUNC | THRESH_OTSU``."""
+        if self._trunc is None:
+            self._trunc = cv2.threshold(
+                self.gray, self.threshold, 255, cv2.THRESH_TRUNC)[1]
+        return self._trunc
+
+    @property
+    def binary(self):
+        """Binary contrast variant, same as ``THRESH_BINARY | THRESH_OTSU``."""
+        if self._binary is None:
+            self._binary = cv2.threshold(
+                self.gray, self.threshold, 255, cv2.THRESH_BINARY)[1]
+        return self._binary
+
+
+def estimate_text_height(img, max_side=1000):
+    """Estimate the character height of an image in pixels.
+
+    Characters are the connected components of the inverted Otsu image of a
+    downscaled copy. The longer side of a component is used so the estimate
+    does not depend on the quarter turn of the image.
+
+    Args:
+        img (numpy.ndarray): BGR or grayscale image.
+        max_side (int): Longest side of the analysed copy.
+
+    Returns:
+        float | None: Median character height at full resolution, None when
+        no character sized component was found.
+    """
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    scale = min(1.0, max_side / max(gray.shape[:2]))
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale,
+                          interpolation=cv2.INTER_AREA)
+    ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    width, height, area = (stats[1:, cv2.CC_STAT_WIDTH],
+                           stats[1:, cv2.CC_STAT_HEIGHT],
+                           stats[1:, cv2.CC_STAT_AREA])
+    side = np.maximum(width, height)
+    limit = 0.1 * max(gray.shape[:2])
+    # Drop specks, rules, photos and frames
+    chars = side[(side >= 4) & (side <= limit) & (area >= 6)
+                 & (area <= 0.9 * width * height)]
+    if count < 2 or chars.size < 10:
+        return None
+    return float(np.median(chars)) / scale
+
+
+def normalization_scale(img, text_height=30, min_scale=0.25, max_scale=2.0):
+    """Scale factor bringing the characters of an image to the OCR target height.
+
+    Args:
+        img (numpy.ndarray): BGR or grayscale image.
+        text_height (int): Target character height in pixels.
+        min_scale (float): Smallest allowed factor.
+        max_scale (float): Largest allowed factor.
+
+    Returns:
+        float: Factor to resize the image by, 1.0 when the text height
+        cannot be estimated or is already within 20% of the target.
+    """
+    height = estimate_text_height(img)
+    if not height or 0.8 <= text_height / height <= 1.25:
+        return 1.0
+    return float(np.clip(text_height / height, min_scale, max_scale))
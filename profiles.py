@@ -0,0 +1,271 @@
+"""
+Speed/recall profiles of the masking pipeline and a tuner choosing one.
+
+A profile is a set of ``brut_new.config`` overrides fixing how much search
+is done per card: the Tesseract page segmentation modes, the contrast
+modes, the number of rotations, the OCR resolution (``text_height``, and
+``pdf_dpi`` for PDFs), the detector-first cascade and the YOLO fallback.
+Every page mode, contrast mode and rotation is a full page OCR pass, so
+``fast`` does about one pass per card where the default config may do 24.
+
+The tuner runs a grid of these settings over a labelled corpus
+(``Aadhars_input`` with the references of ``Aadhars_output``), measures the
+CPU cost and the recall of every configuration with ``benchmark`` and
+reports the cheapest one reaching a target recall. Its output file can be
+used as a profile.
+
+Usage:
+    python redact.py --input scans/ --output masked/ --profile fast
+    python profiles.py --target-recall 0.95 --output tuned.json
+    python redact.py --input scans/ --output masked/ --profile tuned.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import itertools
+from multiprocessing import freeze_support
+
+PROFILES = {
+    'fast': {
+        'psm': [6],
+        'contrast_modes': [1],
+        'rotations': 1,
+        'early_exit': True,
+        'normalize': True,
+        'text_height': 20,
+        'cascade': True,
+        'roi_psm': [7],
+        'yolo_fallback': True,
+        'pdf_dpi': 100
+    },
+    'balanced': {
+        'psm': [4, 6],
+        'contrast_modes': [0, 1],
+        'rotations': 4,
+        'early_exit': True,
+        'normalize': True,
+        'text_height': 24,
+        'cascade': True,
+        'roi_psm': [7, 6],
+        'yolo_fallback': True,
+        'pdf_dpi': 120
+    },
+    'thorough': {
+        'psm': [3, 4, 6],
+        'contrast_modes': [0, 1],
+        'rotations': 4,
+        'early_exit': False,
+        'normalize': True,
+        'text_height': 32,
+        'cascade': False,
+        'yolo_fallback': True,
+        'pdf_dpi': 200
+    }
+}
+
+# Grid searched by the tuner, values are tried in every combination
+SEARCH_SPACE = {
+    'psm': [[6], [4, 6], [3, 6], [3, 4, 6]],
+    'contrast_modes': [[1], [0, 1]],
+    'rotations': [1, 4],
+    'text_height': [24],
+    'cascade': [True, False],
+    'yolo_fallback': [True]
+}
+
+# A reference card counts as covered when this share of its masked pixels is masked
+CARD_RECALL = 0.9
+
+
+def load_profile(profile):
+    """Config overrides of a named profile or of a JSON file.
+
+    Args:
+        profile (str | dict): 'fast', 'balanced', 'thorough', a JSON file
+            of overrides (e.g. written by the tuner) or the overrides.
+
+    Returns:
+        dict: Config overrides.
+    """
+    if isinstance(profile, dict):
+        return dict(profile)
+    if profile in PROFILES:
+        return dict(PROFILES[profile])
+    if os.path.isfile(profile):
+        with open(profile) as f:
+            overrides = json.load(f)
+        if 'runs' in overrides:  # Tuner report, the winner is under 'best'
+            if overrides['best'] is None:
+                raise ValueError(f"{profile}: no configuration reached the target recall")
+            return dict(overrides['best'])
+        return overrides
+    raise ValueError(f"Unknown profile: {profile} (expected one of "
+                     f"{', '.join(PROFILES)} or a JSON file)")
+
+
+def apply_profile(profile, config):
+    """Update a config in place with a profile.
+
+    Args:
+        profile (str | dict): See ``load_profile``.
+        config (dict): Config to update, usually ``brut_new.config``.
+
+    Returns:
+        dict: The updated config.
+    """
+    config.update(load_profile(profile))
+    return config
+
+
+def estimated_cost(overrides, config=None):
+    """Relative OCR work of a configuration, used to order the tuner runs.
+
+    Args:
+        overrides (dict): Config overrides.
+        config (dict, optional): Base config supplying the missing keys.
+
+    Returns:
+        float: Page OCR passes per card, weighted by the pixel count.
+    """
+    settings = dict(config or {}, **overrides)
+    passes = (len(settings.get('psm', [3, 4, 6]))
+              * len(settings.get('contrast_modes', [0, 1]))
+              * settings.get('rotations', 4))
+    return passes * (settings.get('text_height', 24) / 24) ** 2
+
+
+def search_grid(space):
+    """All the configurations of a search space, cheapest estimate first.
+
+    Args:
+        space (dict): Config key -> list of values.
+
+    Returns:
+        list: Config overrides.
+    """
+    keys = list(space)
+    grid = [dict(zip(keys, values))
+            for values in itertools.product(*(space[key] for key in keys))]
+    return sorted(grid, key=estimated_cost)
+
+
+def score(report, card_recall=CARD_RECALL):
+    """Cost and recall of a benchmark run.
+
+    Args:
+        report (dict): ``benchmark.run_benchmark`` report.
+        card_recall (float): Pixel recall a card needs to count as covered.
+
+    Returns:
+        dict: ``seconds_per_card`` (mean latency), ``tesseract_calls_per_card``,
+        ``recall`` (share of covered reference cards), ``mean_recall`` and
+        ``failed``.
+    """
+    cards = [a for a in report['accuracy']['per_card'] if a.get('recall') is not None]
+    covered = sum(a['recall'] >= card_recall for a in cards)
+    return {
+        'seconds_per_card': report['latency']['mean'],
+        'tesseract_calls_per_card': report['tesseract_calls_per_card'],
+        'recall': covered / len(cards) if cards else None,
+        'mean_recall': report['accuracy']['mean_recall'],
+        'failed': report['failed']
+    }
+
+
+def tune(corpus, reference_dir, target_recall=0.95, space=None, workers=None,
+         max_runs=None, card_recall=CARD_RECALL):
+    """Find the cheapest configuration reaching a target recall.
+
+    Args:
+        corpus (str): Folder with the input cards.
+        reference_dir (str): Folder with their masked references.
+        target_recall (float): Share of the reference cards that must be
+            covered.
+        space (dict, optional): Search space, defaults to ``SEARCH_SPACE``.
+        workers (int, optional): Worker processes of the benchmark runs.
+        max_runs (int, optional): Stop after this many configurations, the
+            grid is run cheapest estimate first.
+        card_recall (float): Pixel recall a card needs to count as covered.
+
+    Returns:
+        dict: ``best`` overrides (None when no configuration reaches the
+        target), ``target_recall`` and the ``runs`` with their scores.
+    """
+    from benchmark import run_benchmark
+
+    grid = search_grid(space or SEARCH_SPACE)[:max_runs]
+    runs = []
+    for i, overrides in enumerate(grid, start=1):
+        print(f"[{i}/{len(grid)}] {json.dumps(overrides)}")
+        result = score(run_benchmark(corpus, reference_dir, 1, workers, overrides),
+                       card_recall)
+        print(f"  {result['seconds_per_card']:.2f}s/card, "
+              f"{result['tesseract_calls_per_card']:.1f} Tesseract calls/card, "
+              f"recall {result['recall']}")
+        runs.append({'overrides': overrides, **result})
+
+    passing = [run for run in runs
+               if run['recall'] is not None and run['recall'] >= target_recall
+               and not run['failed']]
+    best = min(passing, key=lambda run: (run['seconds_per_card'],
+                                         run['tesseract_calls_per_card']), default=None)
+    return {'best': best['overrides'] if best else None,
+            'target_recall': target_recall,
+            'runs': runs}
+
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Find the cheapest pipeline configuration reaching a recall target.")
+    parser.add_argument('--corpus', default=os.path.join(here, 'Aadhars_input'))
+    parser.add_argument('--reference', default=os.path.join(here, 'Aadhars_output'))
+    parser.add_argument('--target-recall', type=float, default=0.95,
+                        help="Share of the reference cards to cover (default: 0.95)")
+    parser.add_argument('--card-recall', type=float, default=CARD_RECALL,
+                        help="Masked pixel share for a card to count as covered")
+    parser.add_argument('--space', default=None,
+                        help="JSON file with the search space (default: SEARCH_SPACE)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-runs', type=int, default=None)
+    parser.add_argument('--output', default=None,
+                        help="Write the report, usable as --profile of redact.py")
+    parser.add_argument('--list', action='store_true', help="Print the profiles and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+    if args.list:
+        print(json.dumps(PROFILES, indent=2))
+        return 0
+    space = None
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+
+    report = tune(args.corpus, args.reference, args.target_recall, space,
+                  args.workers, args.max_runs, args.card_recall)
+    print(f"{'s/card':>8} {'calls':>7} {'recall':>7}  config")
+    for run in sorted(report['runs'], key=lambda run: run['seconds_per_card']):
+        recall = '-' if run['recall'] is None else f"{run['recall']:.3f}"
+        print(f"{run['seconds_per_card']:8.2f} {run['tesseract_calls_per_card']:7.1f} "
+              f"{recall:>7}  {json.dumps(run['overrides'])}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['best'] is None:
+        print(f"No configuration reaches a recall of {args.target_recall}")
+        return 1
+    print(f"Cheapest configuration with recall >= {args.target_recall}: "
+          f"{json.dumps(report['best'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
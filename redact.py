@@ -0,0 +1,343 @@
+"""
+Headless batch entry point for Aadhaar masking.
+
+Usage:
+    python redact.py --input path/to/folder_or_file --output path/to/output
+
+``redact_batch`` is the library API used by the command line and the GUI.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import freeze_support
+
+from scheduler import scan_inputs, bounded_map, chunked
+from executor_plan import make_plan, run_in_threads
+from profiles import load_profile
+
+DEFAULT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.pdf', '.bmp', '.gif', '.tiff')
+
+# Task status of the ledger claims that are not processed
+SKIPPED = {'done': 'skipped_done', 'leased': 'skipped_leased', 'quota': 'skipped_quota'}
+
+
+def collect_inputs(inputs, extensions=DEFAULT_EXTENSIONS, recursive=False):
+    """Lists the files to process.
+
+    Args:
+        inputs (str | list): Files and/or folders.
+        extensions (tuple): Accepted file extensions (lower case).
+        recursive (bool): Descend into subfolders.
+
+    Returns:
+        list: (input path, folder relative to its input root) tuples.
+    """
+    return list(scan_inputs(inputs, extensions, recursive))
+
+
+def output_path_for(input_path, rel_dir, output_dir, output_format=None):
+    """Builds the masked output path of an input file.
+
+    Args:
+        input_path (str): Input file.
+        rel_dir (str): Folder of the input relative to its input root.
+        output_dir (str): Output root.
+        output_format (str, optional): Extension of the output, e.g. 'png',
+            defaults to the input's extension.
+
+    Returns:
+        str: Output path.
+    """
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    if output_format:
+        ext = '.' + output_format.lower().lstrip('.')
+    return os.path.join(output_dir, rel_dir, f"{name}_masked{ext}")
+
+
+def _redact_task(input_path, output_path):
+    """Worker task, claims one file in the ledger, masks it and records
+    the outcome."""
+    import metrics
+    import registry
+    from brut_new import redact_file, MAX_AADHAARS
+
+    start = time.perf_counter()
+    error = None
+    claim = None
+    try:
+        # Keyed by size and mtime, the pipeline is the only reader of the file
+        claim = registry.claim(input_path, output_path,
+                               registry.stat_key(input_path), MAX_AADHAARS)
+        if claim == 'claimed':
+            with metrics.span('file', file=input_path):
+                status = redact_file(input_path, output_path)
+        else:
+            status = SKIPPED[claim]
+    except Exception as e:
+        status, error = 'failed', str(e)
+    if claim == 'claimed':
+        try:
+            registry.finish(input_path, output_path, status,
+                            time.perf_counter() - start, error)
+        except Exception as e:
+            # The row stays 'running' until this worker exits or times out
+            print(f"Could not record {input_path} in the ledger: {e}")
+    metrics.incr(f'files_{status}')
+    return {
+        'input': input_path,
+        'output': output_path if status == 'masked' else None,
+        'status': status,
+        'error': error,
+        'seconds': time.perf_counter() - start,
+        # Per task deltas, merged by the parent process
+        'metrics': metrics.snapshot(reset=True) if metrics.ENABLED else None
+    }
+
+
+def _failed_task(input_path, output_path, error):
+    """Result of a file whose task did not return, e.g. its worker died."""
+    return {
+        'input': input_path,
+        'output': None,
+        'status': 'failed',
+        'error': f"{type(error).__name__}: {error}",
+        'seconds': 0.0,
+        'metrics': None
+    }
+
+
+def redact_batch(inputs, output_dir, workers=None, ocr_threads=None,
+                 extensions=DEFAULT_EXTENSIONS, recursive=False,
+                 output_format=None, unprocessed_dir=None, yolo_server=None,
+                 trace_path=None, metrics_path=None, max_in_flight=None,
+                 ordered=False, io_threads=None, profile=None):
+    """Masks the Aadhaar numbers of a batch of files.
+
+    Every file is claimed in the job ledger (``registry``) before it is
+    processed, files completed by an earlier, interrupted run are skipped.
+
+    Args:
+        inputs (str | list): Files and/or folders to process.
+        output_dir (str): Folder receiving the masked files.
+        workers (int, optional): Worker processes, by default the cores
+            left by the execution plan (see ``executor_plan.make_plan``).
+        ocr_threads (int, optional): OpenMP/OpenCV threads per worker,
+            by default the share of the cores left by the plan.
+        extensions (tuple): Accepted file extensions.
+        recursive (bool): Descend into subfolders, the folder structure is
+            kept in the output.
+        output_format (str, optional): Output extension, defaults to the
+            input's extension.
+        unprocessed_dir (str, optional): Folder receiving the files without
+            an Aadhaar number.
+        yolo_server (bool, optional): Share one batching YOLO model between
+            the workers, defaults to ``config['yolo_server']``.
+        trace_path (str, optional): JSON-lines file receiving a timing event
+            for every instrumented span of every worker.
+        metrics_path (str, optional): Prometheus text file receiving the
+            stage timings and counters aggregated over the batch.
+        max_in_flight (int, optional): Submitted, unfinished files at any
+            time, defaults to four per worker. The inputs are walked lazily,
+            so memory does not grow with the size of the input folder.
+        ordered (bool): Report the files in input order rather than as they
+            complete.
+        io_threads (int, optional): Files each worker processes concurrently
+            in threads, defaults to 1.
+        profile (str, optional): Speed/recall profile of the workers, a name
+            or a JSON file (see ``profiles``).
+
+    Returns:
+        dict: Batch summary with counts, throughput and per-file failures.
+    """
+    import brut_new
+    import metrics
+    from registry import get_processed_count
+
+    start = time.perf_counter()
+    if get_processed_count() >= brut_new.MAX_AADHAARS:
+        raise Exception("Processing limit of Aadhar cards reached.")
+
+    if yolo_server is None:
+        yolo_server = brut_new.config['yolo_server']
+    plan = make_plan(None, workers, ocr_threads, io_threads, yolo_server,
+                     brut_new.config['pdf_page_workers'], brut_new.config['tile_workers'])
+    print(f"Execution plan: {plan.describe()}")
+    server = None
+    if plan.server_threads:
+        # One shared model instance batching requests from every worker
+        server = brut_new.start_yolo_server(plan.server_threads)
+    instrumented = bool(trace_path or metrics_path)
+    if instrumented:
+        metrics.configure(True, trace_path)
+    options = dict(plan.worker_options(), unprocessed_dir=unprocessed_dir,
+                   metrics=instrumented, trace_path=trace_path,
+                   profile=profile and load_profile(profile))
+
+    created = set()
+
+    def tasks():
+        for input_path, rel_dir in scan_inputs(inputs, extensions, recursive):
+            output_path = output_path_for(input_path, rel_dir, output_dir,
+                                          output_format)
+            folder = os.path.dirname(output_path)
+            if folder not in created:
+                os.makedirs(folder, exist_ok=True)
+                created.add(folder)
+            yield input_path, output_path
+
+    counts = dict.fromkeys(
+        ('masked', 'unprocessed', 'failed', 'skipped_quota', 'skipped_done',
+         'skipped_leased'), 0)
+    failures = []
+    unprocessed_files = []
+    try:
+        with ProcessPoolExecutor(
+                max_workers=plan.processes,
+                initializer=brut_new.init_worker,
+                initargs=(server.client_args() if server else None, options)) as executor:
+            in_flight = max_in_flight or 4 * plan.processes * plan.io_threads
+            if plan.io_threads > 1:
+                # Thread mode, every process task is a chunk run in threads
+                chunks = ((_redact_task, chunk, plan.io_threads)
+                          for chunk in chunked(tasks(), plan.io_threads))
+                results = (result for batch in bounded_map(
+                    executor, run_in_threads, chunks,
+                    max(1, in_flight // plan.io_threads), ordered,
+                    lambda args, e: [_failed_task(*task, e) for task in args[1]])
+                    for result in batch)
+            else:
+                results = bounded_map(executor, _redact_task, tasks(), in_flight, ordered,
+                                      lambda args, e: _failed_task(*args, e))
+            for result in results:
+                metrics.merge(result.pop('metrics'))
+                counts[result['status']] += 1
+                if result['status'] == 'masked':
+                    print(f"Successfully processed: {result['output']}")
+                elif result['status'] == 'failed':
+                    print(f"Task failed: {result['input']}: {result['error']}")
+                    failures.append({'input': result['input'],
+                                     'error': result['error']})
+                elif result['status'] == 'unprocessed':
+                    unprocessed_files.append(result['input'])
+    finally:
+        if server is not None:
+            server.stop()
+
+    if metrics_path:
+        metrics.write_prometheus(metrics_path)
+    metrics.flush_trace()
+
+    seconds = time.perf_counter() - start
+    processed = counts['masked'] + counts['unprocessed'] + counts['failed']
+    return dict(
+        counts,
+        files=processed,
+        seconds=seconds,
+        files_per_sec=processed / seconds if seconds else 0.0,
+        workers=plan.processes,
+        ocr_threads=plan.ocr_threads,
+        plan=plan.as_dict(),
+        failures=failures,
+        unprocessed_files=unprocessed_files)
+
+
+def format_summary(summary):
+    """Formats a batch summary as a short human readable text.
+
+    Args:
+        summary (dict): Summary returned by ``redact_batch``.
+
+    Returns:
+        str: Summary text.
+    """
+    lines = [
+        f"Files: {summary['files']} in {summary['seconds']:.1f}s "
+        f"({summary['files_per_sec']:.2f} files/sec)",
+        f"Masked: {summary['masked']}, unprocessed: {summary['unprocessed']}, "
+        f"failed: {summary['failed']}"
+    ]
+    if summary['skipped_quota']:
+        lines.append(f"Skipped (limit reached): {summary['skipped_quota']}")
+    if summary.get('skipped_done'):
+        lines.append(f"Skipped (already done): {summary['skipped_done']}")
+    if summary.get('skipped_leased'):
+        lines.append(f"Skipped (in progress elsewhere): {summary['skipped_leased']}")
+    for failure in summary['failures']:
+        lines.append(f"  failed: {failure['input']}: {failure['error']}")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    parser = argparse.ArgumentParser(
+        description="Mask Aadhaar numbers in images and PDFs.")
+    parser.add_argument('--input', '-i', required=True, nargs='+',
+                        help="Input files and/or folders")
+    parser.add_argument('--output', '-o', required=True,
+                        help="Output folder")
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help="Worker processes (default: from the execution plan)")
+    parser.add_argument('--ocr-threads', type=int, default=None,
+                        help="OCR/OpenCV threads per worker (default: from the execution plan)")
+    parser.add_argument('--io-threads', type=int, default=None,
+                        help="Files each worker processes concurrently (default: 1)")
+    parser.add_argument('--ext', default=','.join(DEFAULT_EXTENSIONS),
+                        help="Comma separated file extensions to process")
+    parser.add_argument('--recursive', '-r', action='store_true',
+                        help="Descend into subfolders")
+    parser.add_argument('--format', dest='output_format', default=None,
+                        help="Output format, e.g. png or pdf (default: same as input)")
+    parser.add_argument('--unprocessed', default=None,
+                        help="Folder for files without an Aadhaar number")
+    parser.add_argument('--no-yolo-server', action='store_true',
+                        help="Load the YOLO model in every worker")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Files submitted at any time (default: 4 per worker)")
+    parser.add_argument('--ordered', action='store_true',
+                        help="Report files in input order")
+    parser.add_argument('--profile', default=None,
+                        help="fast, balanced, thorough or a JSON file of config "
+                             "overrides, e.g. from profiles.py (default: config)")
+    parser.add_argument('--summary-json', default=None,
+                        help="Write the batch summary to this JSON file")
+    parser.add_argument('--trace', default=None,
+                        help="Write a JSON-lines timing trace to this file")
+    parser.add_argument('--metrics', default=None,
+                        help="Write Prometheus text metrics to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+    extensions = tuple('.' + ext.strip().lower().lstrip('.')
+                       for ext in args.ext.split(',') if ext.strip())
+    summary = redact_batch(
+        args.input, args.output,
+        workers=args.workers,
+        ocr_threads=args.ocr_threads,
+        io_threads=args.io_threads,
+        extensions=extensions,
+        recursive=args.recursive,
+        output_format=args.output_format,
+        unprocessed_dir=args.unprocessed,
+        yolo_server=False if args.no_yolo_server else None,
+        trace_path=args.trace,
+        metrics_path=args.metrics,
+        max_in_flight=args.max_in_flight,
+        ordered=args.ordered,
+        profile=args.profile)
+    print(format_summary(summary))
+    if args.summary_json:
+        with open(args.summary_json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
@@ -1,25 +1,277 @@
-import json
-CONFIG_FILE = "aadhaar_config.json"
-
-def get_processed_count():
-    """Read processed count from JSON config"""
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-            return config.get('processed_count', 0)
-    except FileNotFoundError:
-        return 0
-
-def update_processed_count(new_count):
-    """Update processed count in JSON config"""
-    config = {}
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-    except FileNotFoundError:
-        pass
-    
-    config['processed_count'] = new_count
-    
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=2)
+"""This module contains the job ledger: a local SQLite database (WAL mode)
+with one row per processed file.
+
+Every worker claims its file and records the outcome in its own short
+transaction, so a crash loses at most the files in flight. The quota check
+against ``MAX_AADHAARS`` runs in the claiming transaction, which keeps
+concurrent batches from overrunning it. A file another live process is
+working on is reported as leased instead of being processed twice, and files
+already completed with the same content key and output are skipped when an
+interrupted batch is rerun. The content key of a file is a stat key (size
+and mtime, see ``stat_key``), not a hash of its bytes: a file rewritten with
+the same size within the mtime granularity, or restored with its old mtime
+(``cp -p``), reads as unchanged.
+
+The ``processed_count`` of the former ``aadhaar_config.json`` registry is
+imported once when the ledger is created.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+CONFIG_FILE = "aadhaar_config.json"
+LEDGER_FILE = os.getenv("AADHAAR_LEDGER", "aadhaar_ledger.db")
+# Seconds after which a 'running' row is taken over even if its process lives
+RUNNING_TIMEOUT = float(os.getenv("AADHAAR_LEDGER_TIMEOUT", "3600"))
+
+# Statuses counting against the quota, 'running' rows are claims in flight
+COUNTED = ('running', 'masked', 'unprocessed')
+DONE = ('masked', 'unprocessed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    content_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    started_at REAL,
+    finished_at REAL,
+    seconds REAL,
+    pid INTEGER,
+    UNIQUE (path, output_path)
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+def stat_key(path):
+    """Content key of a file from its size and modification time.
+
+    The file is not read, so the pipeline stays the only reader of the input.
+    This is not a content hash, see the module docstring.
+
+    Args:
+        path (str): File path.
+
+    Returns:
+        str: Key, changes when the file is rewritten.
+    """
+    stat = os.stat(path)
+    return f"stat:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _pid_alive(pid):
+    """True when a process of this host may still be running."""
+    if not pid:
+        return False
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+    if os.name == 'nt':
+        return True  # os.kill would terminate it, only the timeout decides
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_stale(started_at, pid):
+    """True when a 'running' row was left behind by a dead or stuck claimer."""
+    if started_at is None or time.time() - started_at > RUNNING_TIMEOUT:
+        return True
+    return not _pid_alive(pid)
+
+
+def _legacy_count():
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            return int(json.load(f).get('processed_count', 0))
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def connect(path=None):
+    """Connection to the ledger of this thread, created on first use.
+
+    Args:
+        path (str, optional): Database file, defaults to ``LEDGER_FILE``.
+
+    Returns:
+        sqlite3.Connection: Connection in autocommit mode, transactions are
+        opened explicitly.
+    """
+    path = path or LEDGER_FILE
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(files)")]
+            if 'content_hash' in columns:
+                # Ledgers written before the column held stat keys
+                conn.execute("ALTER TABLE files RENAME COLUMN content_hash TO content_key")
+            # One time migration of the JSON registry
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('legacy_count', ?)",
+                         (str(_legacy_count()),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        connections[path] = conn
+    return conn
+
+
+def _count(conn, exclude_prefix=None):
+    legacy = conn.execute(
+        "SELECT value FROM meta WHERE key = 'legacy_count'").fetchone()
+    placeholders = ','.join('?' * len(COUNTED))
+    query = f"SELECT COUNT(*) FROM files WHERE status IN ({placeholders})"
+    params = COUNTED
+    if exclude_prefix:
+        query += " AND path NOT LIKE ?"
+        params += (exclude_prefix + '%',)
+    rows = conn.execute(query, params).fetchone()[0]
+    return int(legacy[0] if legacy else 0) + rows
+
+
+def get_processed_count(path=None, exclude_prefix=None):
+    """Number of files counted against the quota.
+
+    Args:
+        path (str, optional): Database file.
+        exclude_prefix (str, optional): Leave out the rows whose input path
+            starts with this prefix, e.g. the files of ``coordination``,
+            which the global quota counts already.
+    """
+    return _count(connect(path), exclude_prefix)
+
+
+def _completed(row, content_key, output_path):
+    """True when a (content_key, status, ...) row completed this content key.
+
+    Rows without an output file (HTTP uploads) are complete once finished.
+    """
+    return row[0] == content_key and row[1] in DONE and (
+        row[1] == 'unprocessed' or not output_path or os.path.isfile(output_path))
+
+
+def is_done(input_path, output_path, content_key, path=None):
+    """Read-only check that a file was completed, see ``claim``.
+
+    Args:
+        input_path (str): Input file.
+        output_path (str): Output file.
+        content_key (str): Content key of the input, e.g. ``stat_key``.
+        path (str, optional): Database file.
+
+    Returns:
+        bool: True when ``claim`` would return 'done'.
+    """
+    row = connect(path).execute(
+        "SELECT content_key, status FROM files WHERE path = ? AND output_path = ?",
+        (input_path, output_path)).fetchone()
+    return bool(row) and _completed(row, content_key, output_path)
+
+
+def claim(input_path, output_path, content_key, limit, path=None):
+    """Claim a file for processing.
+
+    The quota check and the claim run in one write transaction.
+
+    Args:
+        input_path (str): Input file.
+        output_path (str): Output file.
+        content_key (str): Content key of the input, e.g. ``stat_key``
+            or a digest of the bytes.
+        limit (int): Quota, e.g. ``MAX_AADHAARS``.
+        path (str, optional): Database file.
+
+    Returns:
+        str: 'claimed', 'done' when the same content key was already completed
+        into an existing output, 'leased' when another live process is
+        processing the file, or 'quota' when the quota is used up. A
+        'running' row whose process died, or which is older than
+        ``RUNNING_TIMEOUT``, is taken over.
+    """
+    conn = connect(path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT content_key, status, started_at, pid FROM files "
+            "WHERE path = ? AND output_path = ?",
+            (input_path, output_path)).fetchone()
+        if row and _completed(row, content_key, output_path):
+            conn.execute("COMMIT")
+            return 'done'
+        if row and row[1] == 'running' and not _is_stale(row[2], row[3]):
+            conn.execute("COMMIT")
+            return 'leased'
+        # A row counted by an earlier (crashed) run is taken over, not added
+        already_counted = row is not None and row[1] in COUNTED
+        if not already_counted and _count(conn) >= limit:
+            conn.execute("COMMIT")
+            return 'quota'
+        conn.execute(
+            "INSERT INTO files (path, output_path, content_key, status, started_at, pid) "
+            "VALUES (?, ?, ?, 'running', ?, ?) "
+            "ON CONFLICT (path, output_path) DO UPDATE SET "
+            "content_key = excluded.content_key, status = 'running', error = NULL, "
+            "started_at = excluded.started_at, finished_at = NULL, seconds = NULL, "
+            "pid = excluded.pid",
+            (input_path, output_path, content_key, time.time(), os.getpid()))
+        conn.execute("COMMIT")
+        return 'claimed'
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def finish(input_path, output_path, status, seconds, error=None, path=None):
+    """Record the outcome of a claimed file.
+
+    Args:
+        input_path (str): Input file.
+        output_path (str): Output file.
+        status (str): 'masked', 'unprocessed' or 'failed'.
+        seconds (float): Processing time.
+        error (str, optional): Error message of a failed file.
+        path (str, optional): Database file.
+    """
+    conn = connect(path)
+    conn.execute(
+        "UPDATE files SET status = ?, error = ?, finished_at = ?, seconds = ? "
+        "WHERE path = ? AND output_path = ?",
+        (status, error, time.time(), seconds, input_path, output_path))
+
+
+def summary(path=None):
+    """Number of ledger rows per status.
+
+    Returns:
+        dict: status -> count.
+    """
+    rows = connect(path).execute(
+        "SELECT status, COUNT(*) FROM files GROUP BY status").fetchall()
+    return dict(rows)
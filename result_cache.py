@@ -0,0 +1,157 @@
+"""This module contains a content-addressed cache of redaction results.
+
+Entries are keyed by a hash of the input bytes, the settings of the
+effective config that change the result, and the output format. Each entry is a small JSON file with the mask polygons and
+the detection status, plus a copy of the output artifact. The store is a
+plain folder shared by all worker processes, every write is atomic
+(temp file + rename) and the least recently used entries are evicted when
+the folder grows over its size limit.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+ENTRY_SUFFIX = '.json'
+
+
+def config_fingerprint(config, ignore=()):
+    """Hash of a processing configuration.
+
+    Args:
+        config (dict): Processing configuration.
+        ignore (tuple): Keys left out, the settings that do not change the
+            result (threads, batching, cache location).
+
+    Returns:
+        str: Hex digest.
+    """
+    settings = {k: v for k, v in config.items() if k not in ignore}
+    text = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    """On-disk LRU cache of redaction results."""
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024):
+        """Initialize the cache.
+
+        Args:
+            root (str): Cache folder, created when missing.
+            max_bytes (int): Size limit of the folder.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, data, config, ext, ignore=()):
+        """Cache key of an input.
+
+        Args:
+            data (bytes): Raw input file.
+            config (dict): Effective processing configuration.
+            ext (str): Output extension.
+            ignore (tuple): Config keys that do not change the result.
+
+        Returns:
+            str: Hex key.
+        """
+        digest = hashlib.sha256(data)
+        digest.update(config_fingerprint(config, ignore).encode())
+        digest.update(ext.lower().encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.root, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Look up an entry and mark it as recently used.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            dict | None: The entry with ``artifact`` resolved to a path (or
+            None), or None on a miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        artifact = entry.get('artifact')
+        if artifact:
+            artifact = os.path.join(self.root, artifact)
+            entry['artifact'] = artifact if os.path.isfile(artifact) else None
+        return entry
+
+    def put(self, key, status, polygons=(), artifact=None):
+        """Store a result.
+
+        Args:
+            key (str): Cache key.
+            status (str): 'masked' or 'unprocessed'.
+            polygons (list): Mask polygons in source coordinates.
+            artifact (str, optional): Output file to keep a copy of.
+        """
+        entry = {
+            'status': status,
+            'polygons': [[[int(x), int(y)] for x, y in p] for p in polygons],
+            'artifact': None
+        }
+        if artifact and os.path.isfile(artifact):
+            name = key + os.path.splitext(artifact)[1].lower()
+            self._atomic_copy(artifact, os.path.join(self.root, name))
+            entry['artifact'] = name
+
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._entry_path(key))
+        self.evict()
+
+    def _atomic_copy(self, src, dst):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+
+    def evict(self):
+        """Delete the least recently used entries until the folder fits."""
+        files = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for item in it:
+                if item.is_file() and not item.name.endswith('.tmp'):
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:  # Evicted by another process
+                        continue
+                    files.append((stat.st_mtime, item.name, stat.st_size))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        names = {}
+        sizes = {}
+        last_used = {}
+        for mtime, name, size in files:
+            key = name.split('.', 1)[0]
+            names.setdefault(key, []).append(name)
+            sizes[key] = sizes.get(key, 0) + size
+            if name.endswith(ENTRY_SUFFIX):
+                last_used[key] = mtime
+        for key in sorted(sizes, key=lambda k: last_used.get(k, 0)):
+            if total <= self.max_bytes:
+                break
+            for name in names[key]:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+            total -= sizes[key]
@@ -0,0 +1,134 @@
+"""This module contains the streaming task producer of the batch entry
+points: a lazy ``os.scandir`` walk over the inputs and a bounded map over an
+executor.
+
+Nothing is listed or submitted up front. The walk yields files as the
+directories are read, and ``bounded_map`` keeps at most ``max_in_flight``
+futures alive, so the first result arrives right after the first file is
+found and memory stays flat however large the input folder is.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+def scan_inputs(inputs, extensions, recursive=False):
+    """Lazily walk the files to process.
+
+    Args:
+        inputs (str | list): Files and/or folders.
+        extensions (tuple): Accepted file extensions (lower case).
+        recursive (bool): Descend into subfolders.
+
+    Yields:
+        tuple: (input path, folder relative to its input root).
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    extensions = tuple(ext.lower() for ext in extensions)
+    for item in inputs:
+        if os.path.isfile(item):
+            yield item, ''
+            continue
+        if not os.path.isdir(item):
+            raise FileNotFoundError(f"Input does not exist: {item}")
+        # Only the folders still to visit are kept, never a file listing
+        pending = [(item, '')]
+        while pending:
+            folder, rel_dir = pending.pop()
+            subfolders = []
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_file():
+                        if entry.name.lower().endswith(extensions):
+                            yield entry.path, rel_dir
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        subfolders.append(
+                            (entry.path, os.path.join(rel_dir, entry.name)))
+            pending.extend(reversed(subfolders))
+
+
+def bounded_map(executor, fn, items, max_in_flight, ordered=False, on_error=None):
+    """Run ``fn(*item)`` for every item with a bounded number of tasks in flight.
+
+    Items are pulled from the (possibly lazy) iterable only when a slot is
+    free, which is the backpressure on the producer.
+
+    Args:
+        executor (concurrent.futures.Executor): Executor running the tasks.
+        fn (callable): Task function.
+        items (iterable): Argument tuples.
+        max_in_flight (int): Maximum number of submitted, unfinished tasks.
+        ordered (bool): Yield the results in input order instead of
+            completion order. A slow task then holds back the results
+            behind it, but never more than ``max_in_flight`` of them.
+        on_error (callable, optional): ``on_error(args, exception)`` gives
+            the result of an item whose task or submission failed, e.g.
+            after a worker of a process pool was killed. Without it the
+            exception is raised from the generator.
+
+    Yields:
+        The task results.
+    """
+    items = iter(items)
+    max_in_flight = max(1, max_in_flight)
+    in_flight = deque() if ordered else {}
+    exhausted = False
+
+    def result(future, args):
+        if on_error is None:
+            return future.result()
+        try:
+            return future.result()
+        except Exception as e:
+            return on_error(args, e)
+
+    while True:
+        while not exhausted and len(in_flight) < max_in_flight:
+            try:
+                args = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            try:
+                future = executor.submit(fn, *args)
+            except Exception as e:
+                # A broken pool refuses every later task
+                if on_error is None:
+                    raise
+                yield on_error(args, e)
+                continue
+            if ordered:
+                in_flight.append((future, args))
+            else:
+                in_flight[future] = args
+        if not in_flight:
+            return
+
+        if ordered:
+            yield result(*in_flight.popleft())
+        else:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield result(future, in_flight.pop(future))
+
+
+def chunked(items, size):
+    """Group a (possibly lazy) iterable into lists of ``size`` items.
+
+    Args:
+        items (iterable): Items.
+        size (int): Chunk size.
+
+    Yields:
+        list: Chunks, the last one may be shorter.
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,375 @@
+"""
+Local HTTP redaction service.
+
+A small asyncio HTTP/1.1 server keeping the pipeline warm between requests:
+
+    POST /redact    body: the image or PDF, response: JSON with the masked
+                    file (base64), the mask boxes and the UID found flag
+    GET  /healthz   liveness and queue depth
+    GET  /metrics   Prometheus text metrics
+
+OCR runs in a pool of worker processes initialized once at startup, and the
+workers share one YOLO model server that coalesces their detections into
+micro-batches. Admitted requests are bounded; when the workers and the
+queue are full the service answers 429 with ``Retry-After`` instead of
+letting latency grow without limit.
+
+The input format is taken from the ``ext`` query parameter, the
+``Content-Type`` header or the file signature, in that order.
+
+Usage:
+    python service.py --port 8080 --workers 4
+    curl --data-binary @card.jpg -H "Content-Type: image/jpeg" localhost:8080/redact
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import hashlib
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import freeze_support
+
+from redact import DEFAULT_EXTENSIONS
+from executor_plan import make_plan
+from profiles import load_profile
+
+CONTENT_TYPES = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/bmp': '.bmp',
+    'image/gif': '.gif',
+    'image/tiff': '.tiff',
+    'application/pdf': '.pdf'
+}
+SIGNATURES = (
+    (b'%PDF', '.pdf'),
+    (b'\x89PNG', '.png'),
+    (b'\xff\xd8', '.jpg'),
+    (b'BM', '.bmp'),
+    (b'GIF8', '.gif'),
+    (b'II*\x00', '.tiff'),
+    (b'MM\x00*', '.tiff')
+)
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           415: 'Unsupported Media Type', 429: 'Too Many Requests',
+           500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    """Error answered with an HTTP status and a JSON message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def guess_extension(data, content_type=None, ext=None):
+    """Input format of a request body.
+
+    Args:
+        data (bytes): Request body.
+        content_type (str, optional): ``Content-Type`` header.
+        ext (str, optional): ``ext`` query parameter.
+
+    Returns:
+        str | None: Extension such as '.png', None when unknown.
+    """
+    if ext:
+        return '.' + ext.lower().lstrip('.')
+    if content_type:
+        found = CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+        if found:
+            return found
+    for signature, found in SIGNATURES:
+        if data.startswith(signature):
+            return found
+    return None
+
+
+def _service_task(data, ext):
+    """Worker task, masks one request body."""
+    import metrics
+    import registry
+    from brut_new import redact_bytes, MAX_AADHAARS
+
+    start = time.perf_counter()
+    digest = hashlib.sha256(data).hexdigest()
+    key = f"http:{digest}"
+    # Requests are ledger rows too, identical bodies are counted once: a body
+    # completed before ('done') or in flight in another worker ('leased') is
+    # still redacted for its response, but its row is left to its owner
+    claim = registry.claim(key, '', digest, MAX_AADHAARS)
+    if claim == 'quota':
+        return {'status': 'skipped_quota',
+                'metrics': metrics.snapshot(reset=True) if metrics.ENABLED else None}
+    try:
+        result = redact_bytes(data, ext)
+    except Exception as e:
+        if claim == 'claimed':
+            registry.finish(key, '', 'failed', time.perf_counter() - start, str(e))
+        raise
+    result['seconds'] = time.perf_counter() - start
+    if claim == 'claimed':
+        registry.finish(key, '', result['status'], result['seconds'])
+    result['metrics'] = metrics.snapshot(reset=True) if metrics.ENABLED else None
+    return result
+
+
+def _warm():
+    """No-op task making the pool start (and initialize) its workers."""
+    return os.getpid()
+
+
+class RedactionService:
+    """asyncio HTTP front end of a warm worker pool."""
+
+    def __init__(self, workers=None, queue_size=None, ocr_threads=None,
+                 max_body_mb=32, yolo_server=None, profile=None):
+        """Initialize the service.
+
+        Args:
+            workers (int, optional): Worker processes, defaults to the cores
+                left by the execution plan.
+            queue_size (int, optional): Requests waiting for a worker before
+                new ones get 429, defaults to twice the workers.
+            ocr_threads (int, optional): OpenMP/OpenCV threads per worker.
+            max_body_mb (int): Largest accepted request body.
+            yolo_server (bool, optional): Share one batching YOLO model between
+                the workers, defaults to ``config['yolo_server']``.
+            profile (str, optional): Speed/recall profile of the workers, a
+                name or a JSON file (see ``profiles``).
+        """
+        self.plan = None
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ocr_threads = ocr_threads
+        self.max_body = max_body_mb * 1024 * 1024
+        self.yolo_server = yolo_server
+        self.profile = profile and load_profile(profile)
+        self.active = 0
+        self.started = time.time()
+        self.executor = None
+        self.server = None
+
+    def start_pool(self):
+        """Start the YOLO server and the worker pool."""
+        import brut_new
+        import metrics
+
+        metrics.configure(True)
+        if self.yolo_server is None:
+            self.yolo_server = brut_new.config['yolo_server']
+        self.plan = make_plan(None, self.workers, self.ocr_threads, 1, self.yolo_server,
+                              brut_new.config['pdf_page_workers'],
+                              brut_new.config['tile_workers'])
+        self.workers = self.plan.processes
+        if self.queue_size is None:
+            self.queue_size = 2 * self.workers
+        if self.plan.server_threads:
+            self.server = brut_new.start_yolo_server(self.plan.server_threads)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=brut_new.init_worker,
+            initargs=(self.server.client_args() if self.server else None,
+                      dict(self.plan.worker_options(), metrics=True,
+                                 profile=self.profile)))
+        # Load the models now rather than on the first requests
+        for future in [self.executor.submit(_warm) for _ in range(self.workers)]:
+            future.result()
+
+    def stop_pool(self):
+        """Stop the worker pool and the YOLO server."""
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.server is not None:
+            self.server.stop()
+
+    async def redact(self, body, headers, query):
+        """Handle ``POST /redact``."""
+        import metrics
+
+        if not body:
+            raise HttpError(400, "Empty request body")
+        ext = guess_extension(body, headers.get('content-type'),
+                              query.get('ext', [None])[0])
+        if ext not in DEFAULT_EXTENSIONS:
+            raise HttpError(415, "Unsupported file type")
+        if self.active >= self.workers + self.queue_size:
+            metrics.incr('http_rejected')
+            raise HttpError(429, "Too many requests in flight")
+
+        self.active += 1
+        try:
+            with metrics.span('request'):
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, _service_task, body, ext)
+        finally:
+            self.active -= 1
+        metrics.merge(result.pop('metrics'))
+        if result['status'] == 'skipped_quota':
+            raise HttpError(403, "Processing limit of Aadhar cards reached.")
+
+        output = result['output']
+        return {
+            'status': result['status'],
+            'uid_found': result['uid_found'],
+            'boxes': result['boxes'],
+            'format': ext.lstrip('.'),
+            'output': base64.b64encode(output).decode('ascii') if output else None,
+            'seconds': result['seconds']
+        }
+
+    def health(self):
+        """Handle ``GET /healthz``."""
+        return {
+            'status': 'ok',
+            'workers': self.workers,
+            'active': self.active,
+            'queue_size': self.queue_size,
+            'uptime': time.time() - self.started
+        }
+
+    async def dispatch(self, method, target, headers, body):
+        """Route a request.
+
+        Returns:
+            tuple: (status, content type, response body bytes)
+        """
+        import metrics
+
+        url = urlsplit(target)
+        metrics.incr('http_requests')
+        if url.path == '/redact':
+            if method != 'POST':
+                raise HttpError(405, "Use POST")
+            payload = await self.redact(body, headers, parse_qs(url.query))
+            return 200, 'application/json', json.dumps(payload).encode()
+        if url.path == '/healthz':
+            return 200, 'application/json', json.dumps(self.health()).encode()
+        if url.path == '/metrics':
+            return (200, 'text/plain; version=0.0.4',
+                    metrics.prometheus_text().encode())
+        raise HttpError(404, f"No route for {url.path}")
+
+    async def read_request(self, reader):
+        """Read one request, None when the client closed the connection."""
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, "Malformed Content-Length")
+        if length < 0:
+            raise HttpError(400, "Negative Content-Length")
+        if length > self.max_body:
+            raise HttpError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection (keep-alive aware)."""
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    status, content_type, payload = await self.dispatch(
+                        method, target, headers, body)
+                except HttpError as e:
+                    status, content_type = e.status, 'application/json'
+                    payload = json.dumps({'error': str(e)}).encode()
+                except Exception as e:
+                    print(f"Request failed: {e}")
+                    status, content_type = 500, 'application/json'
+                    payload = json.dumps({'error': str(e)}).encode()
+
+                head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                        f"Content-Type: {content_type}",
+                        f"Content-Length: {len(payload)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                if status == 429:
+                    head.append("Retry-After: 1")
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """Start the pool and serve until cancelled."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.start_pool)
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{port}, {self.plan.describe()}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop_pool()
+
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    parser = argparse.ArgumentParser(description="Local Aadhaar redaction HTTP service.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help="Worker processes (default: from the execution plan)")
+    parser.add_argument('--queue-size', type=int, default=None,
+                        help="Waiting requests before 429 (default: 2 per worker)")
+    parser.add_argument('--ocr-threads', type=int, default=None,
+                        help="OCR/OpenCV threads per worker (default: from the execution plan)")
+    parser.add_argument('--max-body-mb', type=int, default=32)
+    parser.add_argument('--no-yolo-server', action='store_true',
+                        help="Load the YOLO model in every worker")
+    parser.add_argument('--profile', default=None,
+                        help="fast, balanced, thorough or a JSON file of config overrides")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    args = parse_args(argv)
+    service = RedactionService(
+        workers=args.workers,
+        queue_size=args.queue_size,
+        ocr_threads=args.ocr_threads,
+        max_body_mb=args.max_body_mb,
+        yolo_server=False if args.no_yolo_server else None,
+        profile=args.profile)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
@@ -1,18 +1,14 @@
 """This module contains functions to extract Uid's and mask the aadhar images"""
 
 import re
-import os
-from dotenv import load_dotenv
+import hashlib
+from collections import OrderedDict
 import cv2
-import pytesseract
-from pytesseract import Output
-from PIL import Image
-
-load_dotenv()
-
-TESSERACT_PATH = os.getenv("TESSERACT_PATH")
-
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+import numpy as np
+from ocr_backend import get_backend
+import verhoeff
+from preprocess import Preprocessed
+import metrics
 
 
 class AadhaarCard:
@@ -26,6 +22,8 @@ class AadhaarCard:
             config (dict): Configuration settings for processing.
         """
         self.config = config
+        self._ocr_cache = OrderedDict()
+        self._prep = None
 
     def validate(self, aadhar_num):
         """Validate if the given Aadhaar number is valid.
@@ -36,80 +34,42 @@ class AadhaarCard:
         Returns:
             int: 1 if valid, 0 if invalid.
         """
-        mult = [
-            [
-                0, 1, 2, 3, 4, 5, 6, 7, 8, 9], [
-                1, 2, 3, 4, 0, 6, 7, 8, 9, 5], [
-                2, 3, 4, 0, 1, 7, 8, 9, 5, 6], [
-                    3, 4, 0, 1, 2, 8, 9, 5, 6, 7], [
-                        4, 0, 1, 2, 3, 9, 5, 6, 7, 8], [
-                            5, 9, 8, 7, 6, 0, 4, 3, 2, 1], [
-                                6, 5, 9, 8, 7, 1, 0, 4, 3, 2], [
-                                    7, 6, 5, 9, 8, 2, 1, 0, 4, 3], [
-                                        8, 7, 6, 5, 9, 3, 2, 1, 0, 4], [
-                                            9, 8, 7, 6, 5, 4, 3, 2, 1, 0]]
-
-        perm = [
-            [
-                0, 1, 2, 3, 4, 5, 6, 7, 8, 9], [
-                1, 5, 7, 6, 2, 8, 3, 0, 9, 4], [
-                5, 8, 0, 3, 7, 9, 6, 1, 4, 2], [
-                    8, 9, 1, 6, 0, 4, 3, 5, 2, 7], [
-                        9, 4, 5, 3, 1, 2, 6, 8, 7, 0], [
-                            4, 2, 8, 6, 5, 7, 3, 9, 0, 1], [
-                                2, 7, 9, 3, 8, 0, 6, 4, 1, 5], [
-                                    7, 0, 4, 6, 9, 1, 3, 2, 5, 8]]
+        return 1 if verhoeff.is_valid(str(aadhar_num)) else 0
 
-        try:
-            i = len(aadhar_num)
-            j = 0
-            x = 0
-
-            while i > 0:
-                i -= 1
-                x = mult[x][perm[(j % 8)][int(aadhar_num[i])]]
-                j += 1
-            if x == 0:
-                return 1            
-            return 0
-
-        except ValueError:
-            return 0
-        except IndexError:
-            return 0
-
-    def extract(self, path, setting):
+    @metrics.timed('extract')
+    def extract(self, img, setting):
         """Extract Aadhaar numbers from the given image.
 
         Args:
-            path (str): Path to the Aadhaar image.
+            img (numpy.ndarray): Decoded BGR Aadhaar image.
             setting (int): Contrast setting for processing.
 
         Returns:
             list: List of extracted Aadhaar numbers.
         """
-        self.image_path = path
-        self.read_image_cv()
-
-        if self.config['skew']:
-            print("Skewness correction not available")
-
-        if self.config['crop']:
-            print("Smart Crop not available")
+        self.cv_img = img
 
         # self.save_image(self.cv_img)
 
         if self.config['contrast']:
+            prep = self.preprocessed(img)
             if setting == 0:
-                self.cv_img = self.contrast_image_trunc(self.cv_img)
-                print("Correcting trunc contrast")
+                self.cv_img = prep.trunc
+                metrics.incr('contrast_trunc')
             else:
-                self.cv_img = self.contrast_image_binary(self.cv_img)
-                print("Correcting thresh contrast")
+                self.cv_img = prep.binary
+                metrics.incr('contrast_thresh')
 
         aadhaars = set()
         for i in range(len(self.config['psm'])):
-            t = self.text_extractor(self.cv_img, self.config['psm'][i])
+            d = self.ocr_data(self.cv_img, self.config['psm'][i])
+            if self.config.get('require_checksum', True):
+                tokens, lines = self.table_tokens(d)
+                aadhaars.update(
+                    c.digits for c in verhoeff.candidate_uids(tokens, lines))
+                continue
+
+            t = self.table_to_text(d)
             anum = self.is_aadhaar_card(t)
             uid = self.find_uid(t)
 
@@ -125,76 +85,101 @@ class AadhaarCard:
 
         return list(aadhaars)
 
-    def mask_image(self, path, write, aadhaar_list):
+    def mask_image(self, img, aadhaar_list, ocr_img=None):
         """Mask Aadhaar numbers in the given image.
 
         Args:
-            path (str): Path to the input image.
-            write (str): Path to save the masked image.
+            img (numpy.ndarray): Decoded BGR image.
+            aadhaar_list (list): List of Aadhaar numbers to be masked.
+            ocr_img (numpy.ndarray, optional): Image with the same geometry
+                whose cached word tables are used to locate the numbers,
+                usually the contrast image ``extract`` just read.
+
+        Returns:
+            numpy.ndarray: Masked copy of the image.
+        """
+        color = self.config['mask_color']
+        self.mask = img.copy()
+        for (x, y, w, h) in self.mask_boxes(img, aadhaar_list, ocr_img):
+            cv2.rectangle(self.mask, (x, y), (x + w, y + h), color, cv2.FILLED)
+        return self.mask
+
+    @metrics.timed('mask_image')
+    def mask_boxes(self, img, aadhaar_list, ocr_img=None):
+        """Locate the boxes covering the given Aadhaar numbers.
+
+        Args:
+            img (numpy.ndarray): Decoded BGR image.
             aadhaar_list (list): List of Aadhaar numbers to be masked.
+            ocr_img (numpy.ndarray, optional): See ``mask_image``.
 
         Returns:
-            int: Number of masked occurrences.
+            list: (x, y, w, h) boxes in image coordinates.
         """
+        source = img
+        if ocr_img is not None and ocr_img.shape[:2] == img.shape[:2]:
+            source = ocr_img
         self.mask_count = 0
-        self.mask = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        boxes = []
         for j in range(len(self.config['psm'])):
-            for i in range(len(aadhaar_list)):
-                if self.mask_aadhaar(
-                        aadhaar_list[i],
-                        write,
-                        self.config['psm'][j]) > 0:
-                    self.mask_count += 1
-
-        if write.lower().endswith('.pdf'):
-            img2pdf = Image.open(path)
-            img2pdf.save(write, "PDF")
-        else:
-            cv2.imwrite(write, self.mask)
-        return self.mask_count
-
-    def mask_aadhaar(self, uid, out_path, psm):
-        """Mask a specific Aadhaar number in an image.
+            d = self.ocr_data(source, self.config['psm'][j])
+            found, matched = self.uid_boxes(aadhaar_list, d)
+            boxes.extend(found)
+            self.mask_count += len(matched)
+        return boxes
+
+    def uid_boxes(self, aadhaar_list, d):
+        """Find the word boxes of the given Aadhaar numbers in a word table.
+
+        With ``require_checksum`` the words of every 12 digit window that
+        spells one of the numbers are returned, otherwise any word of two or
+        more digits contained in a number is.
 
         Args:
-            uid (str): Aadhaar number to mask.
-            out_path (str): Path to save the output image.
-            psm (int): Tesseract PSM mode.
+            aadhaar_list (list): Aadhaar numbers to mask.
+            d (dict): Word table from ``ocr_data``.
 
         Returns:
-            int: Count of matches found and masked.
+            tuple: (list of (x, y, w, h) boxes, set of matched numbers)
         """
-        d = self.box_extractor(self.mask, psm)
+        boxes = []
+        matched = set()
+
+        if self.config.get('require_checksum', True):
+            tokens, lines = self.table_tokens(d)
+            for window in verhoeff.digit_windows(tokens, lines):
+                if window.digits in aadhaar_list:
+                    for i in range(window.start, window.end):
+                        boxes.append((d['left'][i], d['top'][i],
+                                      d['width'][i], d['height'][i]))
+                    matched.add(window.digits)
+            return boxes, matched
+
         n_boxes = len(d['level'])
-        color = self.config['mask_color']
-        count_of_match = 0
         for i in range(n_boxes):
             string = d['text'][i].strip()
-            if string.isdigit() and string in uid and len(string) >= 2:
-                (x, y, w, h) = (d['left'][i], d['top']
-                                [i], d['width'][i], d['height'][i])
-                cv2.rectangle(
-                    self.mask, (x, y), (x + w, y + h), color, cv2.FILLED)
-                count_of_match += 1
-        return count_of_match
-
-    def read_image_cv(self):
-        """Read an image using OpenCV and store it in an instance variable."""
-        self.cv_img = cv2.imread(str(self.image_path), cv2.IMREAD_COLOR)
-
-    def mask_nums(self, input_file, output_file):
+            if not string.isdigit() or len(string) < 2:
+                continue
+            for uid in aadhaar_list:
+                if string in uid:
+                    boxes.append((d['left'][i], d['top'][i],
+                                  d['width'][i], d['height'][i]))
+                    matched.add(uid)
+                    break
+        return boxes, matched
+
+    def mask_nums(self, img):
         """Mask all numeric values in an image.
 
         Args:
-            input_file (str): Path to the input image.
-            output_file (str): Path to save the output image.
+            img (numpy.ndarray): Decoded BGR image.
 
         Returns:
-            str: Status message.
+            numpy.ndarray: Masked copy of the image.
         """
-        img = cv2.imread(str(input_file), cv2.IMREAD_COLOR)
+        img = img.copy()
         for i in range(len(self.config['brut_psm'])):  # 'brut_psm': [6]
-            d = self.box_extractor(img, self.config['brut_psm'][i])
+            d = self.ocr_data(img, self.config['brut_psm'][i])
             n_boxes = len(d['level'])
             color = self.config['mask_color']  # BGR
             for i in range(n_boxes):
@@ -204,13 +189,28 @@ class AadhaarCard:
                                     [i], d['width'][i], d['height'][i])
                     cv2.rectangle(
                         img, (x, y), (x + w, y + h), color, cv2.FILLED)
-
-        cv2.imwrite(output_file, img)
-        return "Done"
+        return img
 
     # def save_image(self, img):
     #     cv2.imwrite('temp.jpg', img)
 
+    def preprocessed(self, img):
+        """Grayscale, Otsu threshold and contrast variants of an image.
+
+        Both contrast settings of ``extract`` run on the same image, so the
+        conversion and the histogram are computed once and reused.
+
+        Args:
+            img (numpy.ndarray): Input image.
+
+        Returns:
+            Preprocessed: Shared preprocessing of the image.
+        """
+        if self._prep is None or self._prep.source is not img:
+            with metrics.span('preprocess'):
+                self._prep = Preprocessed(img)
+        return self._prep
+
     def contrast_image_trunc(self, img):
         """Apply truncation-based contrast enhancement to an image.
 
@@ -239,6 +239,7 @@ class AadhaarCard:
             gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
         return thresh
 
+    @metrics.timed('text_extractor')
     def text_extractor(self, img, psm):
         """Extract text from an image using OCR.
 
@@ -249,10 +250,11 @@ class AadhaarCard:
         Returns:
             str: Extracted text.
         """
-        config = '-l eng --oem 3 --psm ' + str(psm)
-        t = pytesseract.image_to_string(img, lang='eng', config=config)
-        return t
+        metrics.incr('tesseract_calls')
+        with metrics.span('ocr'):
+            return get_backend(self.config).image_to_string(img, psm)
 
+    @metrics.timed('box_extractor')
     def box_extractor(self, img, psm):
         """Extract bounding boxes of text from an image.
 
@@ -263,10 +265,122 @@ class AadhaarCard:
         Returns:
             dict: Dictionary containing text bounding box data.
         """
-        config = '-l eng --oem 3 --psm ' + str(psm)
-        t = pytesseract.image_to_data(
-            img, lang='eng', output_type=Output.DICT, config=config)
-        return t
+        metrics.incr('tesseract_calls')
+        with metrics.span('ocr'):
+            return get_backend(self.config).image_to_data(img, psm)
+
+    def ocr_data(self, img, psm):
+        """Return the word table of an image, running Tesseract once per image state.
+
+        Results are cached on the image buffer and psm, so extraction and
+        masking of the same unchanged image share one layout pass.
+
+        Args:
+            img (numpy.ndarray): Input image.
+            psm (int): Tesseract PSM mode.
+
+        Returns:
+            dict: Dictionary containing text bounding box data.
+        """
+        img = np.ascontiguousarray(img)
+        key = (hashlib.blake2b(img, digest_size=16).digest(),
+               img.shape, img.dtype.str, psm)
+        cache = self._ocr_cache
+        if key in cache:
+            cache.move_to_end(key)
+            metrics.incr('ocr_cache_hits')
+            return cache[key]
+        d = self.box_extractor(img, psm)
+        cache[key] = d
+        while len(cache) > self.config.get('ocr_cache_size', 16):
+            cache.popitem(last=False)
+        return d
+
+    def table_tokens(self, d):
+        """Split a word table into its words and their line keys.
+
+        Args:
+            d (dict): Word table from ``ocr_data``.
+
+        Returns:
+            tuple: (list of words, list of (block, paragraph, line) keys)
+        """
+        tokens = [str(text).strip() for text in d['text']]
+        lines = list(zip(d['block_num'], d['par_num'], d['line_num']))
+        return tokens, lines
+
+    def table_to_text(self, d):
+        """Rebuild the page text from a word table, one OCR line per text line.
+
+        Args:
+            d (dict): Word table from ``ocr_data``.
+
+        Returns:
+            str: Extracted text.
+        """
+        lines = OrderedDict()
+        for i in range(len(d['level'])):
+            word = str(d['text'][i]).strip()
+            if word:
+                key = (d['block_num'][i], d['par_num'][i], d['line_num'][i])
+                lines.setdefault(key, []).append(word)
+        return '\n'.join(' '.join(words) for words in lines.values())
+
+    @metrics.timed('read_region')
+    def read_region(self, crop):
+        """Read the Aadhaar numbers of a small detected number region.
+
+        The crop is upscaled to ``config['roi_height']`` pixels, binarized
+        and read as a single text line, which costs a fraction of a page
+        pass since OCR time grows with the pixel area.
+
+        Args:
+            crop (numpy.ndarray): Upright BGR crop around one number.
+
+        Returns:
+            list: Checksum valid Aadhaar numbers found in the crop.
+        """
+        gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        scale = self.config.get('roi_height', 96) / gray.shape[0]
+        if scale > 1:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale,
+                              interpolation=cv2.INTER_CUBIC)
+        binary = cv2.threshold(
+            gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+        for psm in self.config.get('roi_psm', [7]):
+            tokens, lines = self.table_tokens(self.ocr_data(binary, psm))
+            uids = [c.digits for c in verhoeff.candidate_uids(tokens, lines)]
+            if uids:
+                return uids
+        return []
+
+    @metrics.timed('detect_orientation')
+    def detect_orientation(self, img):
+        """Estimate how many anticlockwise quarter turns make the card upright.
+
+        Orientation detection runs on a downscaled grayscale copy, which is
+        enough for Tesseract OSD and a fraction of a full OCR pass.
+
+        Args:
+            img (numpy.ndarray): Input image.
+
+        Returns:
+            int | None: Quarter turns (0-3), or None when undecided.
+        """
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        scale = self.config.get('osd_max_side', 1200) / max(gray.shape[:2])
+        if scale < 1:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale,
+                              interpolation=cv2.INTER_AREA)
+        metrics.incr('tesseract_calls')
+        with metrics.span('ocr'):
+            result = get_backend(self.config).detect_orientation(gray)
+        if result is None:
+            return None
+        rotate_cw, conf = result
+        if conf < self.config.get('osd_min_conf', 2.0):
+            return None
+        return ((360 - rotate_cw) // 90) % 4
 
     def find_uid(self, text2):
         """Find possible Aadhaar UIDs from extracted text.
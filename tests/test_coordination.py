@@ -0,0 +1,40 @@
+import os
+import time
+
+from coordination import Coordinator
+
+
+def _nodes(root, limit=2):
+    return (Coordinator(str(root), 'a', ttl=0.2, limit=limit),
+            Coordinator(str(root), 'b', ttl=0.2, limit=limit))
+
+
+def test_expired_lease_is_requeued_and_keeps_its_slot(tmp_path):
+    a, b = _nodes(tmp_path)
+    assert a.claim('k', 'in.png') == 'claimed'
+    assert b.claim('k', 'in.png') == 'leased'
+    time.sleep(0.3)
+    assert b.claim('k', 'in.png') == 'claimed'
+    assert b.held == {'k': a.held['k']}
+
+
+def test_old_owner_leaves_the_taken_over_lease_alone(tmp_path):
+    a, b = _nodes(tmp_path)
+    a.claim('k', 'in.png')
+    time.sleep(0.3)
+    b.claim('k', 'in.png')
+    a.renew()
+    assert 'k' not in a.held
+    a.held['k'] = b.held['k']
+    a.finish('k', 'failed')
+    # b's lease and quota slot survive the late failure of a
+    assert os.path.exists(tmp_path / 'leases' / 'k')
+    assert b.status()['quota_used'] == 1
+
+
+def test_ledger_counts_are_part_of_the_global_quota(tmp_path):
+    a, b = _nodes(tmp_path, limit=3)
+    a.seed_from_ledger(2, host='h1')
+    a.seed_from_ledger(2, host='h1')  # Idempotent
+    assert a.claim('k1', 'in1.png') == 'claimed'
+    assert b.claim('k2', 'in2.png') == 'quota'
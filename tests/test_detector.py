@@ -0,0 +1,24 @@
+import os
+
+import cv2
+import pytest
+
+import detector
+
+CARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    'Aadhars_input', 'Allen.png')
+
+
+@pytest.mark.parametrize('int8', [False, True])
+def test_onnx_boxes_match_torch(int8):
+    pytest.importorskip('onnxruntime')
+    pytest.importorskip('ultralytics')
+    if not os.path.exists(detector.exported_path('onnx', int8)):
+        pytest.skip("no ONNX export, run: python detector.py export --format onnx")
+    img = cv2.imread(CARD)
+    assert img is not None
+
+    reference = detector.TorchDetector().predict([img])[0]
+    candidate = detector.create_detector('onnx', int8).predict([img])[0]
+    assert (reference.confidence >= 0.4).any()
+    assert detector.compare(reference, candidate) == []
@@ -0,0 +1,76 @@
+import multiprocessing
+import sqlite3
+import subprocess
+import sys
+
+import registry
+
+# Above the legacy count a checkout may carry in aadhaar_config.json
+LIMIT = 10 ** 6
+
+
+def _claimer(ledger, start, hold, results):
+    start.wait()
+    results.put(registry.claim('in.png', 'out.png', 'stat:1:1', LIMIT, path=ledger))
+    # Stay alive until both claims are made, a dead claimer's row is stale
+    hold.wait()
+
+
+def test_concurrent_claimers_process_a_file_once(tmp_path):
+    ledger = str(tmp_path / 'ledger.db')
+    registry.connect(ledger)  # Create the schema before the race
+    ctx = multiprocessing.get_context('spawn')
+    start, hold, results = ctx.Barrier(2), ctx.Barrier(3), ctx.Queue()
+    claimers = [ctx.Process(target=_claimer, args=(ledger, start, hold, results))
+                for _ in range(2)]
+    for p in claimers:
+        p.start()
+    outcomes = sorted(results.get(timeout=60) for _ in claimers)
+    hold.wait()
+    for p in claimers:
+        p.join()
+    assert outcomes == ['claimed', 'leased']
+
+
+def test_running_row_of_a_dead_process_is_taken_over(tmp_path):
+    ledger = str(tmp_path / 'ledger.db')
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    assert registry.claim('in.png', 'out.png', 'stat:1:1', LIMIT, path=ledger) == 'claimed'
+    registry.connect(ledger).execute("UPDATE files SET pid = ?", (dead.pid,))
+    assert registry.claim('in.png', 'out.png', 'stat:1:1', LIMIT, path=ledger) == 'claimed'
+    assert registry.get_processed_count(ledger) == 1 + registry._legacy_count()
+
+
+def test_running_row_of_a_live_process_is_leased(tmp_path):
+    ledger = str(tmp_path / 'ledger.db')
+    assert registry.claim('in.png', 'out.png', 'stat:1:1', LIMIT, path=ledger) == 'claimed'
+    # Same live pid, e.g. another thread of this worker
+    assert registry.claim('in.png', 'out.png', 'stat:1:1', LIMIT, path=ledger) == 'leased'
+
+
+def test_coordinated_rows_can_be_left_out_of_the_count(tmp_path):
+    ledger = str(tmp_path / 'ledger.db')
+    registry.claim('in.png', 'out.png', 'stat:1:1', LIMIT, path=ledger)
+    registry.claim('coord:abc', 'out2.png', 'abc', LIMIT, path=ledger)
+    base = registry._legacy_count()
+    assert registry.get_processed_count(ledger) == base + 2
+    assert registry.get_processed_count(ledger, exclude_prefix='coord:') == base + 1
+
+
+def test_finished_upload_rows_are_done(tmp_path):
+    ledger = str(tmp_path / 'ledger.db')
+    assert registry.claim('http:abc', '', 'abc', LIMIT, path=ledger) == 'claimed'
+    registry.finish('http:abc', '', 'masked', 0.1, path=ledger)
+    assert registry.claim('http:abc', '', 'abc', LIMIT, path=ledger) == 'done'
+
+
+def test_content_hash_column_of_old_ledgers_is_renamed(tmp_path):
+    ledger = str(tmp_path / 'ledger.db')
+    old = sqlite3.connect(ledger)
+    old.executescript(registry.SCHEMA.replace('content_key', 'content_hash'))
+    old.execute("INSERT INTO files (path, output_path, content_hash, status) "
+                "VALUES ('in.png', 'out.png', 'stat:1:1', 'unprocessed')")
+    old.commit()
+    old.close()
+    assert registry.claim('in.png', 'out.png', 'stat:1:1', LIMIT, path=ledger) == 'done'
@@ -0,0 +1,21 @@
+import os
+
+from result_cache import ResultCache
+
+
+def test_runtime_settings_do_not_change_the_key(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    ignore = ('pdf_page_workers', 'cache_dir')
+    key = cache.key(b'card', {'psm': [6], 'pdf_page_workers': 4}, '.png', ignore)
+    assert key == cache.key(b'card', {'psm': [6], 'pdf_page_workers': 1,
+                                      'cache_dir': 'elsewhere'}, '.png', ignore)
+    assert key != cache.key(b'card', {'psm': [4], 'pdf_page_workers': 4}, '.png', ignore)
+
+
+def test_evicted_artifact_reads_as_missing(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    output = tmp_path / 'out.pdf'
+    output.write_bytes(b'%PDF')
+    cache.put('k', 'masked', artifact=str(output))
+    os.remove(cache.get('k')['artifact'])
+    assert cache.get('k')['artifact'] is None
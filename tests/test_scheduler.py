@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scheduler import bounded_map
+
+
+def _task(n):
+    if n == 2:
+        raise ValueError("bad file")
+    return n
+
+
+@pytest.mark.parametrize('ordered', [False, True])
+def test_failed_tasks_are_reported_and_the_rest_still_run(ordered):
+    with ThreadPoolExecutor(2) as executor:
+        results = list(bounded_map(executor, _task, [(n,) for n in range(5)], 2, ordered,
+                                   lambda args, e: ('failed', args[0], str(e))))
+    assert sorted(map(str, results)) == sorted(
+        map(str, [0, 1, ('failed', 2, 'bad file'), 3, 4]))
+
+
+def test_refused_submissions_are_reported():
+    executor = ThreadPoolExecutor(1)
+    executor.shutdown()
+    results = list(bounded_map(executor, _task, [(n,) for n in range(3)], 2,
+                               on_error=lambda args, e: ('failed', args[0])))
+    assert results == [('failed', 0), ('failed', 1), ('failed', 2)]
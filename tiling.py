@@ -0,0 +1,152 @@
+"""This module contains the tiled processing of very large scans.
+
+Images above a pixel threshold are searched as overlapping tiles instead of
+as one page, so rotations, contrast variants, Tesseract and the detector
+only ever hold one tile's worth of pixels per thread. The tile overlap must
+be wider than an Aadhaar number so every number lies whole in at least one
+tile; boxes found twice across a seam are merged afterwards.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import metrics
+
+# Working copies of a tile alive during its search: the rotated and
+# deskewed frames, grayscale, both contrast variants and Tesseract's own.
+TILE_COPIES = 12
+
+
+def tile_starts(length, tile, step):
+    """Start offsets covering ``length`` pixels, the last tile ends flush."""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def tile_grid(height, width, tile, overlap):
+    """Overlapping tiles covering an image.
+
+    Args:
+        height (int): Image height.
+        width (int): Image width.
+        tile (int): Tile side in pixels.
+        overlap (int): Overlap of neighbouring tiles in pixels.
+
+    Returns:
+        list: (x, y, w, h) tiles.
+    """
+    step = max(1, tile - overlap)
+    return [(x, y, min(tile, width), min(tile, height))
+            for y in tile_starts(height, tile, step)
+            for x in tile_starts(width, tile, step)]
+
+
+def plan_tiles(shape, tile, overlap, workers, memory_mb):
+    """Fit the tile size and the parallel tiles into a memory budget.
+
+    Args:
+        shape (tuple): Image shape.
+        tile (int): Requested tile side.
+        overlap (int): Requested overlap.
+        workers (int): Maximum tiles searched in parallel.
+        memory_mb (int): Budget for the tile working sets of one worker.
+
+    Returns:
+        tuple: (tile side, overlap, parallel tiles)
+    """
+    channels = shape[2] if len(shape) > 2 else 1
+    budget = memory_mb * 1024 * 1024
+    per_pixel = channels * TILE_COPIES
+    # Shrink the tiles if even one does not fit, keep the overlap ratio
+    largest = int(math.sqrt(budget / per_pixel))
+    if largest < tile:
+        overlap = int(overlap * largest / tile)
+        tile = largest
+    workers = max(1, min(workers, budget // (tile * tile * per_pixel)))
+    return tile, overlap, int(workers)
+
+
+def merge_polygons(polygons, min_overlap=0.5):
+    """Merge the boxes found twice across tile seams.
+
+    Polygons whose bounding rectangles overlap by at least ``min_overlap``
+    of the smaller one are replaced by the union rectangle.
+
+    Args:
+        polygons (list): int32 point arrays in image coordinates.
+        min_overlap (float): Overlap ratio treated as the same region.
+
+    Returns:
+        list: Deduplicated polygons.
+    """
+    rects = [list(cv2.boundingRect(p)) for p in polygons]
+    polygons = list(polygons)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                x1, y1, w1, h1 = rects[i]
+                x2, y2, w2, h2 = rects[j]
+                iw = min(x1 + w1, x2 + w2) - max(x1, x2)
+                ih = min(y1 + h1, y2 + h2) - max(y1, y2)
+                if iw <= 0 or ih <= 0:
+                    continue
+                if iw * ih < min_overlap * min(w1 * h1, w2 * h2):
+                    continue
+                x, y = min(x1, x2), min(y1, y2)
+                w, h = max(x1 + w1, x2 + w2) - x, max(y1 + h1, y2 + h2) - y
+                rects[i] = [x, y, w, h]
+                polygons[i] = np.array([[x, y], [x + w, y], [x + w, y + h],
+                                        [x, y + h]], dtype=np.int32)
+                del rects[j], polygons[j]
+                merged = True
+                break
+            if merged:
+                break
+    return polygons
+
+
+def tiled_polygons(img, find, tile=2048, overlap=512, workers=1, memory_mb=512):
+    """Search an image tile by tile.
+
+    Args:
+        img (numpy.ndarray): Decoded image.
+        find (callable): Search of one image, returning (polygons in its
+            coordinates, detected flag). Tiles are passed as views.
+        tile (int): Tile side in pixels.
+        overlap (int): Overlap of neighbouring tiles, wider than a number.
+        workers (int): Maximum tiles searched in parallel.
+        memory_mb (int): Budget for the tile working sets.
+
+    Returns:
+        tuple: (merged polygons in image coordinates, True if an Aadhaar
+        number was detected on any tile)
+    """
+    tile, overlap, workers = plan_tiles(img.shape, tile, overlap, workers, memory_mb)
+    tiles = tile_grid(img.shape[0], img.shape[1], tile, overlap)
+    metrics.incr('tiled_images')
+    metrics.incr('tiles', len(tiles))
+
+    def search(box):
+        x, y, w, h = box
+        view = img[y:y + h, x:x + w]
+        # Blank paper has nothing to read
+        if float(view[::8, ::8].std()) < 2.0:
+            return [], False
+        polygons, detected = find(view)
+        return [p + np.array([x, y], dtype=np.int32) for p in polygons], detected
+
+    polygons = []
+    detected = False
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for tile_polygons, tile_detected in pool.map(search, tiles):
+            polygons.extend(tile_polygons)
+            detected = detected or tile_detected
+    return merge_polygons(polygons), detected
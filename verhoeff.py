@@ -0,0 +1,128 @@
+"""This module contains a vectorized Verhoeff checksum and the Aadhaar UID
+candidate engine working on OCR word tokens."""
+
+import re
+from collections import namedtuple
+import numpy as np
+
+# Verhoeff multiplication (dihedral group D5) table
+MULT = np.array([
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    [1, 2, 3, 4, 0, 6, 7, 8, 9, 5],
+    [2, 3, 4, 0, 1, 7, 8, 9, 5, 6],
+    [3, 4, 0, 1, 2, 8, 9, 5, 6, 7],
+    [4, 0, 1, 2, 3, 9, 5, 6, 7, 8],
+    [5, 9, 8, 7, 6, 0, 4, 3, 2, 1],
+    [6, 5, 9, 8, 7, 1, 0, 4, 3, 2],
+    [7, 6, 5, 9, 8, 2, 1, 0, 4, 3],
+    [8, 7, 6, 5, 9, 3, 2, 1, 0, 4],
+    [9, 8, 7, 6, 5, 4, 3, 2, 1, 0]], dtype=np.intp)
+
+# Verhoeff permutation table
+PERM = np.array([
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    [1, 5, 7, 6, 2, 8, 3, 0, 9, 4],
+    [5, 8, 0, 3, 7, 9, 6, 1, 4, 2],
+    [8, 9, 1, 6, 0, 4, 3, 5, 2, 7],
+    [9, 4, 5, 3, 1, 2, 6, 8, 7, 0],
+    [4, 2, 8, 6, 5, 7, 3, 9, 0, 1],
+    [2, 7, 9, 3, 8, 0, 6, 4, 1, 5],
+    [7, 0, 4, 6, 9, 1, 3, 2, 5, 8]], dtype=np.intp)
+
+UID_LENGTH = 12
+
+# A digit window over OCR tokens, covering tokens[start:end]
+DigitWindow = namedtuple('DigitWindow', ['digits', 'start', 'end'])
+
+
+def checksum_valid(digits):
+    """Validate many digit strings of the same length at once.
+
+    Args:
+        digits (numpy.ndarray): Integer array of shape (N, length).
+
+    Returns:
+        numpy.ndarray: Boolean array of shape (N,), True where the Verhoeff
+        checksum holds.
+    """
+    digits = np.asarray(digits, dtype=np.intp)
+    if digits.ndim != 2 or digits.shape[0] == 0:
+        return np.zeros(len(digits), dtype=bool)
+    count, length = digits.shape
+    perm = PERM[np.arange(length) % 8]
+    check = np.zeros(count, dtype=np.intp)
+    for i in range(length):
+        check = MULT[check, perm[i, digits[:, length - 1 - i]]]
+    return check == 0
+
+
+def is_valid(number):
+    """Validate a single number with the Verhoeff checksum.
+
+    Args:
+        number (str): Number as a string of digits.
+
+    Returns:
+        bool: True if the checksum holds.
+    """
+    if not number or not number.isdigit():
+        return False
+    return bool(checksum_valid([[int(c) for c in number]])[0])
+
+
+def digit_windows(tokens, lines=None, length=UID_LENGTH):
+    """Generate every run of adjacent numeric tokens holding exactly ``length`` digits.
+
+    Runs are broken by non numeric tokens and line changes, and windows
+    start and end on token boundaries, so a UID printed as 4-4-4, 8-4 or as
+    a single 12 digit word is found whichever way OCR split it.
+
+    Args:
+        tokens (list): OCR words.
+        lines (list, optional): Line key of each token.
+        length (int): Number of digits in a window.
+
+    Returns:
+        list: DigitWindow tuples.
+    """
+    digits = []
+    for token in tokens:
+        token = re.sub(r'^\W+|\W+$', '', str(token))
+        digits.append(token if token.isdigit() else None)
+
+    windows = []
+    for start in range(len(digits)):
+        number = ''
+        for end in range(start, len(digits)):
+            if digits[end] is None:
+                break
+            if end > start and lines is not None and lines[end] != lines[start]:
+                break
+            number += digits[end]
+            if len(number) >= length:
+                if len(number) == length:
+                    windows.append(DigitWindow(number, start, end + 1))
+                break
+    return windows
+
+
+def candidate_uids(tokens, lines=None):
+    """Find the checksum valid Aadhaar numbers in a list of OCR words.
+
+    All plausible 12 digit windows are validated in a single vectorized
+    Verhoeff pass. Aadhaar numbers never start with 0 or 1.
+
+    Args:
+        tokens (list): OCR words.
+        lines (list, optional): Line key of each token.
+
+    Returns:
+        list: DigitWindow tuples of the valid UIDs with their token spans.
+    """
+    windows = [w for w in digit_windows(tokens, lines) if w.digits[0] not in '01']
+    if not windows:
+        return []
+    table = np.frombuffer(
+        ''.join(w.digits for w in windows).encode(), dtype=np.uint8) - ord('0')
+    valid = checksum_valid(table.reshape(len(windows), UID_LENGTH))
+    return [w for w, ok in zip(windows, valid) if ok]
@@ -1,10 +1,6 @@
 import os
-from ultralytics import YOLO
-from huggingface_hub import hf_hub_download
-from supervision import Detections
-import cv2
-import numpy as np
-from PIL import Image
+import sys
+import threading
 
 # Repo configuration
 REPO_CONFIG = dict(
@@ -13,56 +9,150 @@ REPO_CONFIG = dict(
     local_dir="./models"
 )
 
-# Load YOLO model
-MODEL = YOLO(hf_hub_download(**REPO_CONFIG))
-ID2LABEL = MODEL.names
+# YOLO model, loaded on first use
+MODEL = None
 
+# Detector backend running the model (see detector), created on first use
+DETECTOR = None
 
-def mask_aadhar_number(image_path, detections):
+# Serializes the in-process detector: neither ultralytics nor the exported
+# runtimes support concurrent predict calls on one model, and the page and
+# tile threads of a worker share it
+_DETECT_LOCK = threading.RLock()
+
+# Client of a shared model server, set in pool workers (see yolo_server)
+SERVER_CLIENT = None
+
+
+def model_path():
+    """
+    Finds the model weights without a hub round trip when possible.
+
+    The lookup order is the ``YOLO_MODEL_PATH`` environment variable, the
+    ``models`` folder next to this module (or inside the frozen bundle), the
+    ``models`` folder in the working directory, the local hub cache, and
+    only then a download from the hub.
+
+    Returns:
+        str: Path to ``model.pt``.
+    """
+    env_path = os.getenv("YOLO_MODEL_PATH")
+    if env_path and os.path.isfile(env_path):
+        return env_path
+
+    base_dir = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    for folder in (base_dir, os.getcwd()):
+        local_path = os.path.join(folder, "models", REPO_CONFIG["filename"])
+        if os.path.isfile(local_path):
+            return local_path
+
+    from huggingface_hub import hf_hub_download
+    try:
+        return hf_hub_download(**REPO_CONFIG, local_files_only=True)
+    except Exception:
+        return hf_hub_download(**REPO_CONFIG)
+
+
+def get_model():
+    """
+    Returns the YOLO model, loading it on first use.
+
+    Returns:
+        YOLO: The Aadhaar detection model.
     """
-    Masks detected AADHAR numbers in the image by filling them with black rectangles.
+    global MODEL
+    if MODEL is None:
+        from ultralytics import YOLO
+        MODEL = YOLO(model_path())
+    return MODEL
+
+
+def configure_detector(backend='auto', int8=False):
+    """
+    Selects and loads the detector backend of this process.
 
     Args:
-        image_path (str): Path to the input image file.
-        detections (Detections): Detection results from the YOLO model.
+        backend (str): 'torch', 'onnx', 'openvino' or 'auto', see
+            ``detector.create_detector``.
+        int8 (bool): Use the INT8 export of the model.
 
     Returns:
-        PIL.Image: Image with AADHAR numbers masked.
+        The detector backend.
     """
-    # Load the image
-    img = Image.open(image_path)
-    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    global DETECTOR
+    from detector import create_detector
+    with _DETECT_LOCK:
+        DETECTOR = create_detector(backend, int8)
+    return DETECTOR
 
-    # Mask each detected AADHAR_NUMBER
-    for box, class_id in zip(detections.xyxy, detections.class_id):
-        if ID2LABEL[class_id] == 'AADHAR_NUMBER':  # Filter for AADHAR_NUMBER
-            x1, y1, x2, y2 = map(int, box)
-            cv2.rectangle(img_cv, (x1, y1), (x2, y2), (0, 0, 0), thickness=-1)  # Black out
 
-    # Convert back to PIL Image for saving
-    masked_img = Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
-    return masked_img
+def get_detector():
+    """
+    Returns the detector backend, picking one automatically on first use.
+
+    Returns:
+        The detector backend.
+    """
+    with _DETECT_LOCK:
+        if DETECTOR is None:
+            return configure_detector()
+        return DETECTOR
 
 
-def process_image(file_path):
+def use_server(client):
     """
-    Processes the input image to mask AADHAR numbers.
+    Routes detection requests of this process to a shared model server.
 
     Args:
-        file_path (str): Path to the input image file.
-        output_path (str): Path to save the masked image.
+        client (yolo_server.YoloClient): Connected server client, or None to
+            run the model in-process again.
+    """
+    global SERVER_CLIENT
+    SERVER_CLIENT = client
+
+
+def detect(img):
     """
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError(f"The specified file does not exist: {file_path}")
+    Runs the detector on one image.
+
+    The in-process detector runs one image at a time, concurrent threads
+    (PDF pages, tiles, thread mode) wait for each other; the shared model
+    server batches them instead. When the server does not answer in time
+    the ``TimeoutError`` fails the file, unless the client allows a
+    fallback to a model loaded in this process.
 
-    # Perform Inference
-    detections = Detections.from_ultralytics(MODEL.predict(file_path)[0])
+    Args:
+        img (numpy.ndarray): Decoded BGR image.
 
+    Returns:
+        Detections: Detection results from the YOLO model.
+    """
+    if SERVER_CLIENT is not None:
+        try:
+            return SERVER_CLIENT.predict(img)
+        except TimeoutError as e:
+            if not SERVER_CLIENT.fallback:
+                raise
+            print(f"{e}, detecting in-process")
+    with _DETECT_LOCK:
+        return get_detector().predict([img])[0]
+
+
+def number_detections(detections):
+    """
+    Returns the boxes and confidences of the AADHAR_NUMBER detections.
+
+    Args:
+        detections (Detections): Detection results from the YOLO model.
+
+    Returns:
+        list: ((x1, y1, x2, y2) integer box, confidence) tuples.
+    """
+    class_names = detections.data.get('class_name', [])
+    confidences = detections.confidence
+    if confidences is None:
+        confidences = [1.0] * len(detections.xyxy)
+    return [(tuple(map(int, box)), float(conf))
+            for box, conf, class_name in zip(detections.xyxy, confidences, class_names)
+            if class_name == 'AADHAR_NUMBER']
 
-    detected_classes = detections.data.get('class_name', [])
-     # Mask AADHAR numbers and save the image
-    masked_img = mask_aadhar_number(file_path, detections)
-    masked_img.save(file_path)
-    
-    # Check if "AADHAR_NUMBER" is in detected classes
-    return "AADHAR_NUMBER" not in detected_classes
@@ -0,0 +1,225 @@
+"""This module contains a YOLO model server shared by the pipeline workers.
+
+One server process owns the only model instance. Workers put images on a
+shared request queue and the server runs ``predict`` on micro-batches that
+are flushed when they are full or when the oldest request has waited
+``max_wait`` seconds. Each request is answered with its ``Detections`` on the
+reply queue of the thread that sent it.
+
+Clients downscale the images to the network input size before sending
+them, so a page scan is not pickled through the manager at full resolution.
+They wait for the server to signal that its model is loaded, then give up
+on a reply after ``timeout`` seconds instead of hanging when the server is
+stuck or gone: the file fails, or with ``fallback`` is detected by a model
+loaded in the worker, at the cost of one model copy per worker.
+"""
+
+import time
+import queue
+import uuid
+import threading
+import multiprocessing
+from multiprocessing.managers import SyncManager
+
+import cv2
+
+# Side of the network input, larger images are downscaled by the clients
+INPUT_SIZE = 640
+
+# Seconds a client waits for the server to load its model
+STARTUP_TIMEOUT = 600.0
+
+
+def _serve(requests, ready, max_batch, max_wait, threads=None, backend='auto',
+           int8=False):
+    """Server loop, runs in the model server process."""
+    from executor_plan import limit_threads
+    limit_threads(torch_threads=threads)
+    from yolo_model import configure_detector
+
+    try:
+        detector, error = configure_detector(backend, int8), None
+    except Exception as e:
+        # Answered to every request, the clients must not wait for a model
+        detector, error = None, e
+    ready.set()
+    running = True
+    while running:
+        item = requests.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+
+        try:
+            if error is not None:
+                raise error
+            answers = detector.predict([img for _, img, _ in batch])
+        except Exception as e:
+            answers = [e] * len(batch)
+        for (request_id, _, reply), answer in zip(batch, answers):
+            reply.put((request_id, answer))
+
+
+class YoloServer:
+    """Owns the model server process and the queues connecting it to workers."""
+
+    def __init__(self, max_batch=16, max_wait=0.02, threads=None, backend='auto',
+                 int8=False, timeout=60.0, fallback=False):
+        """Initialize the server.
+
+        Args:
+            max_batch (int): Largest micro-batch handed to ``predict``.
+            max_wait (float): Seconds the first request of a batch may wait
+                for more requests before the batch is run.
+            threads (int, optional): torch threads of the server process,
+                e.g. ``ExecutionPlan.server_threads``.
+            backend (str): Detector backend, see ``detector.create_detector``.
+            int8 (bool): Use the INT8 export of the model.
+            timeout (float): Seconds a client waits for a reply once the
+                model is loaded.
+            fallback (bool): Let the clients load their own model when the
+                server does not answer in time, instead of failing the file.
+        """
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.threads = threads
+        self.backend = backend
+        self.int8 = int8
+        self.timeout = timeout
+        self.fallback = fallback
+        self.requests = None
+        self.ready = None
+        self._manager = None
+        self._process = None
+
+    def start(self):
+        """Start the queue manager and the model server process."""
+        self._manager = SyncManager()
+        self._manager.start()
+        self.requests = self._manager.Queue()
+        self.ready = self._manager.Event()
+        self._process = multiprocessing.Process(
+            target=_serve,
+            args=(self.requests, self.ready, self.max_batch, self.max_wait, self.threads,
+                  self.backend, self.int8),
+            daemon=True)
+        self._process.start()
+        return self
+
+    def client_args(self):
+        """Arguments for ``connect_worker``, e.g. as pool ``initargs``."""
+        return (self._manager.address, self.requests, self.ready, self.timeout,
+                self.fallback)
+
+    def stop(self):
+        """Stop the model server process and the queue manager."""
+        if self._process is not None:
+            self.requests.put(None)
+            self._process.join()
+            self._process = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class YoloClient:
+    """Sends images to a ``YoloServer`` and waits for their detections."""
+
+    def __init__(self, address, requests, ready, timeout=60.0, fallback=False):
+        """Connect to a running server.
+
+        Args:
+            address (tuple): Address of the server's queue manager.
+            requests (queue proxy): The server's request queue.
+            ready (event proxy): Set by the server once its model is loaded.
+            timeout (float): Seconds to wait for a reply.
+            fallback (bool): Whether ``yolo_model.detect`` may load a local
+                model when a reply times out.
+        """
+        self.requests = requests
+        self.ready = ready
+        self.timeout = timeout
+        self.fallback = fallback
+        self._manager = SyncManager(
+            address=address,
+            authkey=bytes(multiprocessing.current_process().authkey))
+        self._manager.connect()
+        self._local = threading.local()
+
+    def predict(self, img):
+        """Run the detector on one image through the server.
+
+        Args:
+            img (numpy.ndarray): Decoded BGR image.
+
+        Returns:
+            Detections: Detection results from the YOLO model, in the
+            coordinates of ``img``.
+
+        Raises:
+            TimeoutError: The server did not load its model within
+                ``STARTUP_TIMEOUT`` or did not reply within ``timeout``
+                seconds.
+        """
+        # The model load of the server does not count against the timeout
+        if not self.ready.wait(STARTUP_TIMEOUT):
+            raise TimeoutError(f"YOLO server not ready after {STARTUP_TIMEOUT}s")
+        replies = getattr(self._local, 'replies', None)
+        if replies is None:
+            replies = self._local.replies = self._manager.Queue()
+        # The model letterboxes to INPUT_SIZE anyway, only send those pixels
+        scale = min(1.0, INPUT_SIZE / max(img.shape[:2]))
+        if scale < 1.0:
+            img = cv2.resize(img, (max(1, round(img.shape[1] * scale)),
+                                   max(1, round(img.shape[0] * scale))),
+                             interpolation=cv2.INTER_AREA)
+        request_id = uuid.uuid4().hex
+        self.requests.put((request_id, img, replies))
+        deadline = time.monotonic() + self.timeout
+        while True:
+            # Late replies of timed out requests are discarded here
+            try:
+                reply_id, answer = replies.get(
+                    timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TimeoutError(f"No reply from the YOLO server in {self.timeout}s")
+            if reply_id == request_id:
+                break
+        if isinstance(answer, Exception):
+            raise answer
+        if scale < 1.0 and len(answer):
+            answer.xyxy = answer.xyxy / scale
+        return answer
+
+
+def connect_worker(address, requests, ready, timeout=60.0, fallback=False):
+    """Pool initializer routing a worker's detections to the server.
+
+    Args:
+        address (tuple): Address of the server's queue manager.
+        requests (queue proxy): The server's request queue.
+        ready (event proxy): Set by the server once its model is loaded.
+        timeout (float): Seconds to wait for a reply.
+        fallback (bool): Load a local model when a reply times out.
+    """
+    from yolo_model import use_server
+    use_server(YoloClient(address, requests, ready, timeout, fallback))